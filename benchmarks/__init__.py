@@ -0,0 +1,3 @@
+"""
+Offline benchmarks for the falksgeo hot paths, see benchmarks/run.py
+"""
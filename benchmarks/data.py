@@ -0,0 +1,140 @@
+# pylint:disable=E0401
+"""
+Synthetic layers and raster tiles for benchmarking
+"""
+import os
+import numpy as np
+import geopandas
+import pyogrio
+import rasterio
+import shapely
+from affine import Affine
+
+# features per layer
+SIZES = {'tiny': 1000, 'small': 10000, 'large': 1000000}
+# additional float attributes per feature
+WIDTHS = {'narrow': 2, 'wide': 50}
+# raster tiles per axis and pixels per tile side
+TILES = {'tiny': (2, 256), 'small': (2, 1024), 'large': (4, 2048)}
+# roughly California in lon/lat
+EXTENT = (-124.0, 32.0, -114.0, 42.0)
+FTYPES = np.array(['StreamRiver', 'ArtificialPath', 'Pipeline', 'Coastline'])
+
+
+class Dataset:
+    """
+    Paths and sizes of the generated data, created on first use and
+    reused afterwards
+    """
+
+    def __init__(self, directory, size='small', width='narrow'):
+        self.directory = os.path.join(directory, '{}-{}'.format(size, width))
+        self.count = SIZES[size]
+        self.attributes = WIDTHS[width]
+        self.tiles, self.tile_size = TILES[size]
+        self.polygons = os.path.join(self.directory, 'polygons.shp')
+        self.annotation = os.path.join(self.directory, 'annotation.shp')
+        self.area = os.path.join(self.directory, 'area.shp')
+        self.blob = os.path.join(self.directory, 'blob.bin')
+        self.rasters = [
+            os.path.join(self.directory, 'tile_{}_{}.tif'.format(col, row))
+            for col in range(self.tiles) for row in range(self.tiles)]
+
+    def ensure(self):
+        """
+        Generate missing files
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        if not os.path.isfile(self.polygons):
+            write_polygons(self.polygons, self.count, self.attributes)
+        if not os.path.isfile(self.annotation):
+            write_annotation(self.annotation, self.count)
+        if not os.path.isfile(self.area):
+            write_area(self.area)
+        if not os.path.isfile(self.blob):
+            write_blob(self.blob, self.count * 1000)
+        if not all(os.path.isfile(item) for item in self.rasters):
+            write_tiles(self.directory, self.tiles, self.tile_size)
+        return self
+
+
+def _random(count, seed=0):
+    return np.random.default_rng(seed).random(count)
+
+
+def write_polygons(filename, count, attributes):
+    """
+    Small squares scattered over the extent with a NHD like schema
+    """
+    xs = EXTENT[0] + _random(count, 1) * (EXTENT[2] - EXTENT[0])
+    ys = EXTENT[1] + _random(count, 2) * (EXTENT[3] - EXTENT[1])
+    data = {
+        'comid': np.arange(count, dtype='int32'),
+        'ftype': FTYPES[np.arange(count) % len(FTYPES)]}
+    for ind in range(attributes):
+        data['attr_{}'.format(ind)] = _random(count, ind + 3)
+    df = geopandas.GeoDataFrame(
+        data, geometry=shapely.box(xs, ys, xs + 0.01, ys + 0.01),
+        crs='epsg:4326')
+    pyogrio.write_dataframe(df, filename)
+
+
+def write_annotation(filename, count):
+    """
+    Attributes for every other comid
+    """
+    comids = np.arange(0, count, 2, dtype='int32')
+    df = geopandas.GeoDataFrame(
+        {'comid': comids, 'value': _random(len(comids), 4)},
+        geometry=shapely.points(np.zeros(len(comids)), np.zeros(len(comids))),
+        crs='epsg:4326')
+    pyogrio.write_dataframe(df, filename)
+
+
+def write_area(filename):
+    """
+    A single polygon covering the western half of the extent
+    """
+    middle = (EXTENT[0] + EXTENT[2]) / 2
+    df = geopandas.GeoDataFrame(
+        {'name': ['area']},
+        geometry=[shapely.box(EXTENT[0], EXTENT[1], middle, EXTENT[3])],
+        crs='epsg:4326')
+    pyogrio.write_dataframe(df, filename)
+
+
+def write_blob(filename, size):
+    """
+    Random bytes for hashing
+    """
+    rng = np.random.default_rng(5)
+    with open(filename, 'wb') as handle:
+        remaining = size
+        while remaining > 0:
+            chunk = min(remaining, 2 ** 24)
+            handle.write(rng.bytes(chunk))
+            remaining -= chunk
+
+
+def write_tiles(directory, tiles, size):
+    """
+    Adjacent int16 tiles over the extent, like Earth Engine downloads
+    """
+    step = (EXTENT[2] - EXTENT[0]) / tiles
+    rng = np.random.default_rng(6)
+    for col in range(tiles):
+        for row in range(tiles):
+            transform = (
+                Affine.translation(
+                    EXTENT[0] + col * step, EXTENT[3] - row * step) *
+                Affine.scale(step / size, -step / size))
+            filename = os.path.join(
+                directory, 'tile_{}_{}.tif'.format(col, row))
+            profile = {
+                'driver': 'GTiff', 'dtype': 'int16', 'count': 1,
+                'width': size, 'height': size, 'crs': 'epsg:4326',
+                'transform': transform, 'tiled': True,
+                'blockxsize': 256, 'blockysize': 256, 'nodata': -32768}
+            with rasterio.open(filename, 'w', **profile) as dst:
+                dst.write(rng.integers(
+                    -10000, 10000, (1, size, size), dtype='int16'))
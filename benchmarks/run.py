@@ -0,0 +1,186 @@
+# pylint:disable=E0401
+"""
+Run the benchmarks, every benchmark in its own process to measure its
+peak memory:
+
+    python -m benchmarks.run --size small --width wide
+    python -m benchmarks.run --only copy_layer copy_shp --output new.json
+    python -m benchmarks.run --compare old.json
+
+Results are stored as JSON and can be compared against previous runs.
+"""
+import argparse
+import contextlib
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA_DIR = os.path.join(tempfile.gettempdir(), 'falksgeo-benchmarks')
+RESULT_DIR = os.path.join(ROOT, 'benchmarks', 'results')
+
+
+def peak_rss():
+    """
+    Peak resident set size of this process in MB
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / 2 ** 20 if sys.platform == 'darwin' else peak / 2 ** 10
+
+
+def run_single(name, size, width, repeat, data_dir):
+    """
+    Run one benchmark in the current process
+    """
+    # pylint:disable=C0415
+    from benchmarks.data import Dataset
+    from benchmarks.suite import BENCHMARKS
+    data = Dataset(data_dir, size, width).ensure()
+    timings = []
+    for _ in range(repeat):
+        out = tempfile.mkdtemp(prefix='falksgeo-bench-')
+        try:
+            # the library reports progress on stdout
+            with contextlib.redirect_stdout(open(os.devnull, 'w')):
+                start = time.perf_counter()
+                count, unit = BENCHMARKS[name](data, out)
+                timings.append(time.perf_counter() - start)
+        finally:
+            shutil.rmtree(out)
+    best = min(timings)
+    return {
+        'seconds': best,
+        'median': sorted(timings)[len(timings) // 2],
+        'count': count,
+        'unit': unit,
+        'throughput': count / best if best else None,
+        'peak_rss_mb': peak_rss()}
+
+
+def run_child(name, args):
+    """
+    Run one benchmark in a subprocess and collect its result
+    """
+    cmd = [
+        sys.executable, '-m', 'benchmarks.run', '--child', name,
+        '--size', args.size, '--width', args.width,
+        '--repeat', str(args.repeat), '--data-dir', args.data_dir]
+    res = subprocess.run(
+        cmd, cwd=ROOT, capture_output=True, text=True, check=False)
+    if res.returncode:
+        lines = res.stderr.strip().splitlines()
+        return {'error': lines[-1] if lines else 'failed'}
+    return json.loads(res.stdout.strip().splitlines()[-1])
+
+
+def metadata(args):
+    res = subprocess.run(
+        ['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+        capture_output=True, text=True, check=False)
+    return {
+        'date': datetime.now().isoformat(timespec='seconds'),
+        'commit': res.stdout.strip() or None,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'size': args.size,
+        'width': args.width,
+        'repeat': args.repeat}
+
+
+def compare(old, new, threshold=0.1):
+    """
+    Compare two result sets, return the names of regressed benchmarks
+
+    Args:
+        old(dict): Baseline results
+        new(dict): New results
+        threshold(float): Tolerated relative slow down
+    Returns:
+        list[str]
+    """
+    regressions = []
+    print('\n{:<20}{:>12}{:>12}{:>9}'.format(
+        'benchmark', 'old (s)', 'new (s)', 'ratio'))
+    for name, result in new['results'].items():
+        before = old['results'].get(name, {})
+        if 'seconds' not in result or 'seconds' not in before:
+            continue
+        ratio = result['seconds'] / before['seconds']
+        flag = ''
+        if ratio > 1 + threshold:
+            flag = ' REGRESSION'
+            regressions.append(name)
+        print('{:<20}{:>12.3f}{:>12.3f}{:>9.2f}{}'.format(
+            name, before['seconds'], result['seconds'], ratio, flag))
+    return regressions
+
+
+def report(results):
+    print('{:<20}{:>10}{:>16}{:>12}'.format(
+        'benchmark', 'time (s)', 'throughput', 'peak MB'))
+    for name, result in results.items():
+        if 'error' in result:
+            print('{:<20} failed: {}'.format(name, result['error']))
+            continue
+        print('{:<20}{:>10.3f}{:>12.0f}/s {:<8}{:>8.0f}'.format(
+            name, result['seconds'], result['throughput'],
+            result['unit'][:8], result['peak_rss_mb']))
+
+
+def parse_args(argv=None):
+    # pylint:disable=C0415
+    from benchmarks.data import SIZES, WIDTHS
+    parser = argparse.ArgumentParser(description='falksgeo benchmarks')
+    parser.add_argument('--size', choices=SIZES, default='small')
+    parser.add_argument('--width', choices=WIDTHS, default='narrow')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--only', nargs='+', help='Benchmark names')
+    parser.add_argument('--data-dir', default=DATA_DIR)
+    parser.add_argument('--output', help='Result file (JSON)')
+    parser.add_argument('--compare', help='Baseline result file (JSON)')
+    parser.add_argument('--threshold', type=float, default=0.1)
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.child:
+        print(json.dumps(run_single(
+            args.child, args.size, args.width, args.repeat, args.data_dir)))
+        return 0
+    # pylint:disable=C0415
+    from benchmarks.data import Dataset
+    from benchmarks.suite import BENCHMARKS
+    names = args.only or list(BENCHMARKS)
+    print('Preparing data in {}'.format(args.data_dir))
+    Dataset(args.data_dir, args.size, args.width).ensure()
+    results = {}
+    for name in names:
+        print('Running {}'.format(name))
+        results[name] = run_child(name, args)
+    output = {'meta': metadata(args), 'results': results}
+    report(results)
+    filename = args.output or os.path.join(RESULT_DIR, '{}-{}-{}.json'.format(
+        args.size, args.width, datetime.now().strftime('%Y%m%d%H%M%S')))
+    os.makedirs(os.path.dirname(os.path.abspath(filename)), exist_ok=True)
+    with open(filename, 'w') as handle:
+        json.dump(output, handle, indent=2)
+    print('\nResults stored in {}'.format(filename))
+    if args.compare:
+        with open(args.compare) as handle:
+            if compare(json.load(handle), output, args.threshold):
+                return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
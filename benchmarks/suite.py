@@ -0,0 +1,129 @@
+# pylint:disable=E0401
+"""
+Benchmark definitions. Every benchmark gets the Dataset and an empty
+output directory and returns the number of items processed and their unit.
+"""
+import os
+import subprocess
+import sys
+from collections import OrderedDict
+import fiona
+from falksgeo import (
+    bootstrap, earthengine, filters, partition, raster, shapefile)
+
+
+BENCHMARKS = OrderedDict()
+MODULES = [
+    'arcgis', 'bootstrap', 'earthengine', 'files', 'filters', 'formats',
+    'partition', 'raster', 'shapefile']
+
+
+def benchmark(f):
+    """
+    Decorator: register a benchmark under its function name
+    """
+    BENCHMARKS[f.__name__] = f
+    return f
+
+
+@benchmark
+def import_time(data, out):
+    """
+    Import every module in a fresh interpreter, this includes the
+    interpreter start up
+    """
+    for name in MODULES:
+        subprocess.run(
+            [sys.executable, '-c', 'import falksgeo.{}'.format(name)],
+            check=True)
+    return len(MODULES), 'modules'
+
+
+@benchmark
+def copy_layer(data, out):
+    shapefile.copy_layer(data.polygons, os.path.join(out, 'copy_layer.shp'))
+    return data.count, 'features'
+
+
+@benchmark
+def copy_shp(data, out):
+    shapefile.copy_shp(data.polygons, os.path.join(out, 'copy_shp.shp'))
+    return data.count, 'features'
+
+
+@benchmark
+def partitioned_copy(data, out):
+    partition.run_partitioned(
+        data.polygons, os.path.join(out, 'partitioned.shp'))
+    return data.count, 'features'
+
+
+@benchmark
+def merge_layers(data, out):
+    shapefile.merge_layers(
+        [data.polygons, data.polygons], os.path.join(out, 'merged.shp'))
+    return 2 * data.count, 'features'
+
+
+@benchmark
+def create_variable(data, out):
+    shapefile.create_variable(
+        data.polygons, os.path.join(out, 'variable.shp'),
+        range(0, data.count, 3), default=0)
+    return data.count, 'features'
+
+
+@benchmark
+def annotate(data, out):
+    shapefile.annotate(
+        data.polygons, [data.annotation], os.path.join(out, 'annotated.shp'))
+    return data.count, 'features'
+
+
+@benchmark
+def annotate_spatial(data, out):
+    shapefile.annotate_spatial(
+        data.polygons, data.area, os.path.join(out, 'spatial.shp'))
+    return data.count, 'features'
+
+
+@benchmark
+def get_shape_filter(data, out):
+    filter_function = filters.get_shape_filter(data.area)
+    with fiona.open(data.polygons) as collection:
+        for item in collection:
+            filter_function(item)
+    return data.count, 'features'
+
+
+@benchmark
+def chunk_filter(data, out):
+    region = earthengine.region_from_shape(data.area)
+    chunks = earthengine.chunks_from_region(region, step=0.05)
+    earthengine.chunk_filter(chunks, data.area)
+    return len(chunks), 'chunks'
+
+
+@benchmark
+def merge(data, out):
+    earthengine.merge(data.rasters, os.path.join(out, 'merged.tif'))
+    return len(data.rasters) * data.tile_size ** 2, 'pixels'
+
+
+@benchmark
+def merge_overviews(data, out):
+    earthengine.merge(
+        data.rasters, os.path.join(out, 'overviews.tif'), overviews=True)
+    return len(data.rasters) * data.tile_size ** 2, 'pixels'
+
+
+@benchmark
+def zonal_stats(data, out):
+    raster.zonal_stats(data.rasters[0], data.polygons)
+    return data.tile_size ** 2, 'pixels'
+
+
+@benchmark
+def hash_file(data, out):
+    bootstrap.hash_file(data.blob)
+    return os.path.getsize(data.blob), 'bytes'
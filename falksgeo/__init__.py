@@ -0,0 +1,21 @@
+"""
+Geo processing utilities, submodules are imported on first access
+"""
+import importlib
+
+SUBMODULES = [
+    'arcgis', 'bootstrap', 'cli', 'dbf', 'display', 'earthengine',
+    'earthengine_examples', 'files', 'filters', 'formats', 'geometry', 'lazy',
+    'pandas', 'partition', 'pipeline', 'raster', 'reproject', 'schema',
+    'shapefile', 'sorting', 'transformations']
+
+
+def __getattr__(name):
+    if name in SUBMODULES:
+        return importlib.import_module('.' + name, __name__)
+    raise AttributeError(
+        'module {!r} has no attribute {!r}'.format(__name__, name))
+
+
+def __dir__():
+    return sorted(list(globals()) + SUBMODULES)
@@ -1,12 +1,24 @@
 """
 Utils to interact with ArcGIS online
 """
+import hashlib
+import json
 import os
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
 from getpass import getpass
 import sys
-import arcgis
-from arcgis.features import FeatureLayerCollection
-from falksgeo.display import print_docstring
+import threading
+from time import sleep
+import weakref
+from falksgeo.display import (
+    active_profiles, count_features, print_docstring, profile)
+from falksgeo.lazy import lazy_import
+
+arcgis = lazy_import('arcgis')
+fiona = lazy_import('fiona')
+requests = lazy_import('requests')
+shapely = lazy_import('shapely')
 
 
 # ensure these settings for safe publishing
@@ -17,6 +29,26 @@ DEFAULT_AGO_LAYER_CONFIG = {
     'supportsAppend': False
 }
 
+# the search item type 'Feature Layer' refers to items of type
+# 'Feature Service'
+ITEM_TYPES = {'Feature Layer': 'Feature Service'}
+
+_INDEX_LOCK = threading.Lock()
+
+PublishResult = namedtuple(
+    'PublishResult',
+    ['name', 'zipfile', 'action', 'service', 'attempts', 'error'])
+
+
+def transient_errors():
+    """
+    Network errors worth another attempt. Not all OSErrors, a missing or
+    unreadable file fails right away.
+    """
+    return (
+        requests.exceptions.ConnectionError, requests.exceptions.Timeout,
+        ConnectionError, TimeoutError)
+
 
 def get_gis(portal, user, password=None):
     """
@@ -36,7 +68,8 @@ def get_gis(portal, user, password=None):
 def exact_find(gis, name, typ):
     """
     The ArcGIS online search function picks up inexact matches. Double-check
-    whether we are getting the right item
+    whether we are getting the right item. Use an ItemIndex for repeated
+    lookups.
     """
     res = gis.content.search('title: {}'.format(name), typ)
     for item in res:
@@ -44,40 +77,432 @@ def exact_find(gis, name, typ):
             return item
 
 
+class ItemIndex(object):
+    """
+    Session-scoped lookup of items by title and type. Items are loaded with
+    a single bulk request per owner or folder and looked up from memory
+    afterwards. Register new items with add and drop stale ones with
+    invalidate.
+    """
+
+    def __init__(self, gis, owner=None):
+        self.gis = gis
+        self.owner = owner
+        self.items = {}
+        self.loaded = set()
+        self.lock = threading.RLock()
+
+    def load(self, folder=None, reload=False):
+        """
+        Load all items of the owner, or of a single folder of the logged-in
+        user if folder is set
+        """
+        with self.lock:
+            key = ('folder', folder) if folder else ('owner', self.owner)
+            if key in self.loaded and not reload:
+                return
+            if folder:
+                res = self.gis.users.me.items(folder=folder, max_items=10000)
+            else:
+                owner = self.owner or self.gis.users.me.username
+                res = self.gis.content.search(
+                    'owner:{}'.format(owner), max_items=10000)
+            for item in res:
+                self.add(item)
+            self.loaded.add(key)
+
+    def add(self, item):
+        """
+        Register an item, e.g. after adding or publishing
+        """
+        with self.lock:
+            items = self.items.setdefault(item.title, [])
+            if item.id not in [other.id for other in items]:
+                items.append(item)
+
+    def invalidate(self, name=None):
+        """
+        Drop items by title or everything, the next lookup reloads
+        """
+        with self.lock:
+            if name is None:
+                self.items = {}
+            else:
+                self.items.pop(name, None)
+            self.loaded = set()
+
+    def find(self, name, typ, folder=None):
+        """
+        Exact lookup by title and type (prefix). Loads the folder, or all
+        items of the owner without folder, on first use. The owner's items
+        include all folders.
+        """
+        typ = ITEM_TYPES.get(typ, typ).strip()
+        with self.lock:
+            if ('owner', self.owner) not in self.loaded:
+                self.load(folder)
+            for item in self.items.get(name, []):
+                if item.type.startswith(typ):
+                    return item
+        return None
+
+
+_INDEXES = weakref.WeakKeyDictionary()
+
+
+def item_index(gis):
+    """
+    Return the session item index for a portal connection
+    """
+    with _INDEX_LOCK:
+        if gis not in _INDEXES:
+            _INDEXES[gis] = ItemIndex(gis)
+        return _INDEXES[gis]
+
+
+def layer_name(zipfile):
+    """
+    Derive the item title from the zipfile name
+    """
+    return os.path.split(zipfile)[1].replace('.zip', '')
+
+
+def snapshot_name(zipfile):
+    """
+    Name of the file storing the row hashes of the last publication
+    """
+    return zipfile + '.snapshot.json'
+
+
+def feature_hash(feature):
+    """
+    Hash properties and geometry of a feature to detect changes
+    """
+    geometry = feature['geometry']
+    content = json.dumps([
+        dict(feature['properties']),
+        geometry and [geometry['type'], geometry['coordinates']]
+    ], sort_keys=True, default=str)
+    return hashlib.md5(content.encode('utf-8')).hexdigest()
+
+
+def layer_snapshot(zipfile, id_field):
+    """
+    Hash all rows in a zipped shapefile keyed by id_field
+
+    Returns:
+        dict: {str(id): hash}
+    """
+    with fiona.open('zip://' + zipfile) as collection:
+        return {
+            str(item['properties'][id_field]): feature_hash(item)
+            for item in collection}
+
+
+def layer_count(zipfile):
+    """
+    Number of features in a zipped shapefile
+    """
+    with fiona.open('zip://' + zipfile) as collection:
+        return len(collection)
+
+
+def write_snapshot(zipfile, snapshot):
+    with open(snapshot_name(zipfile), 'w') as fil:
+        fil.write(json.dumps(snapshot))
+
+
+def read_snapshot(zipfile):
+    with open(snapshot_name(zipfile)) as fil:
+        return json.loads(fil.read())
+
+
+def diff_snapshot(old, new):
+    """
+    Compare two snapshots
+
+    Returns:
+        tuple(set, set, set): ids to add, to update, and to delete
+    """
+    adds = new.keys() - old.keys()
+    deletes = old.keys() - new.keys()
+    updates = {
+        key for key in new.keys() & old.keys() if new[key] != old[key]}
+    return adds, updates, deletes
+
+
+def to_esri_geometry(geometry, wkid=None):
+    """
+    Convert a GeoJSON-like geometry into Esri JSON
+    """
+    typ = geometry['type']
+    if typ == 'Point':
+        ret = dict(zip(['x', 'y'], geometry['coordinates']))
+    elif typ == 'MultiPoint':
+        ret = {'points': [list(crd) for crd in geometry['coordinates']]}
+    elif typ == 'LineString':
+        ret = {'paths': [[list(crd) for crd in geometry['coordinates']]]}
+    elif typ == 'MultiLineString':
+        ret = {'paths': [
+            [list(crd) for crd in path] for path in geometry['coordinates']]}
+    elif typ in ['Polygon', 'MultiPolygon']:
+        # Esri expects clockwise exterior rings
+        shp = shapely.geometry.shape(geometry)
+        polygons = shp.geoms if typ == 'MultiPolygon' else [shp]
+        ret = {'rings': []}
+        for polygon in polygons:
+            polygon = shapely.geometry.polygon.orient(polygon, sign=-1.0)
+            ret['rings'].append([list(crd) for crd in polygon.exterior.coords])
+            ret['rings'].extend([
+                [list(crd) for crd in ring.coords]
+                for ring in polygon.interiors])
+    else:
+        raise ValueError('{}: Unsupported geometry type'.format(typ))
+    if wkid:
+        ret['spatialReference'] = {'wkid': wkid}
+    return ret
+
+
+def _where_in(field, values):
+    values = [
+        str(val) if isinstance(val, (int, float)) else
+        "'{}'".format(str(val).replace("'", "''")) for val in values]
+    return '{} IN ({})'.format(field, ', '.join(values))
+
+
+def _id_type(typ):
+    """
+    Python type of the values of a fiona field type, text ids made of
+    digits keep their leading zeros
+    """
+    if typ.startswith('int'):
+        return int
+    if typ.startswith('float'):
+        return float
+    return str
+
+
+def _batches(lst, size):
+    lst = list(lst)
+    for index in range(0, len(lst), size):
+        yield lst[index:index + size]
+
+
+def _check_edits(res):
+    for key in ['addResults', 'updateResults', 'deleteResults']:
+        failed = [item for item in res.get(key, []) if not item['success']]
+        if failed:
+            raise RuntimeError('{} edits failed: {}'.format(key, failed[0]))
+
+
+def publish_delta(zipfile, service, id_field='comid', batch_size=1000):
+    """
+    Push only added, changed, and deleted features since the last
+    publication instead of overwriting the service. Requires the snapshot
+    written by the previous publication.
+
+    Args:
+        zipfile(str): Zipped shapefile
+        service(arcgis.gis.Item): The feature service to update
+        id_field(str): Field uniquely identifying features
+        batch_size(int): Number of features per edit request
+    Returns:
+        dict: Number of adds, updates, and deletes
+    """
+    new = layer_snapshot(zipfile, id_field)
+    adds, updates, deletes = diff_snapshot(read_snapshot(zipfile), new)
+    counts = {
+        'adds': len(adds), 'updates': len(updates), 'deletes': len(deletes)}
+    print('Delta for {}: {}'.format(service, counts))
+    if not adds | updates | deletes:
+        return counts
+    layer = arcgis.features.FeatureLayerCollection.fromitem(
+        service).layers[0]
+    oid_field = layer.properties.objectIdField
+    with fiona.open('zip://' + zipfile) as collection:
+        cast = _id_type(collection.schema['properties'][id_field])
+    # resolve object ids on the service, adds included: features added by
+    # an interrupted run are already there and get updated instead
+    oids = {}
+    for batch in _batches(adds | updates | deletes, batch_size):
+        res = layer.query(
+            where=_where_in(id_field, [cast(val) for val in batch]),
+            out_fields=','.join([id_field, oid_field]), return_geometry=False)
+        for item in res.features:
+            oids[str(item.attributes[id_field])] = item.attributes[oid_field]
+    add_features = []
+    update_features = []
+    with fiona.open('zip://' + zipfile) as collection:
+        wkid = collection.crs.to_epsg() if collection.crs else None
+        for item in collection:
+            key = str(item['properties'][id_field])
+            if key not in adds and key not in updates:
+                continue
+            feature = {
+                'attributes': dict(item['properties']),
+                'geometry': to_esri_geometry(item['geometry'], wkid)}
+            if key in oids:
+                feature['attributes'][oid_field] = oids[key]
+                update_features.append(feature)
+            else:
+                # new or missing on the service
+                add_features.append(feature)
+    for batch in _batches(add_features, batch_size):
+        _check_edits(layer.edit_features(adds=batch))
+    for batch in _batches(update_features, batch_size):
+        _check_edits(layer.edit_features(updates=batch))
+    delete_oids = [str(oids[key]) for key in deletes if key in oids]
+    for batch in _batches(delete_oids, batch_size):
+        _check_edits(layer.edit_features(deletes=','.join(batch)))
+    write_snapshot(zipfile, new)
+    return counts
+
+
+def update_service(service, zipfile, delta_field=None, batch_size=1000):
+    """
+    Update an existing service. Push only the changes when delta_field is
+    set and a snapshot of the previous publication exists.
+    """
+    if delta_field and os.path.isfile(snapshot_name(zipfile)):
+        return publish_delta(
+            zipfile, service, id_field=delta_field, batch_size=batch_size)
+    layer = arcgis.features.FeatureLayerCollection.fromitem(service)
+    layer.manager.overwrite(zipfile)
+    if delta_field:
+        write_snapshot(zipfile, layer_snapshot(zipfile, delta_field))
+    return None
+
+
 @print_docstring
-def publish(zipfile, gis, folder=None):
+@profile
+def publish(zipfile, gis, folder=None, delta_field=None, index=None):
     """
     Push layer to ArcgisOnline
     """
+    index = index or item_index(gis)
     if folder:
         gis.content.create_folder(folder)
-    name = os.path.split(zipfile)[1].replace('.zip', '')
-    shapefile = exact_find(gis, name, 'Shapefile')
-    if not shapefile:
-        item_properties = {'title': name}
-        shapefile = gis.content.add(
-            item_properties, zipfile, folder=folder)
-        print('Shapefile {} created'.format(shapefile))
+    name = layer_name(zipfile)
+    shapefile = index.find(name, 'Shapefile')
+    service = index.find(name, 'Feature Layer') if shapefile else None
+    if not service:
+        if shapefile:
+            # left over from a failed publication, upload the current data
+            shapefile.update(data=zipfile)
+            print('Shapefile {} updated'.format(shapefile))
+        else:
+            item_properties = {'title': name}
+            shapefile = gis.content.add(
+                item_properties, zipfile, folder=folder)
+            index.add(shapefile)
+            print('Shapefile {} created'.format(shapefile))
         # Don't use overwrite argument, it behaves very funny
         service = shapefile.publish()
+        index.add(service)
         print('Shapefile {} published'.format(shapefile))
+        if delta_field:
+            write_snapshot(zipfile, layer_snapshot(zipfile, delta_field))
     else:
-        service = exact_find(gis, name, 'Feature Layer')
         print(service)
-        layer = FeatureLayerCollection.fromitem(service)
-        layer.manager.overwrite(zipfile)
+        update_service(service, zipfile, delta_field=delta_field)
         print('Feature Layer {} updated with {}'.format(service, shapefile))
     service.share(everyone=True)
     print('Service {} shared with everyone'.format(service))
+    if active_profiles():
+        count_features(layer_count(zipfile))
+
+
+def _publish_layer(
+    zipfile, gis, index, folder=None, retries=3, backoff=2, delta_field=None
+):
+    """
+    Create or update a single layer, retry on transient errors. Steps
+    that succeeded are not repeated on retry.
+    """
+    name = layer_name(zipfile)
+    shapefile = index.find(name, 'Shapefile', folder=folder)
+    service = (
+        index.find(name, 'Feature Layer', folder=folder) if shapefile
+        else None)
+    action = 'updated' if service else 'created'
+    # an item without service is left over from a failed run
+    stale = bool(shapefile) and not service
+    done = False
+    attempt = 0
+    while True:
+        attempt += 1
+        try:
+            if not shapefile:
+                shapefile = gis.content.add(
+                    {'title': name}, zipfile, folder=folder)
+                index.add(shapefile)
+            elif stale:
+                shapefile.update(data=zipfile)
+                stale = False
+            if not service:
+                service = shapefile.publish()
+                index.add(service)
+                if delta_field:
+                    write_snapshot(
+                        zipfile, layer_snapshot(zipfile, delta_field))
+                done = True
+            elif not done:
+                update_service(service, zipfile, delta_field=delta_field)
+                done = True
+            service.share(everyone=True)
+            return PublishResult(name, zipfile, action, service, attempt, None)
+        except transient_errors() as err:
+            if attempt >= retries:
+                return PublishResult(
+                    name, zipfile, action, service, attempt, err)
+            sleep(backoff * 2 ** (attempt - 1))
+        # a failing layer should not stop the batch
+        except Exception as err: # pylint:disable=W0703
+            return PublishResult(name, zipfile, action, service, attempt, err)
+
+
+@print_docstring
+@profile
+def publish_many(
+    zipfiles, gis, folder=None, max_workers=4, retries=3, backoff=2,
+    delta_field=None, index=None
+):
+    """
+    Push several layers to ArcgisOnline concurrently
+    """
+    index = index or item_index(gis)
+    if folder:
+        gis.content.create_folder(folder)
+    index.load(folder)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [
+            executor.submit(
+                _publish_layer, zipfile, gis, index, folder=folder,
+                retries=retries, backoff=backoff, delta_field=delta_field)
+            for zipfile in zipfiles]
+        results = [future.result() for future in futures]
+    for res in results:
+        if res.error:
+            print('Layer {} FAILED after {} attempt(s): {}'.format(
+                res.name, res.attempts, res.error))
+        else:
+            print('Layer {} {} and shared'.format(res.name, res.action))
+    if active_profiles():
+        count_features(sum(
+            layer_count(res.zipfile) for res in results if not res.error))
+    return results
 
 
-def style_ago(gis, item, style, overwrites=DEFAULT_AGO_LAYER_CONFIG):
+def style_ago(
+    gis, item, style, overwrites=DEFAULT_AGO_LAYER_CONFIG, index=None
+):
     """
     Style feature with name item
     """
-    service = exact_find(gis, item, 'Feature ')
+    index = index or item_index(gis)
+    service = index.find(item, 'Feature ')
     print('\nStyle {}'.format(service))
-    layer = FeatureLayerCollection.fromitem(service)
+    layer = arcgis.features.FeatureLayerCollection.fromitem(service)
     layer.layers[0].manager.update_definition(style)
     # add standard definitions for a secure FeatureService
     # (disable editing)
@@ -8,13 +8,14 @@ import json
 import hashlib
 import shutil
 from zipfile import ZipFile
-# third party
-import requests
-from tqdm import tqdm
 # project
 # these imports make it possible to refer to them in
 # configuration files by name without import
 from .files import ensure_directory
+from .lazy import lazy_import
+
+requests = lazy_import('requests')
+tqdm = lazy_import('tqdm')
 
 
 BLOCKSIZE = 65536
@@ -46,7 +47,7 @@ def copy_tree(source_name, dest, **kwargs):
 def simple_download(url, dest, **kwargs):
     resp = requests.get(url, stream=True)
     with open(dest, 'wb') as handle:
-        for data in tqdm(resp.iter_content(chunk_size=32000)):
+        for data in tqdm.tqdm(resp.iter_content(chunk_size=32000)):
             handle.write(data)
 
 
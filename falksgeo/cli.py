@@ -0,0 +1,41 @@
+"""
+Command line entry point: falksgeo spec.yaml
+"""
+import argparse
+import json
+import sys
+from .pipeline import run_pipeline
+
+
+def load_spec(filename):
+    """
+    Load a pipeline spec from JSON or YAML (requires PyYAML). A file can
+    contain a single spec or a list of specs run in order.
+    """
+    with open(filename) as handle:
+        if filename.endswith(('.yaml', '.yml')):
+            try:
+                import yaml  # pylint:disable=C0415
+            except ImportError as err:
+                raise ImportError(
+                    'Install PyYAML to use YAML specs') from err
+            spec = yaml.safe_load(handle)
+        else:
+            spec = json.load(handle)
+    return spec if isinstance(spec, list) else [spec]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='falksgeo', description='Run falksgeo pipeline specs')
+    parser.add_argument('spec', help='Pipeline spec (JSON or YAML)')
+    parser.add_argument(
+        '--parallel', type=int, help='Processes for jobs per input file')
+    args = parser.parse_args(argv)
+    for spec in load_spec(args.spec):
+        run_pipeline(spec, parallel=args.parallel)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,223 @@
+# pylint:disable=E0401
+"""
+Memory mapped DBF reader for attribute only operations, fixed width
+records are mapped with a structured dtype and decoded column by column
+"""
+import codecs
+import os
+import struct
+from collections import namedtuple, OrderedDict
+from .lazy import lazy_import
+
+np = lazy_import('numpy')
+pd = lazy_import('pandas')
+
+Field = namedtuple('Field', ['name', 'type', 'length', 'decimals', 'offset'])
+# DBF fallback encoding if there is no .cpg file
+DEFAULT_ENCODING = 'latin-1'
+
+
+def dbf_name(filename):
+    """
+    The DBF belonging to a shapefile
+    """
+    root, ext = os.path.splitext(filename)
+    return root + '.dbf' if ext.lower() == '.shp' else filename
+
+
+def normalize_encoding(code_page):
+    """
+    Python codec of a .cpg code page, normalized like GDAL does
+    (ANSI 1252 and 1252 are cp1252, 65001 is utf-8, 8859-1 is
+    iso-8859-1), unknown code pages fall back to latin-1
+    """
+    code_page = code_page.strip()
+    if code_page.upper().startswith('ANSI '):
+        code_page = code_page[5:].strip()
+    if code_page == '65001':
+        code_page = 'utf-8'
+    elif code_page.isdigit():
+        code_page = 'cp' + code_page
+    elif code_page.startswith('8859'):
+        code_page = 'iso-' + code_page
+    try:
+        return codecs.lookup(code_page).name
+    except LookupError:
+        return DEFAULT_ENCODING
+
+
+def _encoding(filename):
+    cpg = os.path.splitext(filename)[0] + '.cpg'
+    if os.path.isfile(cpg):
+        with open(cpg, encoding='ascii', errors='replace') as handle:
+            encoding = handle.read().strip()
+        return normalize_encoding(encoding)
+    return DEFAULT_ENCODING
+
+
+class DBF(object):
+    """
+    A DBF file, columns are decoded on access
+
+    Args:
+        filename(str): DBF or shapefile name
+        encoding(str): Text encoding, from the .cpg file if None
+    """
+
+    def __init__(self, filename, encoding=None):
+        self.filename = dbf_name(filename)
+        self.encoding = encoding or _encoding(self.filename)
+        with open(self.filename, 'rb') as handle:
+            header = handle.read(32)
+            self.count, self.header_length, self.record_length = (
+                struct.unpack('<IHH', header[4:12]))
+            self.fields = OrderedDict()
+            offset = 1
+            while True:
+                descriptor = handle.read(32)
+                if not descriptor or descriptor[0] == 0x0D:
+                    break
+                name = descriptor[:11].split(b'\x00')[0].decode(
+                    self.encoding).strip()
+                field = Field(
+                    name, chr(descriptor[11]), descriptor[16],
+                    descriptor[17], offset)
+                self.fields[name] = field
+                offset += field.length
+        self._valid = None
+
+    def __len__(self):
+        return int(self.valid.sum())
+
+    def _dtype(self, names):
+        fields = [self.fields[name] for name in names]
+        return np.dtype({
+            'names': ['_deleted'] + names,
+            'formats': ['S1'] + ['S{}'.format(item.length) for item in fields],
+            'offsets': [0] + [item.offset for item in fields],
+            'itemsize': self.record_length})
+
+    def records(self, names):
+        """
+        Raw fixed width values of the fields as a structured memmap
+        """
+        if not self.count:
+            return np.zeros(0, dtype=self._dtype(names))
+        return np.memmap(
+            self.filename, dtype=self._dtype(names), mode='r',
+            offset=self.header_length, shape=(self.count,))
+
+    @property
+    def valid(self):
+        """
+        Mask of records not flagged as deleted
+        """
+        if self._valid is None:
+            self._valid = self.records([])['_deleted'] != b'*'
+        return self._valid
+
+    def read(self, columns=None):
+        """
+        Decode columns
+
+        Args:
+            columns(list[str]): Only decode these fields
+        Returns:
+            OrderedDict: name -> np.ndarray
+        """
+        names = list(self.fields) if columns is None else list(columns)
+        missing = [name for name in names if name not in self.fields]
+        if missing:
+            raise KeyError('{}: Fields not in {}'.format(
+                ', '.join(missing), self.filename))
+        records = self.records(names)
+        valid = self.valid
+        return OrderedDict(
+            (name, self.decode(self.fields[name], records[name][valid]))
+            for name in names)
+
+    def decode(self, field, values):
+        """
+        Vectorized decoding of the raw values of a field
+        """
+        if field.type in 'CV':
+            return _text(values, self.encoding)
+        if field.type in 'NFO':
+            return _numbers(values, integer=field.type == 'N' and (
+                not field.decimals and field.length < 19))
+        if field.type == 'I':
+            return values.view('<i4').reshape(-1)
+        if field.type == 'L':
+            return np.isin(values, [b'T', b't', b'Y', b'y'])
+        if field.type == 'D':
+            return _dates(values)
+        return values
+
+
+def _text(values, encoding):
+    width = values.dtype.itemsize
+    raw = np.ascontiguousarray(values).view(np.uint8).reshape(-1, width)
+    # cut the padding all values share before any string operation
+    used = np.flatnonzero(((raw != 32) & (raw != 0)).any(axis=0))
+    size = int(used[-1]) + 1 if len(used) else 1
+    raw = np.ascontiguousarray(raw[:, :size])
+    values = np.char.strip(raw.view('S{}'.format(size)).reshape(-1))
+    if (raw < 128).all():
+        text = values.astype('U').astype(object)
+    else:
+        text = np.char.decode(values, encoding, 'replace').astype(object)
+    # blank values are null
+    text[values == b''] = None
+    return text
+
+
+def _numbers(values, integer=False):
+    values = np.char.strip(values)
+    blank = values == b''
+    if integer and not blank.any():
+        try:
+            return values.astype(np.int64)
+        except ValueError:
+            pass
+    try:
+        return np.where(blank, b'nan', values).astype(np.float64)
+    except ValueError:
+        # overflow markers (****) and other garbage
+        return pd.to_numeric(
+            pd.Series(np.char.decode(values, 'ascii', 'replace')),
+            errors='coerce').to_numpy(dtype=np.float64)
+
+
+def _dates(values):
+    values = np.char.strip(values)
+    numbers = np.where(values == b'', b'0', values).astype(np.int64)
+    # blank or zero filled dates
+    blank = numbers <= 0
+    numbers[blank] = 19700101
+    dates = (
+        (numbers // 10000 - 1970).astype('M8[Y]') +
+        (numbers // 100 % 100 - 1).astype('m8[M]')).astype('M8[D]')
+    dates = dates + (numbers % 100 - 1).astype('m8[D]')
+    dates[blank] = np.datetime64('NaT')
+    return dates
+
+
+def read_dbf(filename, columns=None, encoding=None):
+    """
+    Read DBF columns as NumPy arrays without touching geometries
+
+    Args:
+        filename(str): DBF or shapefile name
+        columns(list[str]): Only read these fields
+        encoding(str): Text encoding, from the .cpg file if None
+    Returns:
+        OrderedDict: name -> np.ndarray
+    """
+    return DBF(filename, encoding=encoding).read(columns)
+
+
+def dbf_dataframe(filename, columns=None, encoding=None):
+    """
+    Read DBF columns into a pandas DataFrame
+    """
+    return pd.DataFrame(read_dbf(filename, columns, encoding))
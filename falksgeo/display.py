@@ -2,9 +2,29 @@
 Helpers to display action and progress
 """
 
+import atexit
+import cProfile
+import inspect
+import json
+import os
 import sys
+import threading
+import time
+import tracemalloc
 from functools import wraps
 
+# 1 or all profiles every decorated function, otherwise a comma separated
+# list of function names
+PROFILE_ENV = 'FALKSGEO_PROFILE'
+# directory for per call profiler output and the summary
+PROFILE_DIR_ENV = 'FALKSGEO_PROFILE_DIR'
+# cprofile (default) or pyinstrument
+PROFILER_ENV = 'FALKSGEO_PROFILER'
+PROFILES = []
+_ACTIVE = threading.local()
+_LOCK = threading.Lock()
+_REPORT = []
+
 
 class PercentDisplay(object):
     """
@@ -16,6 +36,8 @@ class PercentDisplay(object):
         self.brk = int(self.count/100*percent_step) + 1
         self.counter = 0
         self.limit = limit
+        for record in active_profiles():
+            record.displays.append(self)
         self.display()
 
     def display(self):
@@ -36,11 +58,210 @@ class PercentDisplay(object):
 
 def print_docstring(f, *args, **kwargs):
     """
-    Decorator: print the doc string of a function before execution
+    Decorator: print the first paragraph of the doc string of a function
+    before execution
     """
     @wraps(f)
     def decorated(*args, **kwargs):
-        snippet = f.__doc__.strip() if f.__doc__ else f.__name__
+        snippet = (
+            inspect.cleandoc(f.__doc__).split('\n\n')[0] if f.__doc__
+            else f.__name__)
         print('\n', snippet, '\n', sep='')
         return f(*args, **kwargs)
     return decorated
+
+
+class ProfileRecord(object):
+    """
+    Measurements of a single call of a profiled function
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.wall = None
+        self.cpu = None
+        self.peak_memory = 0
+        self.base_memory = 0
+        self.displays = []
+        self.written = 0
+        self.output = None
+
+    @property
+    def features(self):
+        """
+        Features counted by the progress displays created during the call,
+        otherwise features written or returned
+        """
+        return (
+            sum(display.counter for display in self.displays) or self.written)
+
+    def as_dict(self):
+        return {
+            'name': self.name, 'wall': self.wall, 'cpu': self.cpu,
+            'peak_memory': self.peak_memory, 'features': self.features,
+            'output': self.output}
+
+
+def active_profiles():
+    """
+    Records of the profiled calls currently running in this thread
+    """
+    if not hasattr(_ACTIVE, 'stack'):
+        _ACTIVE.stack = []
+    return _ACTIVE.stack
+
+
+def count_features(count):
+    """
+    Report features written by functions without progress display to the
+    profiled calls running in this thread
+    """
+    for record in active_profiles():
+        record.written += count
+
+
+def profiling_enabled(name):
+    """
+    Check the environment whether a function should be profiled
+    """
+    value = os.environ.get(PROFILE_ENV, '').strip()
+    if value.lower() in {'1', 'all', 'true', 'yes'}:
+        return True
+    return name in {item.strip() for item in value.split(',')}
+
+
+def _update_peaks(stack):
+    _, peak = tracemalloc.get_traced_memory()
+    for record in stack:
+        record.peak_memory = max(
+            record.peak_memory, peak - record.base_memory)
+
+
+def _profiler_output(name, directory):
+    with _LOCK:
+        number = len(PROFILES)
+    return os.path.join(directory, '{}-{:04d}'.format(name, number))
+
+
+def _run_profiler(f, record, directory, *args, **kwargs):
+    """
+    Run f under cProfile or pyinstrument and store the output
+    """
+    os.makedirs(directory, exist_ok=True)
+    base = _profiler_output(record.name, directory)
+    if os.environ.get(PROFILER_ENV) == 'pyinstrument':
+        # pylint:disable=C0415,E0401
+        from pyinstrument import Profiler
+        profiler = Profiler()
+        profiler.start()
+        try:
+            return f(*args, **kwargs)
+        finally:
+            profiler.stop()
+            record.output = base + '.html'
+            with open(record.output, 'w') as handle:
+                handle.write(profiler.output_html())
+    profiler = cProfile.Profile()
+    try:
+        return profiler.runcall(f, *args, **kwargs)
+    finally:
+        record.output = base + '.prof'
+        profiler.dump_stats(record.output)
+
+
+def profile(f=None, enabled=None, directory=None):
+    """
+    Decorator: record wall and CPU time, peak memory (tracemalloc) and
+    feature counts of a function call. Disabled unless enabled is True or
+    the function is selected by the FALKSGEO_PROFILE environment variable.
+    With directory or FALKSGEO_PROFILE_DIR, profiler output is stored for
+    every call. A summary is printed at exit.
+
+    Usage: @profile or @profile(enabled=True)
+    """
+    if f is None:
+        return lambda func: profile(func, enabled, directory)
+
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        if not (enabled or profiling_enabled(f.__name__)):
+            return f(*args, **kwargs)
+        stack = active_profiles()
+        record = ProfileRecord(f.__name__)
+        started = not tracemalloc.is_tracing()
+        if started:
+            tracemalloc.start()
+        _update_peaks(stack)
+        record.base_memory = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        stack.append(record)
+        outdir = directory or os.environ.get(PROFILE_DIR_ENV)
+        # only the outermost call runs the profiler
+        profiled = outdir and len(stack) == 1
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            if profiled:
+                result = _run_profiler(f, record, outdir, *args, **kwargs)
+            else:
+                result = f(*args, **kwargs)
+            if not record.features and hasattr(result, 'shape'):
+                # statistics or samples returned instead of written
+                record.written = len(result)
+            return result
+        finally:
+            record.wall = time.perf_counter() - wall
+            record.cpu = time.process_time() - cpu
+            _update_peaks(stack)
+            stack.pop()
+            if started:
+                tracemalloc.stop()
+            _add_profile(record)
+    return decorated
+
+
+def _add_profile(record):
+    with _LOCK:
+        if not _REPORT:
+            _REPORT.append(atexit.register(print_profiles))
+        PROFILES.append(record)
+
+
+def profile_report():
+    """
+    Summary of all profiled calls, aggregated by function
+    """
+    summary = {}
+    for record in PROFILES:
+        item = summary.setdefault(record.name, {
+            'calls': 0, 'wall': 0, 'cpu': 0, 'peak_memory': 0, 'features': 0})
+        item['calls'] += 1
+        item['wall'] += record.wall
+        item['cpu'] += record.cpu
+        item['peak_memory'] = max(item['peak_memory'], record.peak_memory)
+        item['features'] += record.features
+    return summary
+
+
+def print_profiles(directory=None):
+    """
+    Print the summary and store it with all records as JSON if a profile
+    directory is configured
+    """
+    if not PROFILES:
+        return
+    summary = profile_report()
+    print('\n{:<24}{:>6}{:>10}{:>10}{:>12}{:>10}'.format(
+        'function', 'calls', 'wall (s)', 'cpu (s)', 'peak (MB)', 'features'))
+    for name, item in sorted(
+            summary.items(), key=lambda pair: -pair[1]['wall']):
+        print('{:<24}{:>6}{:>10.2f}{:>10.2f}{:>12.1f}{:>10}'.format(
+            name, item['calls'], item['wall'], item['cpu'],
+            item['peak_memory'] / 2 ** 20, item['features']))
+    directory = directory or os.environ.get(PROFILE_DIR_ENV)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, 'summary.json'), 'w') as handle:
+            json.dump({
+                'summary': summary,
+                'calls': [record.as_dict() for record in PROFILES]
+            }, handle, indent=2)
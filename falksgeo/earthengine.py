@@ -5,32 +5,112 @@ from functools import reduce
 from itertools import product
 import re
 import shutil
+import threading
 from time import sleep
 from typing import Any, Generator, Optional
 from zipfile import ZipFile
-from affine import Affine
-import ee
-import fiona
-import fiona.transform
-import rasterio
-import rasterio.merge
-import requests
-import shapely.geometry
-from shapely.geometry import mapping, Polygon
 from falksgeo.files import ensure_directory
+from falksgeo.lazy import lazy_import
+from falksgeo.reproject import to_crs, transform_coords, transform_geom
 from falksgeo.earthengine_examples import get_normalized_image
 
+ee = lazy_import('ee')
+fiona = lazy_import('fiona')
+google_auth_exceptions = lazy_import('google.auth.exceptions')
+rasterio = lazy_import('rasterio')
+rasterio_enums = lazy_import('rasterio.enums')
+rasterio_merge = lazy_import('rasterio.merge')
+requests = lazy_import('requests')
+shapely = lazy_import('shapely')
+
+BACKENDS = ['download', 'pixels']
+# nominal scale of geographic grids in Earth Engine
+METERS_PER_DEGREE = 111319.49079327357
+
+
+class Session(object):
+    """
+    Earth Engine session shared by the downloads of a process. It
+    initializes Earth Engine once (thread safe) and again for another
+    project or when credentials cannot be refreshed, builds the default
+    image once and reuses HTTP connections for downloads.
+    """
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.project = None
+        self.initialized = False
+        self.default_image = None
+        self._http = None
+
+    def initialize(self, project: Optional[str] = None, force: bool = False) -> None:
+        """
+        Initialize Earth Engine unless it already is for the project
+        """
+        with self.lock:
+            if force or not self.initialized or (
+                    project and project != self.project):
+                ee.Initialize(project=project)
+                self.initialized = True
+                self.project = project
+
+    def image(self, image: Optional[Any] = None) -> Any:
+        """
+        The image or the normalized default image
+        """
+        if image is not None:
+            return image
+        with self.lock:
+            if self.default_image is None:
+                self.default_image = get_normalized_image()
+            return self.default_image
+
+    @property
+    def http(self) -> Any:
+        """
+        HTTP session keeping connections to the download servers alive
+        """
+        with self.lock:
+            if self._http is None:
+                self._http = requests.Session()
+            return self._http
+
+    def call(self, function: Any, *args: Any, **kwargs: Any) -> Any:
+        """
+        Call an Earth Engine function, initialize again and retry once if
+        the credentials cannot be refreshed
+        """
+        self.initialize(self.project)
+        try:
+            return function(*args, **kwargs)
+        except google_auth_exceptions.RefreshError:
+            print('Credentials expired, initializing again')
+            self.initialize(self.project, force=True)
+            return function(*args, **kwargs)
+
+    def reset(self) -> None:
+        """
+        Forget the initialization and the cached image
+        """
+        with self.lock:
+            self.initialized = False
+            self.project = None
+            self.default_image = None
+
+
+SESSION = Session()
+
 
 def download_image(options: dict, tmp_image: str, image: Optional[Any] = None, project: Optional[str] = None) -> None:
     """
     Download the image from Google Earthengine
     """
-    ee.Initialize(project=project)
-    image = get_normalized_image() if image is None else image
+    SESSION.initialize(project)
+    image = SESSION.image(image)
     print('Download started')
-    path = image.getDownloadUrl(options)
+    path = SESSION.call(image.getDownloadUrl, options)
     print(path)
-    resp = requests.get(path, stream=False)
+    resp = SESSION.http.get(path, stream=False)
     if resp.status_code != 200:
         print(resp.content)
     else:
@@ -87,9 +167,8 @@ def region_from_shape(shapefilename: str) -> list:
             [bds[0], bds[1]], [bds[0], bds[3]],
             [bds[2], bds[3]], [bds[2], bds[1]]]
         box = {'type': 'Polygon', 'coordinates': [coords + [coords[0]]]}
-        transformed = fiona.transform.transform_geom(
-            collection.meta['crs']['init'], 'epsg:4326', box)
-        return transformed['coordinates'][0][:-1]
+        transformed = transform_geom(box, collection.crs, 'epsg:4326')
+        return list(transformed['coordinates'][0][:-1])
 
 
 def chunks_from_region(region: list, step: float = 0.02) -> list:
@@ -113,9 +192,8 @@ def chunk_filter(chunks: list, shapefilename: str, map_file_path: Optional[str]
     """
     ret = []
     with fiona.open(shapefilename) as collection:
-        crs = collection.meta['crs']['init']
-        odd_geom = collection[0]['geometry']
-        geom = fiona.transform.transform_geom(crs, 'epsg:4326', odd_geom)
+        geom = transform_geom(
+            collection[0]['geometry'], collection.crs, 'epsg:4326')
     shape = shapely.geometry.shape(geom)
     for chunk in chunks:
         box = shapely.geometry.Polygon(chunk + [chunk[0]])
@@ -135,7 +213,8 @@ def chunks_to_shapefile(chunks: list, shapefilename: str) -> None:
     with fiona.collection(*args, crs='epsg:4326') as output:
         for item in chunks:
             output.write({
-                'geometry': mapping(Polygon(item + [item[0]])),
+                'geometry': shapely.geometry.mapping(
+                    shapely.geometry.Polygon(item + [item[0]])),
                 'properties': {
                     'rasterfile': generate_filename(item)}})
 
@@ -146,14 +225,64 @@ def get_chunks(shp: str, step: int = 1, map_file_path: Optional[str] = None) ->
     return chunk_filter(chunks, shp, map_file_path=map_file_path)
 
 
+def chunk_grid(chunk: list, options: dict) -> dict:
+    """
+    Pixel grid of a chunk for computePixels, the scale of the options is
+    in meters like for getDownloadUrl
+    """
+    crs = options.get('crs') or 'EPSG:4326'
+    xs, ys = [item[0] for item in chunk], [item[1] for item in chunk]
+    size = options.get('scale') or 30
+    if to_crs(crs).is_geographic:
+        size = size / METERS_PER_DEGREE
+    if to_crs(crs) != to_crs('EPSG:4326'):
+        xs, ys = transform_coords(xs, ys, 'EPSG:4326', crs)
+    min_x, max_y = min(xs), max(ys)
+    return {
+        'dimensions': {
+            'width': max(1, int(round((max(xs) - min_x) / size))),
+            'height': max(1, int(round((max_y - min(ys)) / size)))},
+        'affineTransform': {
+            'scaleX': size, 'shearX': 0, 'translateX': min_x,
+            'shearY': 0, 'scaleY': -size, 'translateY': max_y},
+        'crsCode': crs}
+
+
+def download_pixels(options: dict, chunk: list, filename: str, image: Optional[Any] = None, project: Optional[str] = None) -> None:
+    """
+    Fetch the GeoTIFF of a chunk with computePixels and write it as is,
+    no zip file and no extraction
+    """
+    SESSION.initialize(project)
+    image = SESSION.image(image)
+    request = {
+        'expression': image, 'fileFormat': 'GEO_TIFF',
+        'grid': chunk_grid(chunk, options)}
+    bands = options.get('bands')
+    if bands and all(isinstance(item, str) for item in bands):
+        request['bandIds'] = bands
+    data = SESSION.call(ee.data.computePixels, request)
+    with open(filename, 'wb') as handle:
+        handle.write(data)
+
+
 def download_parts(
     area:str, options:dict, dest:str = '/tmp/', step:int = 1,
-    image:Optional[Any] = None, clean:bool = False
+    image:Optional[Any] = None, clean:bool = False,
+    backend:str = 'download', project:Optional[str] = None
 ) -> list:
     """
     Download a raster in chunks Google Earth Engine can handle
+
+    The download backend fetches a zip per chunk with getDownloadUrl, the
+    pixels backend requests the GeoTIFF of the chunk grid directly with
+    computePixels.
     """
-    image = get_normalized_image() if image is None else image
+    if backend not in BACKENDS:
+        raise ValueError('{}: Unknown backend, use one of {}'.format(
+            backend, ', '.join(BACKENDS)))
+    SESSION.initialize(project)
+    image = SESSION.image(image)
     ret = []
     ensure_directory(dest)
     tile_map = os.path.join(dest, f'downloaded_tiles_{step}.shp')
@@ -165,12 +294,15 @@ def download_parts(
         ret.append(new_filename)
         options['region'] = str(item)
         if not os.path.isfile(new_filename) or clean:
-            download_image(options, tmp_zip, image)
-            with ZipFile(tmp_zip) as zipfile:
-                tif = get_tif_files(zipfile)
-                for tif_file in tif:
-                    filename = zipfile.extract(tif_file, dest)
-                    shutil.move(filename, new_filename)
+            if backend == 'pixels':
+                download_pixels(options, item, new_filename, image, project)
+            else:
+                download_image(options, tmp_zip, image, project)
+                with ZipFile(tmp_zip) as zipfile:
+                    tif = get_tif_files(zipfile)
+                    for tif_file in tif:
+                        filename = zipfile.extract(tif_file, dest)
+                        shutil.move(filename, new_filename)
             print(f'{new_filename} created')
         else:
             print(f'{new_filename} exists')
@@ -189,24 +321,66 @@ def new_profile(files: list) -> dict:
             affine[2] = aff[2]
         if aff[5] > affine[5]:
             affine[5] = aff[5]
-    profile['transform'] = Affine(*affine)
+    profile['transform'] = rasterio.Affine(*affine)
     return profile
 
 
-def merge(filelist: list, dest: str, nodata: int = -32768) -> None:
+def overview_factors(width: int, height: int, minimum: int = 256) -> list:
+    """
+    Power of two overview factors down to the first level fitting into
+    minimum pixels per side
+    """
+    factors = []
+    factor = 2
+    while max(width, height) / (factor // 2) > minimum:
+        factors.append(factor)
+        factor *= 2
+    return factors
+
+
+def merge(
+    filelist: list, dest: str, nodata: int = -32768,
+    overviews: Optional[Any] = None, resampling: str = 'average',
+    blocksize: int = 256
+) -> None:
+    """
+    Merge rasters into a tiled DEFLATE GeoTIFF
+
+    Args:
+        filelist(list[str]): Input rasters
+        dest(str): Output raster
+        nodata(int): Nodata value of the output
+        overviews(list[int] or bool): Internal overview factors, True for
+            powers of two down to a single block
+        resampling(str): Overview resampling, e.g. average, nearest, mode
+        blocksize(int): Tile size, a multiple of 16
+    """
     files = [rasterio.open(fil) for fil in filelist]
     if files:
         profile = new_profile(files)
-        new_raster = rasterio.merge.merge(files, nodata=nodata)
+        new_raster = rasterio_merge.merge(files, nodata=nodata)
+        for fil in files:
+            fil.close()
         profile['height'] = new_raster[0].shape[1]
         profile['width'] = new_raster[0].shape[2]
         profile['nodata'] = nodata
+        # the tiles of the inputs are not necessarily valid for GeoTIFF
         profile.update({
             'tiled': True,
+            'blockxsize': blocksize,
+            'blockysize': blocksize,
             'compress': 'DEFLATE'
         })
-        with rasterio.open(dest, 'w', **profile) as dst:
-            dst.write(new_raster[0])
+        if overviews is True:
+            overviews = overview_factors(
+                profile['width'], profile['height'], blocksize)
+        with rasterio.Env(GDAL_NUM_THREADS='ALL_CPUS'):
+            with rasterio.open(dest, 'w', **profile) as dst:
+                dst.write(new_raster[0])
+                if overviews:
+                    dst.build_overviews(
+                        overviews, rasterio_enums.Resampling[resampling])
+                    dst.update_tags(ns='rio_overview', resampling=resampling)
     else:
         print('No images to process')
 
@@ -215,7 +389,8 @@ def image_to_cloud(options: dict, image: Optional[Any] = None, bucket: Optional[
     """
     Implements recommended way of storing downloads into GCS
     """
-    image = get_normalized_image() if image is None else image
+    SESSION.initialize()
+    image = SESSION.image(image)
     # TODO: finalize
     # see https://github.com/google/earthengine-api/blob/master/python/ee/batch.py
     print('Send image to Google Cloud Storage')
@@ -224,7 +399,6 @@ def image_to_cloud(options: dict, image: Optional[Any] = None, bucket: Optional[
         'bucket': options.get('bucket') or bucket or 'gde_data',
         'fileNamePrefix': options.get('fileNamePrefix') or prefix or 'pls_name',
         'region': options.get('region') or region})
-    ee.Initialize()
     task = ee.batch.Export.image.toCloudStorage(image, **options)
     start = datetime.now()
     task.start()
@@ -236,12 +410,14 @@ def image_to_cloud(options: dict, image: Optional[Any] = None, bucket: Optional[
 
 def raster_download(
     area_shape: str, dest_raster: str, dest: str = '/tmp/', image_options: Optional[dict] = None, step: int = 1,
-    image: Optional[Any] = None
+    image: Optional[Any] = None, backend: str = 'download',
+    project: Optional[str] = None
 ) -> None:
     if image_options is None:
         image_options = {}
-    image = get_normalized_image() if image is None else image
+    SESSION.initialize(project)
+    image = SESSION.image(image)
     files = download_parts(
         area_shape, image_options, step=step, clean=False,
-        image=image, dest=dest)
+        image=image, dest=dest, backend=backend, project=project)
     merge(files, dest_raster)
@@ -4,8 +4,10 @@ Some example EE images for test downloading
 """
 # standard library
 from datetime import datetime, timedelta
-# third party
-import ee
+# project
+from falksgeo.lazy import lazy_import
+
+ee = lazy_import('ee')
 
 
 def get_image():
@@ -9,7 +9,7 @@ import re
 import shutil
 import sys
 from zipfile import ZipFile
-from .display import print_docstring
+from .display import print_docstring, profile
 
 
 def test_sources(sources):
@@ -66,6 +66,7 @@ def get_file_list(root, sources, snippet):
 
 
 @print_docstring
+@profile
 def ensure_directory(directory, empty=False):
     """
     Check whether directory exist, create if necessary
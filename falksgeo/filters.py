@@ -1,12 +1,13 @@
 """
 Filter functions
 """
-from functools import partial
 import operator
-import pyproj
-import fiona
-from shapely.geometry import shape
-from shapely.ops import transform
+from .formats import read_table
+from .lazy import lazy_import
+from .reproject import transform_geom
+
+fiona = lazy_import('fiona')
+shapely = lazy_import('shapely')
 
 
 def empty_filter(item, *args, **kwargs):
@@ -40,6 +41,13 @@ def build_filterset():
         return {int(line.strip()) for line in fil}
 
 
+def layer_filterset(filename, field='comid'):
+    """
+    Build a set of ids from a layer or table without reading geometries
+    """
+    return set(read_table(filename, [field])[field].tolist())
+
+
 def filter_by_comid(record, filterset=[]):
     """
     Filter by comids in the project
@@ -62,16 +70,12 @@ def get_shape_filter(shapefile):
     reason we are using a generator function.
     """
     with fiona.open(shapefile) as collection:
-        shp = collection[0]['geometry']
-        project = partial(
-            pyproj.transform,
-            pyproj.Proj(init=collection.crs['init']),
-            pyproj.Proj(init='epsg:4326'))
-        shp = transform(project, shape(shp))
+        shp = shapely.geometry.shape(transform_geom(
+            collection[0]['geometry'], collection.crs, 'epsg:4326'))
 
     def filter_function(item):
         if item['properties'].get('available'):
             return True
-        return shp.intersects(shape(item['geometry']))
+        return shp.intersects(shapely.geometry.shape(item['geometry']))
 
     return filter_function
@@ -0,0 +1,406 @@
+# pylint:disable=E0401
+"""
+Input and output formats. Intermediate pipeline stages can use GeoParquet
+or FlatGeobuf, Shapefiles remain the default and are used for publishing.
+"""
+import json
+import os
+import re
+import shutil
+import tempfile
+from contextlib import contextmanager
+from itertools import chain
+from .dbf import dbf_dataframe
+from .display import count_features
+from .lazy import lazy_import
+
+fiona = lazy_import('fiona')
+geopandas = lazy_import('geopandas')
+pd = lazy_import('pandas')
+pa = lazy_import('pyarrow')
+pq = lazy_import('pyarrow.parquet')
+pyogrio = lazy_import('pyogrio')
+pyproj = lazy_import('pyproj')
+shapely = lazy_import('shapely')
+
+
+# drivers derived from the file extension
+DRIVERS = {
+    '.shp': 'ESRI Shapefile',
+    '.parquet': 'Parquet',
+    '.geoparquet': 'Parquet',
+    '.fgb': 'FlatGeobuf',
+    '.gpkg': 'GPKG',
+    '.geojson': 'GeoJSON',
+    '.geojsonl': 'GeoJSONSeq'
+}
+
+DEFAULT_DRIVER = 'ESRI Shapefile'
+
+
+def get_driver(filename, driver=None):
+    """
+    Determine the driver from the file extension unless set explicitly,
+    default to ESRI Shapefile
+
+    Args:
+        filename(str): Input or output filename
+        driver(str): Explicit driver name
+    Returns:
+        str
+    """
+    if driver:
+        return driver
+    ext = os.path.splitext(filename)[1].lower()
+    return DRIVERS.get(ext, DEFAULT_DRIVER)
+
+
+def is_parquet(filename, driver=None):
+    """
+    GeoParquet is handled by GeoPandas (pyarrow) rather than GDAL
+    """
+    return get_driver(filename, driver) == 'Parquet'
+
+
+def ogr_driver(filename, driver=None, append=False):
+    """
+    Return the driver name for writing with fiona, fail early if GDAL
+    cannot write the format
+
+    Args:
+        filename(str): Output filename
+        driver(str): Explicit driver name
+        append(bool): Whether the driver needs to support appending
+    Returns:
+        str
+    """
+    driver = get_driver(filename, driver)
+    mode = 'a' if append else 'w'
+    if mode not in fiona.supported_drivers.get(driver, ''):
+        raise ValueError(
+            '{}: Format not supported for streaming output in mode {}, '
+            'use a GeoPandas based function'.format(driver, mode))
+    return driver
+
+
+def read_dataframe(filename, columns=None, where=None, **kwargs):
+    """
+    Read a layer into a GeoDataFrame through Arrow (pyogrio or pyarrow).
+    Column selection and attribute filters are pushed down to the reader,
+    fields of the filter outside of columns are read and dropped.
+
+    Args:
+        filename(str): Input filename
+        columns(list[str]): Read only these columns
+        where(str): OGR SQL WHERE clause, not available for GeoParquet
+        kwargs: Passed on to pyogrio.read_dataframe
+    Returns:
+        geopandas.GeoDataFrame
+    """
+    if is_parquet(filename):
+        if where:
+            raise ValueError('where is not supported for GeoParquet input')
+        if columns is not None and 'geometry' not in columns:
+            columns = list(columns) + ['geometry']
+        return geopandas.read_parquet(filename, columns=columns)
+    extra = _where_extra(filename, columns, where, kwargs.get('layer'))
+    if extra:
+        columns = list(columns) + extra
+    df = pyogrio.read_dataframe(
+        filename, columns=columns, where=where, use_arrow=True, **kwargs)
+    return df.drop(columns=extra)
+
+
+def where_columns(filename, where, layer=None):
+    """
+    Fields of a layer referenced by an OGR SQL WHERE clause. OGR evaluates
+    the clause after column selection, so these fields must be read.
+
+    Returns:
+        list[str]
+    """
+    if not where:
+        return []
+    if is_parquet(filename):
+        names = pq.ParquetFile(filename).schema_arrow.names
+    else:
+        names = pyogrio.read_info(filename, layer=layer)['fields']
+    tokens = {item.lower() for item in re.findall(r'[A-Za-z_]\w*', where)}
+    quoted = {item.lower() for item in re.findall(r'"([^"]+)"', where)}
+    return [
+        name for name in names if name.lower() in tokens | quoted]
+
+
+def _where_extra(filename, columns, where, layer=None):
+    if columns is None:
+        return []
+    return [
+        item for item in where_columns(filename, where, layer)
+        if item not in columns]
+
+
+def read_table(filename, columns=None):
+    """
+    Read attributes only. DBF files (and the DBF of shapefiles) are memory
+    mapped, other sources are read through Arrow skipping geometries.
+
+    Args:
+        filename(str): Input filename
+        columns(list[str]): Read only these columns
+    Returns:
+        pandas.DataFrame
+    """
+    if os.path.splitext(filename)[1].lower() in ('.shp', '.dbf'):
+        return dbf_dataframe(filename, columns)
+    if is_parquet(filename):
+        df = pd.read_parquet(filename, columns=columns)
+        return df.drop(columns='geometry', errors='ignore')
+    return pyogrio.read_dataframe(
+        filename, columns=columns, read_geometry=False, use_arrow=True)
+
+
+def frame_from_arrow(table, geometry='geometry', crs=None):
+    """
+    Convert an Arrow table or record batch with a WKB geometry column into
+    a GeoDataFrame
+    """
+    df = table.to_pandas()
+    geoms = shapely.from_wkb(df.pop(geometry).to_numpy())
+    return geopandas.GeoDataFrame(df, geometry=geoms, crs=crs)
+
+
+def _parquet_crs(parquet_file):
+    metadata = parquet_file.schema_arrow.metadata or {}
+    geo = json.loads(metadata.get(b'geo', b'{}'))
+    column = geo.get('columns', {}).get(geo.get('primary_column'), {})
+    return pyproj.CRS.from_json_dict(column['crs']) if column.get('crs') else None
+
+
+def iter_dataframes(
+    filename, chunk_size=100000, columns=None, where=None, layer=None,
+    bbox=None
+):
+    """
+    Stream a layer as GeoDataFrame chunks through Arrow in a single pass
+
+    Args:
+        filename(str): Input filename
+        chunk_size(int): Maximum number of features per chunk
+        columns(list[str]): Read only these columns, fields of where are
+            read and dropped
+        where(str): OGR SQL WHERE clause, not available for GeoParquet
+        layer(str): Layer name for multi-layer sources
+        bbox(tuple): Only features intersecting (minx, miny, maxx, maxy),
+            GeoParquet chunks are filtered after reading
+    Yields:
+        geopandas.GeoDataFrame
+    """
+    if is_parquet(filename):
+        if where:
+            raise ValueError('where is not supported for GeoParquet input')
+        parquet_file = pq.ParquetFile(filename)
+        crs = _parquet_crs(parquet_file)
+        if columns is not None and 'geometry' not in columns:
+            columns = list(columns) + ['geometry']
+        for batch in parquet_file.iter_batches(
+                batch_size=chunk_size, columns=columns):
+            df = frame_from_arrow(batch, crs=crs)
+            if bbox is not None:
+                df = df[df.geometry.intersects(shapely.box(*bbox))]
+            yield df
+        return
+    # OGR applies the where clause after column selection
+    extra = _where_extra(filename, columns, where, layer)
+    if extra:
+        columns = list(columns) + extra
+    kwargs = {
+        'layer': layer, 'columns': columns, 'where': where, 'bbox': bbox,
+        'batch_size': chunk_size, 'use_pyarrow': True}
+    with pyogrio.open_arrow(filename, **kwargs) as (meta, reader):
+        geometry = meta['geometry_name'] or 'wkb_geometry'
+        for batch in reader:
+            yield frame_from_arrow(
+                batch, geometry=geometry, crs=meta['crs']).drop(columns=extra)
+
+
+def write_dataframe(
+    df, filename, driver=None, append=False, spatial_index=False
+):
+    """
+    Write a GeoDataFrame. Appending to GeoParquet rewrites the file.
+
+    Args:
+        df(geopandas.GeoDataFrame): Data
+        filename(str): Output filename
+        driver(str): Explicit driver name, derived from filename otherwise
+        append(bool): Append to an existing layer
+        spatial_index(bool): Create a spatial index (.qix for Shapefiles)
+    """
+    driver = get_driver(filename, driver)
+    if driver == 'Parquet':
+        if append and os.path.isfile(filename):
+            df = pd.concat(
+                [geopandas.read_parquet(filename), df], ignore_index=True)
+        df.to_parquet(filename)
+    else:
+        layer_options = None
+        if spatial_index and driver == 'ESRI Shapefile':
+            layer_options = {'SPATIAL_INDEX': 'YES'}
+        pyogrio.write_dataframe(
+            df, filename, driver=driver, use_arrow=True,
+            append=append and os.path.exists(filename),
+            layer_options=layer_options)
+    count_features(len(df))
+
+
+def geometry_type(df):
+    """
+    Determine a layer geometry type from a GeoDataFrame, mixed single and
+    multi part geometries of the same kind become multi part.
+    """
+    types = set(df.geom_type.dropna().unique())
+    if len(types) == 1:
+        return types.pop()
+    kinds = {typ.replace('Multi', '') for typ in types}
+    if len(kinds) == 1:
+        return 'Multi' + kinds.pop()
+    return 'Unknown'
+
+
+def to_arrow(df):
+    """
+    Convert a GeoDataFrame into an Arrow table with WKB geometry
+    """
+    return pa.table(df.to_arrow(index=False, geometry_encoding='WKB'))
+
+
+def _geo_metadata(df):
+    crs = df.crs.to_json_dict() if df.crs else None
+    return {b'geo': json.dumps({
+        'version': '1.0.0',
+        'primary_column': df.geometry.name,
+        'columns': {df.geometry.name: {
+            'encoding': 'WKB', 'geometry_types': [], 'crs': crs}}})}
+
+
+def _conform(table, schema):
+    """
+    Cast a table to schema, columns without values take any type
+    """
+    table = table.select(schema.names)
+    for index, field in enumerate(schema):
+        column = table.column(index)
+        if column.null_count == len(column) and column.type != field.type:
+            table = table.set_column(
+                index, field.name, pa.nulls(len(column), field.type))
+    return table.cast(schema)
+
+
+def _write_parquet(reader, filename, metadata, append=False):
+    """
+    Stream record batches into GeoParquet, appending rewrites the file
+    """
+    tmp = filename + '.tmp'
+    schema = reader.schema.with_metadata(metadata)
+    with pq.ParquetWriter(tmp, schema) as writer:
+        if append and os.path.isfile(filename):
+            for batch in pq.ParquetFile(filename).iter_batches():
+                writer.write_table(
+                    pa.Table.from_batches([batch]).cast(schema))
+        for batch in reader:
+            writer.write_table(pa.Table.from_batches([batch], schema=schema))
+    os.replace(tmp, filename)
+
+
+@contextmanager
+def temporary_output(filename):
+    """
+    Write to a temporary file next to filename and move it, with the
+    sidecar files of Shapefiles, into place on success. A failure leaves
+    no partial output.
+
+    Yields:
+        str: Temporary filename
+    """
+    directory = os.path.dirname(os.path.abspath(filename))
+    tmp = tempfile.mkdtemp(prefix='.tmp_', dir=directory)
+    try:
+        yield os.path.join(tmp, os.path.basename(filename))
+        stem = os.path.splitext(os.path.basename(filename))[0]
+        for name in os.listdir(tmp):
+            if os.path.splitext(name)[0] == stem:
+                os.replace(
+                    os.path.join(tmp, name), os.path.join(directory, name))
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def write_chunks(
+    chunks, filename, driver=None, append=False, spatial_index=False,
+    geom_type=None
+):
+    """
+    Stream GeoDataFrame chunks into a single layer through Arrow. Only one
+    chunk is held in memory at a time. All chunks are cast to the schema of
+    the first chunk.
+
+    Args:
+        chunks(Iterable[geopandas.GeoDataFrame]): Data
+        filename(str): Output filename
+        driver(str): Explicit driver name, derived from filename otherwise
+        append(bool): Append to an existing layer
+        spatial_index(bool): Create a spatial index (.qix for Shapefiles)
+        geom_type(str): Layer geometry type, derived from the first chunk
+            otherwise
+    Returns:
+        int: Number of features written
+    """
+    driver = get_driver(filename, driver)
+    chunks = iter(chunks)
+    first = next(chunks, None)
+    if first is None:
+        return 0
+    table = to_arrow(first)
+    schema = table.schema
+    count = 0
+    errors = []
+
+    def batches():
+        nonlocal count
+        try:
+            for item in chain([table], (to_arrow(chunk) for chunk in chunks)):
+                try:
+                    item = _conform(item, schema)
+                except (KeyError, pa.ArrowException) as err:
+                    raise ValueError(
+                        'Chunk does not match the schema of the first '
+                        'chunk: {}'.format(err)) from err
+                count += item.num_rows
+                yield from item.to_batches()
+        except Exception as err:
+            # errors are swallowed by the Arrow stream, keep them
+            errors.append(err)
+            raise
+
+    reader = pa.RecordBatchReader.from_batches(schema, batches())
+    if driver == 'Parquet':
+        _write_parquet(reader, filename, _geo_metadata(first), append=append)
+        count_features(count)
+        return count
+    layer_options = None
+    if spatial_index and driver == 'ESRI Shapefile':
+        layer_options = {'SPATIAL_INDEX': 'YES'}
+    try:
+        pyogrio.write_arrow(
+            reader, filename, driver=driver,
+            geometry_name=first.geometry.name,
+            geometry_type=geom_type or geometry_type(first),
+            crs=first.crs.to_wkt() if first.crs else None,
+            append=append and os.path.exists(filename),
+            layer_options=layer_options)
+    except RuntimeError:
+        if errors:
+            raise errors[-1] from None
+        raise
+    count_features(count)
+    return count
@@ -0,0 +1,183 @@
+# pylint:disable=E0401
+"""
+Vectorized geometry operations on chunks of features
+"""
+from itertools import islice
+from .lazy import lazy_import
+
+fiona = lazy_import('fiona')
+np = lazy_import('numpy')
+shapely = lazy_import('shapely')
+
+
+def round_coordinates(geometries, precision):
+    """
+    Round all coordinates to a number of decimals
+
+    Args:
+        geometries(array-like): Shapely geometries
+        precision(int): Number of decimals
+    Returns:
+        np.ndarray: Shapely geometries
+    """
+    return shapely.transform(
+        np.asarray(geometries, dtype=object),
+        lambda coords: np.round(coords, precision))
+
+
+def simplify(geometries, tolerance):
+    """
+    Simplify geometries preserving topology, tolerance in CRS units
+    """
+    return shapely.simplify(
+        np.asarray(geometries, dtype=object), tolerance,
+        preserve_topology=True)
+
+
+def map_geometries(features, function, chunk_size=1000):
+    """
+    Streaming stage applying a vectorized function to the geometries of
+    chunks of features
+
+    Args:
+        features(Iterable[fiona.Feature]): Input features
+        function(Callable): Takes and returns an array of shapely
+            geometries
+        chunk_size(int): Number of features processed at once
+    Yields:
+        fiona.Feature
+    """
+    features = iter(features)
+    while True:
+        chunk = list(islice(features, chunk_size))
+        if not chunk:
+            return
+        geoms = function(np.array([
+            shapely.geometry.shape(item.geometry) if item.geometry else None
+            for item in chunk], dtype=object))
+        for item, geom in zip(chunk, geoms):
+            yield fiona.Feature(
+                geometry=fiona.Geometry.from_dict(
+                    shapely.geometry.mapping(geom))
+                if geom is not None else None,
+                properties=item.properties)
+
+
+def to_multi(geometries):
+    """
+    Promote single part geometries to multi part, multi part and missing
+    geometries are kept
+
+    Args:
+        geometries(array-like): Shapely geometries
+    Returns:
+        np.ndarray: Shapely geometries
+    """
+    geoms = np.array(geometries, dtype=object)
+    types = shapely.get_type_id(geoms)
+    for type_id, constructor in [
+        (0, shapely.multipoints), (1, shapely.multilinestrings),
+        (3, shapely.multipolygons)
+    ]:
+        single = types == type_id
+        if single.any():
+            geoms[single] = constructor(geoms[single][:, np.newaxis])
+    return geoms
+
+
+def _grid(xs, ys, bounds, bits):
+    """
+    Scale coordinates to integers on a 2**bits grid
+    """
+    xs = np.asarray(xs, dtype=float)
+    ys = np.asarray(ys, dtype=float)
+    if bounds is None:
+        bounds = (xs.min(), ys.min(), xs.max(), ys.max())
+    size = 2 ** bits - 1
+    width = max(bounds[2] - bounds[0], 1e-12)
+    height = max(bounds[3] - bounds[1], 1e-12)
+    gx = np.clip((xs - bounds[0]) / width * size, 0, size).astype(np.uint64)
+    gy = np.clip((ys - bounds[1]) / height * size, 0, size).astype(np.uint64)
+    return gx, gy
+
+
+def _spread_bits(values):
+    """
+    Insert a zero bit between each of the lower 32 bits
+    """
+    values = values & np.uint64(0x00000000FFFFFFFF)
+    for shift, mask in [
+        (16, 0x0000FFFF0000FFFF), (8, 0x00FF00FF00FF00FF),
+        (4, 0x0F0F0F0F0F0F0F0F), (2, 0x3333333333333333),
+        (1, 0x5555555555555555)
+    ]:
+        values = (values | (values << np.uint64(shift))) & np.uint64(mask)
+    return values
+
+
+def morton_codes(xs, ys, bounds=None, bits=16):
+    """
+    Z-order (Morton) codes by bit interleaving
+
+    Args:
+        xs(array-like): X coordinates
+        ys(array-like): Y coordinates
+        bounds(tuple): (minx, miny, maxx, maxy), extent of xs, ys if None
+        bits(int): Resolution of the grid per axis, up to 32
+    Returns:
+        np.ndarray(uint64)
+    """
+    gx, gy = _grid(xs, ys, bounds, bits)
+    return _spread_bits(gx) | (_spread_bits(gy) << np.uint64(1))
+
+
+def hilbert_codes(xs, ys, bounds=None, bits=16):
+    """
+    Distances along a Hilbert curve, one vectorized step per bit
+
+    Args:
+        xs(array-like): X coordinates
+        ys(array-like): Y coordinates
+        bounds(tuple): (minx, miny, maxx, maxy), extent of xs, ys if None
+        bits(int): Resolution of the grid per axis, up to 32
+    Returns:
+        np.ndarray(uint64)
+    """
+    gx, gy = _grid(xs, ys, bounds, bits)
+    codes = np.zeros(gx.shape, dtype=np.uint64)
+    last = np.uint64(2 ** bits - 1)
+    for level in range(bits - 1, -1, -1):
+        step = np.uint64(1 << level)
+        rx = (gx & step) > 0
+        ry = (gy & step) > 0
+        quadrant = (np.uint64(3) * rx.astype(np.uint64)) ^ ry.astype(np.uint64)
+        codes += step * step * quadrant
+        # rotate the quadrant
+        flip = ~ry & rx
+        gx = np.where(flip, last - gx, gx)
+        gy = np.where(flip, last - gy, gy)
+        gx, gy = np.where(~ry, gy, gx), np.where(~ry, gx, gy)
+    return codes
+
+
+CURVES = {'hilbert': hilbert_codes, 'z': morton_codes}
+
+
+def spatial_order(geometries, curve='hilbert', bits=16):
+    """
+    Order geometries along a space filling curve of their centroids
+
+    Args:
+        geometries(array-like): Shapely geometries
+        curve(str): 'hilbert' or 'z'
+        bits(int): Resolution of the grid per axis
+    Returns:
+        np.ndarray: Positions in curve order
+    """
+    if curve not in CURVES:
+        raise ValueError('{}: Unknown curve, use one of {}'.format(
+            curve, ', '.join(CURVES)))
+    centroids = shapely.centroid(np.asarray(geometries, dtype=object))
+    codes = CURVES[curve](
+        shapely.get_x(centroids), shapely.get_y(centroids), bits=bits)
+    return np.argsort(codes, kind='stable')
@@ -0,0 +1,28 @@
+"""
+Deferred imports of heavy dependencies, importing falksgeo modules stays
+fast and a dependency is only loaded by the functions using it
+"""
+import importlib
+import sys
+import types
+
+
+class LazyModule(types.ModuleType):
+    """
+    Placeholder importing the module on first attribute access
+    """
+
+    def __getattr__(self, attr):
+        module = importlib.import_module(self.__name__)
+        self.__dict__.update(module.__dict__)
+        return getattr(module, attr)
+
+
+def lazy_import(name):
+    """
+    Return the module if it is already imported, a LazyModule otherwise.
+    Use as a replacement for import statements, for example:
+
+        geopandas = lazy_import('geopandas')
+    """
+    return sys.modules.get(name) or LazyModule(name)
@@ -1,10 +1,12 @@
 """
 Functions requiring Pandas or GeoPandas
 """
-import geopandas
-import pandas as pd
+from .formats import read_table
+from .lazy import lazy_import
 from .transformations import camel_to_snake
 
+pd = lazy_import('pandas')
+
 
 def normalize_pandas_cols(df):
     """
@@ -24,9 +26,7 @@ def concat_dataframes(filenames):
     """
     for index, filename in enumerate(filenames):
         print('Reading {}'.format(filename))
-        df = normalize_pandas_cols(geopandas.read_file(filename))
+        df = normalize_pandas_cols(read_table(filename))
         ndf = pd.concat([ndf, df]) if index else df
     ndf.set_index('comid')
-    # reading with GeoPandas generates an (empty) geometry
-    # that would conflict down the road, hence dropping it
-    return ndf.drop('geometry', axis=1)
+    return ndf
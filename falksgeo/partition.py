@@ -0,0 +1,240 @@
+# pylint:disable=E0401
+"""
+Spatially partitioned execution of pipeline stages. The input is split into
+grid cells or polygons (e.g. HUCs), every partition is read with a bbox
+filter and processed by its own worker, and the parts are stitched into a
+single output.
+
+A feature belongs to the partition containing its representative point
+(shapely.point_on_surface), on shared edges to the partition with the
+lower index, so features straddling partitions are written exactly once.
+Features without geometry and features outside of all partitions are not
+written.
+"""
+import json
+import math
+import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from itertools import chain
+from .formats import (
+    is_parquet, iter_dataframes, read_dataframe, write_chunks)
+from .lazy import lazy_import
+from .pipeline import build_stages
+from .reproject import to_crs, transform_geometries
+
+np = lazy_import('numpy')
+pyogrio = lazy_import('pyogrio')
+shapely = lazy_import('shapely')
+
+# stage functions per spec, built once per worker process
+_STAGES = {}
+
+
+def grid_partitions(bounds, shape):
+    """
+    Grid cells over bounds
+
+    Args:
+        bounds(tuple): minx, miny, maxx, maxy
+        shape(int or tuple(int, int)): Number of cells, laid out close to
+            a square, or rows and columns
+    Returns:
+        list[shapely.Polygon]
+    """
+    if isinstance(shape, int):
+        cols = math.ceil(math.sqrt(shape))
+        rows = math.ceil(shape / cols)
+    else:
+        rows, cols = shape
+    xs = np.linspace(bounds[0], bounds[2], cols + 1)
+    ys = np.linspace(bounds[1], bounds[3], rows + 1)
+    return [
+        shapely.box(xs[col], ys[row], xs[col + 1], ys[row + 1])
+        for row in range(rows) for col in range(cols)]
+
+
+def layer_partitions(filename, crs=None):
+    """
+    Polygons of a layer as partitions, e.g. HUCs or counties
+
+    Args:
+        filename(str): Partition layer
+        crs: Reproject the polygons to this CRS
+    Returns:
+        list[shapely.Geometry]
+    """
+    df = read_dataframe(filename, columns=[])
+    geoms = df.geometry.values
+    if crs and df.crs and to_crs(crs) != df.crs:
+        geoms = transform_geometries(geoms, df.crs, crs)
+    return [item for item in geoms if item is not None and not item.is_empty]
+
+
+def layer_bounds(filename):
+    """
+    Total bounds of a layer
+
+    Returns:
+        tuple: minx, miny, maxx, maxy
+    """
+    if not is_parquet(filename):
+        info = pyogrio.read_info(filename, force_total_bounds=True)
+        return tuple(info['total_bounds'])
+    bounds = np.array([
+        df.total_bounds for df in iter_dataframes(filename, columns=[])])
+    return (
+        bounds[:, 0].min(), bounds[:, 1].min(),
+        bounds[:, 2].max(), bounds[:, 3].max())
+
+
+def make_partitions(inputs, partitions):
+    """
+    Partitions from a spec
+
+    Args:
+        inputs(list[str]): Input layers, a grid covers all of them
+        partitions(int or list[int] or str): Number of grid cells, grid
+            rows and columns, or a polygon layer
+    Returns:
+        list[shapely.Geometry]
+    """
+    if isinstance(partitions, str):
+        first = next(iter_dataframes(inputs[0], 1, columns=[]), None)
+        return layer_partitions(
+            partitions, crs=first.crs if first is not None else None)
+    bounds = np.array([layer_bounds(item) for item in inputs])
+    # widen the grid a little, features on the outer edges stay inside
+    minx, miny = bounds[:, 0].min(), bounds[:, 1].min()
+    maxx, maxy = bounds[:, 2].max(), bounds[:, 3].max()
+    pad = 1e-9 * max(maxx - minx, maxy - miny, 1)
+    shape = partitions if isinstance(partitions, int) else tuple(partitions)
+    return grid_partitions(
+        (minx - pad, miny - pad, maxx + pad, maxy + pad), shape)
+
+
+def owned(geometries, partition, earlier=()):
+    """
+    Mask of the geometries owned by a partition: their representative
+    point intersects the partition and none of the earlier partitions
+
+    Args:
+        geometries(np.ndarray): Shapely geometries
+        partition(shapely.Geometry): The partition
+        earlier(list[shapely.Geometry]): Neighbouring partitions with a
+            lower index
+    Returns:
+        np.ndarray: bool
+    """
+    points = shapely.point_on_surface(geometries)
+    shapely.prepare(partition)
+    mask = shapely.intersects(partition, points)
+    for other in earlier:
+        shapely.prepare(other)
+        mask &= ~shapely.intersects(other, points)
+    return mask
+
+
+def _stages(stages):
+    key = json.dumps(stages, sort_keys=True)
+    if key not in _STAGES:
+        _STAGES[key] = build_stages(stages)
+    return _STAGES[key]
+
+
+def run_partition(
+    filename, partition, earlier, part, stages=None, chunk_size=100000,
+    columns=None, where=None, layer=None
+):
+    """
+    Process the features of a partition into a part file (GeoParquet)
+
+    Args:
+        filename(str): Input layer
+        partition(shapely.Geometry): The partition, its bounds filter
+            the read
+        earlier(list[shapely.Geometry]): Neighbouring partitions with a
+            lower index
+        part(str): Part file
+        stages(list[dict]): Pipeline stages, see pipeline.build_stages
+    Returns:
+        tuple(str, int): Part file and number of features
+    """
+    transform = _stages(stages)
+    chunks = (
+        transform(df[owned(df.geometry.values, partition, earlier)])
+        for df in iter_dataframes(
+            filename, chunk_size, columns=columns, where=where, layer=layer,
+            bbox=partition.bounds))
+    return part, write_chunks(chunks, part, driver='Parquet')
+
+
+def run_partitioned(
+    inputs, output, stages=None, partitions=None, workers=None,
+    executor=None, chunk_size=100000, columns=None, where=None, layer=None,
+    driver=None, spatial_index=False, directory=None
+):
+    """
+    Run pipeline stages over spatial partitions in parallel and stitch the
+    parts into one output
+
+    Args:
+        inputs(list[str]): Input layers
+        output(str): Output layer
+        stages(list[dict]): Pipeline stages, see pipeline.build_stages
+        partitions(int or list[int] or str): Grid cells, grid rows and
+            columns, or a polygon layer. Four cells per worker if None.
+        workers(int): Processes, the number of CPUs if None
+        executor(concurrent.futures.Executor): Run the partitions on this
+            executor instead of a local process pool, e.g. the executor of
+            a Dask cluster. Part files must be on a shared file system.
+        directory(str): Directory for the part files, next to the output
+            if None
+    Returns:
+        int: Number of features written
+    """
+    inputs = [inputs] if isinstance(inputs, str) else list(inputs)
+    workers = workers or os.cpu_count()
+    geoms = make_partitions(inputs, partitions or 4 * workers)
+    tree = shapely.STRtree(geoms)
+    neighbours = [
+        [geoms[other] for other in sorted(tree.query(geom)) if other < ind]
+        for ind, geom in enumerate(geoms)]
+    tmp = tempfile.mkdtemp(
+        prefix='partitions_',
+        dir=directory or os.path.dirname(os.path.abspath(output)))
+    try:
+        tasks = [
+            (filename, geom, neighbours[ind],
+             os.path.join(tmp, '{}_{}.parquet'.format(number, ind)))
+            for number, filename in enumerate(inputs)
+            for ind, geom in enumerate(geoms)]
+        kwargs = {
+            'stages': stages, 'chunk_size': chunk_size, 'columns': columns,
+            'where': where, 'layer': layer}
+        if executor is None:
+            with ProcessPoolExecutor(workers) as pool:
+                parts = _run_tasks(pool, tasks, kwargs)
+        else:
+            parts = _run_tasks(executor, tasks, kwargs)
+        print('{} partitions processed, {} features'.format(
+            len(tasks), sum(count for _, count in parts)))
+        chunks = chain.from_iterable(
+            iter_dataframes(part, chunk_size)
+            for part, count in parts if count)
+        count = write_chunks(
+            chunks, output, driver=driver, spatial_index=spatial_index)
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+    if not count:
+        print(f'\nNo features, {output} not generated\n')
+        return count
+    print(f'\n{output} generated, {count} features\n')
+    return count
+
+
+def _run_tasks(executor, tasks, kwargs):
+    futures = [
+        executor.submit(run_partition, *task, **kwargs) for task in tasks]
+    return [future.result() for future in futures]
@@ -0,0 +1,196 @@
+"""
+Declarative pipelines, read -> filter -> remap -> annotate -> reproject ->
+write fused into a single streaming pass over chunks of features. A spec
+is a dictionary, usually loaded from JSON or YAML by the command line:
+
+    input: [data/*.shp]
+    output: out/{stem}.shp
+    where: "ftype = 'StreamRiver'"
+    stages:
+      - filter: "number > 2"
+      - remap: {rename: {number: num}, fields: [num, name]}
+      - annotate: {files: [attributes.dbf], index: comid}
+      - reproject: 4326
+    zip: true
+    parallel: 4
+
+Large inputs can be split into spatial partitions processed by a pool of
+workers, see the partition module:
+
+    partitions: 64            # grid cells, [rows, cols] or a polygon layer
+    workers: 32
+"""
+import glob
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import reduce
+from itertools import repeat
+from .formats import iter_dataframes, write_chunks
+from .pandas import concat_dataframes
+from .reproject import to_crs, transform_geometries
+from .shapefile import zip_shp
+
+
+STAGES = {}
+
+
+def stage(name):
+    """
+    Decorator: register a stage builder. A builder takes the options from
+    the spec and returns a function transforming a GeoDataFrame chunk.
+    """
+    def register(f):
+        STAGES[name] = f
+        return f
+    return register
+
+
+@stage('filter')
+def filter_stage(options):
+    """
+    Keep rows matching a pandas query expression
+    """
+    query = options['query'] if isinstance(options, dict) else options
+    return lambda df: df.query(query)
+
+
+@stage('remap')
+def remap_stage(options):
+    """
+    Rename columns {old: new} and select fields (after renaming)
+    """
+    rename = options.get('rename') or {}
+    fields = list(options.get('fields') or [])
+    if fields and 'geometry' not in fields:
+        fields.append('geometry')
+
+    def remap(df):
+        df = df.rename(columns=rename) if rename else df
+        return df[fields] if fields else df
+    return remap
+
+
+@stage('annotate')
+def annotate_stage(options):
+    """
+    Join attributes from tables sharing the index field, the tables are
+    read once per pipeline
+    """
+    index = options.get('index', 'comid')
+    attributes = concat_dataframes(options['files'])
+    if options.get('use'):
+        attributes = attributes[options['use']]
+    return lambda df: df.merge(attributes, on=index, how='left')
+
+
+@stage('reproject')
+def reproject_stage(options):
+    """
+    Reproject geometries to the CRS given as EPSG code or string
+    """
+    crs = options['crs'] if isinstance(options, dict) else options
+
+    def reproject(df):
+        return df.set_geometry(
+            transform_geometries(df.geometry.values, df.crs, crs),
+            crs=to_crs(crs))
+    return reproject
+
+
+def build_stages(specs):
+    """
+    Compose the stages of a spec into one function
+
+    Args:
+        specs(list[dict]): Stages as {name: options}, applied in order
+    Returns:
+        Callable: GeoDataFrame -> GeoDataFrame
+    """
+    functions = []
+    for item in specs or []:
+        if len(item) != 1:
+            raise ValueError('{}: A stage needs exactly one name'.format(item))
+        (name, options), = item.items()
+        if name not in STAGES:
+            raise ValueError('{}: Unknown stage, use one of {}'.format(
+                name, ', '.join(STAGES)))
+        functions.append(STAGES[name](options))
+    return lambda df: reduce(lambda acc, func: func(acc), functions, df)
+
+
+def plan_jobs(spec):
+    """
+    Expand input patterns. An output containing {stem} creates a job per
+    input, otherwise all inputs are streamed into a single output.
+
+    Returns:
+        list[tuple(list[str], str)]: Inputs and output per job
+    """
+    patterns = spec['input']
+    patterns = [patterns] if isinstance(patterns, str) else patterns
+    inputs = []
+    for pattern in patterns:
+        inputs.extend(sorted(glob.glob(pattern)) or [pattern])
+    output = spec['output']
+    if '{stem}' not in output:
+        return [(inputs, output)]
+    return [
+        ([item], output.format(
+            stem=os.path.splitext(os.path.basename(item))[0]))
+        for item in inputs]
+
+
+def run_job(spec, inputs, output):
+    """
+    Stream inputs through the stages into the output
+    """
+    print('{} => {}'.format(', '.join(inputs), output))
+    kwargs = {
+        'columns': spec.get('columns'), 'where': spec.get('where'),
+        'layer': spec.get('layer')}
+    directory = os.path.dirname(output)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    if spec.get('partitions'):
+        # the partition module builds on this one
+        from .partition import run_partitioned  # pylint:disable=C0415
+        count = run_partitioned(
+            inputs, output, stages=spec.get('stages'),
+            partitions=spec['partitions'], workers=spec.get('workers'),
+            chunk_size=spec.get('chunk_size', 100000), driver=spec.get('driver'),
+            spatial_index=spec.get('spatial_index', False), **kwargs)
+    else:
+        transform = build_stages(spec.get('stages'))
+        chunks = (
+            transform(df) for filename in inputs
+            for df in iter_dataframes(
+                filename, spec.get('chunk_size', 100000), **kwargs))
+        count = write_chunks(
+            chunks, output, driver=spec.get('driver'),
+            spatial_index=spec.get('spatial_index', False))
+    if not count:
+        print('No features, {} not generated'.format(output))
+        return output
+    if spec.get('zip'):
+        zip_shp(output)
+    print('{} generated, {} features'.format(output, count))
+    return output
+
+
+def run_pipeline(spec, parallel=None):
+    """
+    Run a pipeline spec
+
+    Args:
+        spec(dict): Pipeline spec, see module documentation
+        parallel(int): Number of processes for jobs, overrides the spec
+    Returns:
+        list[str]: Outputs
+    """
+    jobs = plan_jobs(spec)
+    parallel = spec.get('parallel') if parallel is None else parallel
+    if parallel and parallel > 1 and len(jobs) > 1:
+        inputs, outputs = zip(*jobs)
+        with ProcessPoolExecutor(parallel) as executor:
+            return list(executor.map(run_job, repeat(spec), inputs, outputs))
+    return [run_job(spec, *job) for job in jobs]
@@ -0,0 +1,437 @@
+# pylint:disable=E0401
+"""
+Raster statistics and sampling over vector features, computed block by
+block so memory stays bounded by the block size and not by the raster or
+the number of features
+"""
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from .display import print_docstring, profile
+from .formats import read_dataframe, write_dataframe
+from .lazy import lazy_import
+from .reproject import to_crs, transform_coords
+
+np = lazy_import('numpy')
+pd = lazy_import('pandas')
+rasterio = lazy_import('rasterio')
+rasterio_features = lazy_import('rasterio.features')
+rasterio_windows = lazy_import('rasterio.windows')
+shapely = lazy_import('shapely')
+
+
+def block_windows(src, size=512):
+    """
+    Windows aligned to the internal blocks of a raster, neighbouring
+    blocks are combined up to size pixels per side (strip layouts have
+    blocks one row high)
+
+    Args:
+        src(rasterio.DatasetReader): Open raster
+        size(int): Minimum window side in pixels
+    Returns:
+        list[rasterio.windows.Window]
+    """
+    block_height, block_width = src.block_shapes[0]
+    step_y = block_height * max(1, size // block_height)
+    step_x = block_width * max(1, size // block_width)
+    return [
+        rasterio_windows.Window(
+            col, row, min(step_x, src.width - col),
+            min(step_y, src.height - row))
+        for row in range(0, src.height, step_y)
+        for col in range(0, src.width, step_x)]
+
+
+class DatasetPool(object):
+    """
+    One open dataset per thread, rasterio datasets must not be shared
+    between threads
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.local = threading.local()
+        self.datasets = []
+        self.lock = threading.Lock()
+
+    def get(self):
+        """
+        The dataset of the calling thread
+        """
+        src = getattr(self.local, 'src', None)
+        if src is None:
+            src = self.local.src = rasterio.open(self.filename)
+            with self.lock:
+                self.datasets.append(src)
+        return src
+
+    def close(self):
+        """
+        Close the datasets of all threads
+        """
+        for src in self.datasets:
+            src.close()
+        self.datasets = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def block_stats(labels, values, zones, bins=None):
+    """
+    Reduce the values of a block by zone with bincount
+
+    Args:
+        labels(np.ndarray): Zone labels 0..zones-1 of the valid pixels
+        values(np.ndarray): Pixel values, same shape as labels
+        zones(int): Number of zones in the block
+        bins(np.ndarray): Histogram bin edges
+    Returns:
+        dict: Statistic -> array per zone
+    """
+    stats = {
+        'count': np.bincount(labels, minlength=zones),
+        'sum': np.bincount(labels, weights=values, minlength=zones)}
+    stats['min'] = np.full(zones, np.inf)
+    np.minimum.at(stats['min'], labels, values)
+    stats['max'] = np.full(zones, -np.inf)
+    np.maximum.at(stats['max'], labels, values)
+    if bins is not None:
+        count = len(bins) - 1
+        index = np.searchsorted(bins, values, side='right') - 1
+        # the last bin includes its right edge, like np.histogram
+        index[values == bins[-1]] = count - 1
+        inside = (index >= 0) & (index < count)
+        stats['histogram'] = np.bincount(
+            labels[inside] * count + index[inside],
+            minlength=zones * count).reshape(zones, count)
+    return stats
+
+
+def overlap_layers(geoms, tree=None, all_touched=False):
+    """
+    Split zones into layers without overlaps, every layer can be
+    rasterized in one pass. Zones sharing only a boundary go into the same
+    layer unless all_touched counts boundary pixels for both.
+
+    Returns:
+        np.ndarray: Layer per zone
+    """
+    tree = tree or shapely.STRtree(geoms)
+    first, second = tree.query(geoms, predicate='intersects')
+    pairs = first < second
+    first, second = first[pairs], second[pairs]
+    if not all_touched and len(first):
+        inner = ~shapely.touches(geoms[first], geoms[second])
+        first, second = first[inner], second[inner]
+    layers = np.zeros(len(geoms), dtype=np.int64)
+    if not len(first):
+        return layers
+    # greedy coloring in zone order, neighbours with a lower index first
+    order = np.argsort(second, kind='stable')
+    first, second = first[order], second[order]
+    zones, starts = np.unique(second, return_index=True)
+    for zone, neighbours in zip(zones, np.split(first, starts[1:])):
+        used = set(layers[neighbours].tolist())
+        layers[zone] = next(
+            layer for layer in range(len(used) + 1) if layer not in used)
+    return layers
+
+
+@print_docstring
+@profile
+def zonal_stats(
+    raster, zones, outfile=None, id_field=None, band=1, bins=None,
+    all_touched=False, window_size=512, workers=None, driver=None
+):
+    """
+    Zonal statistics of a raster band over polygon features
+
+    Zone ids are rasterized per block for the zones whose bounds touch
+    the block (STRtree query), overlapping zones in separate passes, and
+    the valid pixels are reduced with bincount. Blocks are processed on
+    threads and merged into arrays with one entry per zone.
+
+    Args:
+        raster(str): Raster file
+        zones(str): Polygon layer, reprojected to the raster CRS if needed
+        outfile(str): Write the zones with the statistics as attributes
+        id_field(str): Zone id field copied to the result
+        band(int): Raster band
+        bins(list[float]): Histogram bin edges, adds hist_<i> columns
+        all_touched(bool): Count every pixel touched by a zone, otherwise
+            only pixels with their center inside
+        window_size(int): Minimum block window side in pixels
+        workers(int): Threads, the number of CPUs if None
+        driver(str): Output driver, derived from outfile otherwise
+    Returns:
+        pandas.DataFrame: count, sum, mean, min, max (and histogram) per
+            zone, in the order of the zone layer
+    """
+    # the output keeps all attributes of the zones
+    columns = None if outfile else [id_field] if id_field else []
+    df = read_dataframe(zones, columns=columns)
+    bins = None if bins is None else np.asarray(bins, dtype=np.float64)
+    with rasterio.open(raster) as src:
+        crs = src.crs
+        windows = block_windows(src, window_size)
+        nodata = src.nodatavals[band - 1]
+    geoms = df.geometry.values
+    if crs and df.crs and to_crs(crs.to_wkt()) != df.crs:
+        geoms = df.geometry.to_crs(crs.to_wkt()).values
+    tree = shapely.STRtree(geoms)
+    layers = overlap_layers(geoms, tree, all_touched)
+    total = len(df)
+    stats = {
+        'count': np.zeros(total, dtype=np.int64),
+        'sum': np.zeros(total),
+        'min': np.full(total, np.inf),
+        'max': np.full(total, -np.inf)}
+    if bins is not None:
+        stats['histogram'] = np.zeros((total, len(bins) - 1), dtype=np.int64)
+
+    def reduce_block(pool, window):
+        src = pool.get()
+        bounds = rasterio_windows.bounds(window, src.transform)
+        candidates = tree.query(shapely.box(*bounds))
+        if not len(candidates):
+            return None
+        data = src.read(band, window=window, masked=nodata is not None)
+        valid = ~np.ma.getmaskarray(data)
+        data = np.ma.getdata(data)
+        if data.dtype.kind == 'f':
+            valid &= ~np.isnan(data)
+        block_labels, block_values = [], []
+        for layer in np.unique(layers[candidates]):
+            members = np.flatnonzero(layers[candidates] == layer)
+            labels = rasterio_features.rasterize(
+                zip(geoms[candidates[members]], members + 1),
+                out_shape=(int(window.height), int(window.width)),
+                transform=src.window_transform(window), fill=0,
+                all_touched=all_touched, dtype='int32')
+            inside = (labels > 0) & valid
+            block_labels.append(labels[inside] - 1)
+            block_values.append(data[inside])
+        return candidates, block_stats(
+            np.concatenate(block_labels),
+            np.concatenate(block_values).astype(np.float64),
+            len(candidates), bins)
+
+    with DatasetPool(raster) as pool, ThreadPoolExecutor(
+            workers or os.cpu_count()) as executor:
+        results = executor.map(
+            lambda window: reduce_block(pool, window), windows)
+        for result in results:
+            if result is None:
+                continue
+            candidates, block = result
+            stats['count'][candidates] += block['count']
+            stats['sum'][candidates] += block['sum']
+            stats['min'][candidates] = np.minimum(
+                stats['min'][candidates], block['min'])
+            stats['max'][candidates] = np.maximum(
+                stats['max'][candidates], block['max'])
+            if bins is not None:
+                stats['histogram'][candidates] += block['histogram']
+    result = zonal_frame(stats, df.index)
+    if id_field:
+        result.insert(0, id_field, df[id_field].values)
+    if outfile:
+        write_dataframe(
+            df.join(result.drop(columns=[id_field] if id_field else [])),
+            outfile, driver=driver)
+        print(f'\n{outfile} generated, {total} features\n')
+    return result
+
+
+def zonal_frame(stats, index):
+    """
+    Statistics arrays to a DataFrame, zones without pixels get a count of
+    0 and empty values
+    """
+    empty = stats['count'] == 0
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = stats['sum'] / stats['count']
+    df = pd.DataFrame({
+        'count': stats['count'],
+        'sum': stats['sum'],
+        'mean': np.where(empty, np.nan, mean),
+        'min': np.where(empty, np.nan, stats['min']),
+        'max': np.where(empty, np.nan, stats['max'])}, index=index)
+    if 'histogram' in stats:
+        for ind, column in enumerate(stats['histogram'].T):
+            df['hist_{}'.format(ind)] = column
+    return df
+
+
+def pixel_indices(transform, xs, ys):
+    """
+    Rows and columns of the pixels containing the coordinates
+
+    Returns:
+        tuple(np.ndarray, np.ndarray)
+    """
+    cols, rows = ~transform * (np.asarray(xs), np.asarray(ys))
+    with np.errstate(invalid='ignore'):
+        return (
+            np.floor(rows).astype(np.int64),
+            np.floor(cols).astype(np.int64))
+
+
+def sample_raster(raster, xs, ys, crs=None, band=1, workers=None):
+    """
+    Raster values at coordinates
+
+    Points are grouped by the internal block containing them, each block
+    is read once and its values are gathered with vectorized indexing.
+    Blocks are read on threads.
+
+    Args:
+        raster(str): Raster file
+        xs(np.ndarray): X coordinates
+        ys(np.ndarray): Y coordinates
+        crs: CRS of the coordinates, the raster CRS if None
+        band(int): Raster band
+        workers(int): Threads, the number of CPUs if None
+    Returns:
+        np.ndarray: float64 values, NaN outside of the raster and for
+            nodata
+    """
+    values = np.full(len(xs), np.nan)
+    with rasterio.open(raster) as src:
+        if crs and src.crs and to_crs(crs) != to_crs(src.crs):
+            xs, ys = transform_coords(xs, ys, crs, src.crs)
+        rows, cols = pixel_indices(src.transform, xs, ys)
+        block_height, block_width = src.block_shapes[0]
+        width, height = src.width, src.height
+    inside = np.flatnonzero(
+        (rows >= 0) & (rows < height) & (cols >= 0) & (cols < width))
+    if not len(inside):
+        return values
+    rows, cols = rows[inside], cols[inside]
+    blocks = (
+        (rows // block_height) * -(-width // block_width) +
+        cols // block_width)
+    order = np.argsort(blocks, kind='stable')
+    _, starts = np.unique(blocks[order], return_index=True)
+    groups = np.split(order, starts[1:])
+
+    def read_block(pool, group):
+        src = pool.get()
+        row0 = rows[group[0]] // block_height * block_height
+        col0 = cols[group[0]] // block_width * block_width
+        window = rasterio_windows.Window(
+            col0, row0, min(block_width, width - col0),
+            min(block_height, height - row0))
+        data = src.read(band, window=window, masked=True)
+        block = data[rows[group] - row0, cols[group] - col0]
+        return group, np.ma.filled(block.astype(np.float64), np.nan)
+
+    with DatasetPool(raster) as pool, ThreadPoolExecutor(
+            workers or os.cpu_count()) as executor:
+        for group, block in executor.map(
+                lambda group: read_block(pool, group), groups):
+            values[inside[group]] = block
+    return values
+
+
+def tile_files(tile_map, directory=None):
+    """
+    Raster files of a tile map written by chunks_to_shapefile. The
+    rasterfile attribute is resolved relative to directory, by default
+    the directory of the tile map or the stitch directory download_parts
+    creates next to it.
+
+    Returns:
+        geopandas.GeoDataFrame: Tile geometries with a path column
+    """
+    df = read_dataframe(tile_map, columns=['rasterfile'])
+    if directory is None:
+        base = os.path.dirname(tile_map)
+        stem = os.path.splitext(os.path.basename(tile_map))[0]
+        step = stem.replace('downloaded_tiles_', '').replace('.', '_')
+        candidates = [base, os.path.join(base, step)]
+        directory = next((
+            item for item in candidates
+            if any(os.path.isfile(os.path.join(item, name))
+                   for name in df['rasterfile'])), base)
+    df['path'] = [os.path.join(directory, name) for name in df['rasterfile']]
+    return df
+
+
+def sample_tiles(tile_map, xs, ys, crs=None, band=1, directory=None,
+                 workers=None):
+    """
+    Raster values at coordinates from the tiles of a tile map, see
+    sample_raster and tile_files
+
+    Returns:
+        np.ndarray: float64 values, NaN outside of the tiles and for
+            nodata
+    """
+    tiles = tile_files(tile_map, directory)
+    xs, ys = np.asarray(xs, dtype=float), np.asarray(ys, dtype=float)
+    if crs and tiles.crs and to_crs(crs) != tiles.crs:
+        txs, tys = transform_coords(xs, ys, crs, tiles.crs)
+    else:
+        txs, tys = xs, ys
+    tree = shapely.STRtree(tiles.geometry.values)
+    pairs = tree.query(shapely.points(txs, tys), predicate='intersects')
+    # points on shared edges go to the first tile
+    points, first = np.unique(pairs[0], return_index=True)
+    assigned = pairs[1][first]
+    values = np.full(len(xs), np.nan)
+    for tile in np.unique(assigned):
+        path = tiles['path'].iloc[tile]
+        if not os.path.isfile(path):
+            print(f'{path} missing')
+            continue
+        subset = points[assigned == tile]
+        values[subset] = sample_raster(
+            path, xs[subset], ys[subset], crs=crs, band=band,
+            workers=workers)
+    return values
+
+
+@print_docstring
+@profile
+def sample_points(
+    points, raster, outfile=None, field='value', band=1, directory=None,
+    workers=None, driver=None
+):
+    """
+    Sample raster values at point features
+
+    Args:
+        points(str): Point layer, e.g. from csv_to_shp
+        raster(str): Raster file, e.g. from merge, or a tile map
+            shapefile from chunks_to_shapefile
+        outfile(str): Write the points with the values as field
+        field(str): Name of the value attribute
+        band(int): Raster band
+        directory(str): Directory of the tiles of a tile map
+        workers(int): Threads, the number of CPUs if None
+        driver(str): Output driver, derived from outfile otherwise
+    Returns:
+        np.ndarray: float64 values per point, NaN outside of the raster
+            and for nodata
+    """
+    df = read_dataframe(points, columns=None if outfile else [])
+    geoms = df.geometry.values
+    xs, ys = shapely.get_x(geoms), shapely.get_y(geoms)
+    if os.path.splitext(raster)[1].lower() == '.shp':
+        values = sample_tiles(
+            raster, xs, ys, crs=df.crs, band=band, directory=directory,
+            workers=workers)
+    else:
+        values = sample_raster(
+            raster, xs, ys, crs=df.crs, band=band, workers=workers)
+    if outfile:
+        df[field] = values
+        write_dataframe(df, outfile, driver=driver)
+        print(f'\n{outfile} generated, {len(df)} features\n')
+    return values
@@ -0,0 +1,100 @@
+# pylint:disable=E0401
+"""
+Reprojection with cached transformers working on whole geometry arrays
+"""
+from functools import lru_cache
+from .geometry import map_geometries
+from .lazy import lazy_import
+
+np = lazy_import('numpy')
+pyproj = lazy_import('pyproj')
+shapely = lazy_import('shapely')
+
+
+def to_crs(crs):
+    """
+    Normalize the CRS flavors used across the package (EPSG code as int,
+    'epsg:xxxx', {'init': 'epsg:xxxx'}, WKT, fiona and pyproj CRS objects).
+
+    Returns:
+        pyproj.CRS
+    """
+    if isinstance(crs, pyproj.CRS):
+        return crs
+    if isinstance(crs, int):
+        return pyproj.CRS.from_epsg(crs)
+    if isinstance(crs, dict) and 'init' in crs:
+        return pyproj.CRS.from_user_input(crs['init'])
+    if hasattr(crs, 'to_wkt'):
+        return pyproj.CRS.from_wkt(crs.to_wkt())
+    return pyproj.CRS.from_user_input(crs)
+
+
+@lru_cache(maxsize=64)
+def _transformer(src, dst):
+    return pyproj.Transformer.from_crs(src, dst, always_xy=True)
+
+
+def get_transformer(src, dst):
+    """
+    Return a cached transformer per CRS pair, coordinates in x, y order
+    """
+    return _transformer(to_crs(src), to_crs(dst))
+
+
+def transform_coords(xs, ys, src, dst):
+    """
+    Transform coordinate arrays
+
+    Returns:
+        tuple(np.ndarray, np.ndarray)
+    """
+    return get_transformer(src, dst).transform(
+        np.asarray(xs, dtype=float), np.asarray(ys, dtype=float))
+
+
+def transform_geometries(geometries, src, dst):
+    """
+    Transform an array of shapely geometries with a single PROJ call
+
+    Args:
+        geometries(array-like): Shapely geometries, None is allowed
+        src: Source CRS
+        dst: Destination CRS
+    Returns:
+        np.ndarray: Shapely geometries
+    """
+    transformer = get_transformer(src, dst)
+
+    def transform(coords):
+        return np.column_stack(
+            transformer.transform(coords[:, 0], coords[:, 1]))
+
+    return shapely.transform(np.asarray(geometries, dtype=object), transform)
+
+
+def transform_geom(geometry, src, dst):
+    """
+    Transform a single GeoJSON-like geometry, replaces
+    fiona.transform.transform_geom
+    """
+    geom = transform_geometries(
+        [shapely.geometry.shape(geometry)], src, dst)[0]
+    return shapely.geometry.mapping(geom)
+
+
+def reproject_features(features, src, dst, chunk_size=1000):
+    """
+    Streaming reprojection stage, transforms features in chunks
+
+    Args:
+        features(Iterable[fiona.Feature]): Input features
+        src: Source CRS
+        dst: Destination CRS
+        chunk_size(int): Number of features transformed at once
+    Yields:
+        fiona.Feature
+    """
+    return map_geometries(
+        features, lambda geoms: transform_geometries(geoms, src, dst),
+        chunk_size=chunk_size)
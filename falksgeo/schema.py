@@ -0,0 +1,144 @@
+# pylint:disable=E0401
+"""
+Schema harmonization: unify fiona schemas of several layers by type
+widening and plan the casts for each layer
+"""
+from .lazy import lazy_import
+
+fiona = lazy_import('fiona')
+pd = lazy_import('pandas')
+
+# pandas dtypes holding the values of a fiona base type, nullable. Dates
+# stay dates (Arrow date32), Shapefiles cannot store datetimes.
+PANDAS_TYPES = {
+    'int': 'Int64', 'float': 'float64', 'str': 'string', 'bool': 'boolean',
+    'date': 'date32[pyarrow]', 'datetime': 'datetime64[ms]'}
+
+
+def split_type(typ):
+    """
+    Split a fiona field type into base type and width, int32 and int64
+    are both int
+
+    Returns:
+        tuple(str, str)
+    """
+    base, _, width = typ.partition(':')
+    return ('int' if base.startswith('int') else base), width
+
+
+def _widest(widths):
+    widths = [item for item in widths if item]
+    if not widths:
+        return ''
+    return max(widths, key=lambda item: [int(x) for x in item.split('.')])
+
+
+def widen_type(first, second):
+    """
+    The narrowest fiona field type holding the values of both types:
+    int < float < str, date < datetime, other mixtures become str
+    """
+    (base1, width1), (base2, width2) = split_type(first), split_type(second)
+    bases = {base1, base2}
+    if len(bases) == 1:
+        base = base1
+    elif bases == {'int', 'float'}:
+        base = 'float'
+    elif bases == {'date', 'datetime'}:
+        base = 'datetime'
+    else:
+        base = 'str'
+    width = _widest([
+        width for typ, width in [(base1, width1), (base2, width2)]
+        if typ == base])
+    return '{}:{}'.format(base, width) if width else base
+
+
+def widen_geometry(first, second):
+    """
+    Single and multi part geometries of the same kind become multi part
+    """
+    if first == second:
+        return first
+    if 'Unknown' in (first, second):
+        return 'Unknown'
+    kinds = {item.replace('3D ', '').replace('Multi', '')
+             for item in (first, second)}
+    if len(kinds) != 1:
+        raise ValueError('Incompatible geometry types {} and {}'.format(
+            first, second))
+    prefix = '3D ' if '3D' in first + second else ''
+    return prefix + 'Multi' + kinds.pop()
+
+
+def unify_schemas(schemas):
+    """
+    Unify fiona schemas, fields keep the order of their first appearance
+
+    Args:
+        schemas(list[dict]): Fiona schemas
+    Returns:
+        dict: Fiona schema
+    """
+    properties = {}
+    geometry = None
+    for schema in schemas:
+        for name, typ in schema['properties'].items():
+            properties[name] = (
+                widen_type(properties[name], typ) if name in properties
+                else typ)
+        geometry = (
+            widen_geometry(geometry, schema['geometry']) if geometry
+            else schema['geometry'])
+    return {'geometry': geometry, 'properties': properties}
+
+
+def plan_layers(layers, remap=None):
+    """
+    Read the schemas of all layers (no features) and plan the merge
+
+    Args:
+        layers(list[str]): Input layers
+        remap(Callable): Remap function, called with schema=True
+    Returns:
+        tuple(dict, crs, list[dict]): Unified schema, CRS of the first
+            layer, and a plan per layer with missing fields and whether
+            it needs to be reprojected
+    """
+    schemas, crss = [], []
+    for layer in layers:
+        with fiona.open(layer) as collection:
+            schema = collection.schema.copy()
+            crss.append(collection.crs)
+        schemas.append(remap(schema, schema=True) if remap else schema)
+    unified = unify_schemas(schemas)
+    plans = [{
+        'missing': [
+            name for name in unified['properties']
+            if name not in schema['properties']],
+        'reproject': crs != crss[0]
+    } for schema, crs in zip(schemas, crss)]
+    return unified, crss[0], plans
+
+
+def pandas_types(schema):
+    """
+    Target pandas dtypes of the fields of a fiona schema
+    """
+    return {
+        name: PANDAS_TYPES.get(split_type(typ)[0], 'object')
+        for name, typ in schema['properties'].items()}
+
+
+def conform_frame(df, dtypes, missing=()):
+    """
+    Add missing fields and cast columns to the target dtypes, one
+    vectorized cast per column that differs
+    """
+    for name in missing:
+        df[name] = pd.Series(None, index=df.index, dtype=dtypes[name])
+    for name, dtype in dtypes.items():
+        if df[name].dtype != dtype:
+            df[name] = df[name].astype(dtype)
+    return df
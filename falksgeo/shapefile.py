@@ -4,20 +4,33 @@ Utilities for shapefile manipulation.
 """
 import os
 import re
-from collections import OrderedDict
+from collections import deque, OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from itertools import chain
 from copy import deepcopy
-from csv import DictReader
-from typing import Callable
 from zipfile import ZipFile
-import fiona
-from shapely.geometry import Point, mapping
-import geopandas
-import pandas as pd
-from .display import PercentDisplay, print_docstring
+from .lazy import lazy_import
+from .display import PercentDisplay, print_docstring, profile
 from .transformations import empty
 from .files import ensure_directory
 from .filters import empty_filter
+from .formats import (
+    get_driver, is_parquet, iter_dataframes, ogr_driver, read_dataframe,
+    read_table, temporary_output, write_chunks, write_dataframe)
 from .pandas import concat_dataframes
+from .geometry import (
+    map_geometries, round_coordinates, simplify, spatial_order, to_multi)
+from .reproject import to_crs, transform_geometries
+from .schema import (
+    PANDAS_TYPES, conform_frame, pandas_types, plan_layers, widen_type)
+from .sorting import external_sort
+
+fiona = lazy_import('fiona')
+geopandas = lazy_import('geopandas')
+np = lazy_import('numpy')
+pd = lazy_import('pandas')
+pyogrio = lazy_import('pyogrio')
+shapely = lazy_import('shapely')
 
 
 def select_fields(dic:dict, fields:list[str]) -> dict:
@@ -39,62 +52,178 @@ def select_fields(dic:dict, fields:list[str]) -> dict:
     return new_dic
 
 
-def create_remap(attributes) -> Callable:
+# Python and pandas types for casts given as fiona field types
+CASTS = {
+    'int': (int, 'Int64'), 'float': (float, 'float64'), 'str': (str, 'string')}
+
+
+class Remap(object):
+    """
+    A remap function compiled from the input schema. Keys are lowercased
+    and filtered by attributes, then renamed, cast and extended by computed
+    fields. Calling it with a schema compiles the key plan once, records
+    are remapped by plain lookups afterwards, frame applies the same remap
+    to a whole GeoDataFrame.
+
+    Args:
+        attributes(list[str]): Lowercase fields to keep
+        rename(dict): {lowercase field: new name}
+        casts(dict): {new name: fiona type}, e.g. 'int' or 'str:20'
+        computed(dict): {new name: (function, fiona type)}, the function
+            gets a record's properties or a DataFrame (after remapping)
+    """
+
+    def __init__(self, attributes, rename=None, casts=None, computed=None):
+        self.attributes = set(attributes)
+        self.rename = rename or {}
+        self.casts = casts or {}
+        self.computed = computed or {}
+        self.plan = None
+
+    def compile(self, keys):
+        """
+        Compile the (old key, new key) plan for the keys of a layer
+        """
+        self.plan = [
+            (key, self.rename.get(key.lower(), key.lower())) for key in keys
+            if key.lower() in self.attributes]
+        return self.plan
+
+    def __call__(self, record:dict, schema:bool=False) -> dict:
+        """
+        Remap a record or a fiona schema (schema=True)
+        """
+        props = record['properties']
+        if schema:
+            new = OrderedDict(
+                (new, self.casts.get(new, props[old]))
+                for old, new in self.compile(props))
+            for name, (_, typ) in self.computed.items():
+                new[name] = typ
+        else:
+            try:
+                new = {new: props[old] for old, new in self.plan}
+            except (KeyError, TypeError):
+                new = {new: props[old] for old, new in self.compile(props)}
+            for name, typ in self.casts.items():
+                if new.get(name) is not None:
+                    new[name] = CASTS[typ.split(':')[0]][0](new[name])
+            for name, (function, _) in self.computed.items():
+                new[name] = function(new)
+        return {'geometry': record.get('geometry'), 'properties': new}
+
+    def frame(self, df):
+        """
+        Vectorized remap of a (Geo)DataFrame, can be passed to copy_shp as
+        vectorized_remap
+        """
+        geometry = (
+            df.geometry.name if isinstance(df, geopandas.GeoDataFrame)
+            else None)
+        plan = [
+            (col, self.rename.get(col.lower(), col.lower()))
+            for col in df.columns
+            if col != geometry and col.lower() in self.attributes]
+        columns = [old for old, _ in plan] + ([geometry] if geometry else [])
+        df = df[columns].rename(columns=dict(plan))
+        for name, typ in self.casts.items():
+            df[name] = df[name].astype(CASTS[typ.split(':')[0]][1])
+        for name, (function, _) in self.computed.items():
+            df[name] = function(df)
+        return df
+
+
+def remap_frame(remap, df):
+    """
+    Apply a remap function to a GeoDataFrame, vectorized for Remap
+    objects, record by record for other remap functions
+    """
+    if remap is empty:
+        return df
+    if hasattr(remap, 'frame'):
+        return remap.frame(df)
+    geometry = df.geometry.name
+    records = [
+        remap({'geometry': None, 'properties': props})['properties']
+        for props in df.drop(columns=geometry).to_dict('records')]
+    return geopandas.GeoDataFrame(
+        pd.DataFrame(records, index=df.index),
+        geometry=df.geometry.values, crs=df.crs)
+
+
+def create_remap(attributes, rename=None, casts=None, computed=None) -> Remap:
     """
     Create a mapping function from an attribute list and ensure compatible
     schema across input layers.
 
     Args:
         attributes(dict): A dictionary with keys.
+        rename(dict): {lowercase field: new name}
+        casts(dict): {new name: fiona type}
+        computed(dict): {new name: (function, fiona type)}, e.g.
+            {'display': (calculate_display_value, 'int')}
     Returns:
-        Callable
+        Remap
     """
+    return Remap(attributes, rename=rename, casts=casts, computed=computed)
 
-    def remap(record:dict, schema:bool=False) -> dict:
-        """
-        An example renap function.
-
-        Args:
-            record(dict): A GeoJSON or a Fiona schema dict
-            schema(bool): Flag indicating that a schema is remapped, only
-                needed when new fields are created.
-        Returns:
-            dict
-        """
-        del schema
-        new_record = OrderedDict([
-            ('geometry', record['geometry']), ('properties', OrderedDict())])
-        for item in record['properties']:
-            newkey = item.lower()
-            if newkey in attributes:
-                new_record['properties'][newkey] = record['properties'][item]
-        return new_record
 
-    return remap
+def _check_fiona_input(filename):
+    if is_parquet(filename):
+        raise ValueError(
+            '{}: GeoParquet input is not supported'.format(filename))
 
 
 @print_docstring
+@profile
 def copy_layer(
     inputname, outputname, append=False, remap_function=empty,
     filter_function=empty_filter, filter_kwargs=None,
-    fields=None, layer=None, limit=None
+    fields=None, layer=None, limit=None, driver=None, reproject=None,
+    simplify_tolerance=None, precision=None, chunk_size=1000,
+    spatial_sort=None, spatial_index=False
 ):
     """
     Copy, remap, and filter a shapefile
+
+    Geometry stages run on chunks of features after filtering in the order
+    reproject, simplify (tolerance in output CRS units), and rounding
+    coordinates to precision decimals.
+
+    spatial_sort ('hilbert' or 'z') writes features in the order of a
+    space filling curve through their centroids. Geometries are read in a
+    first pass, features are then fetched by id. spatial_index creates a
+    .qix index for new Shapefiles.
+
+    Features are read with fiona, GeoParquet input is not supported, use
+    copy_shp instead.
     """
+    _check_fiona_input(inputname)
     filter_kwargs = filter_kwargs if filter_kwargs else {}
     print(f'{inputname} => {outputname}')
+    fids = None
+    if spatial_sort:
+        geoms = pyogrio.read_dataframe(
+            inputname, layer=layer, columns=[], fid_as_index=True)
+        fids = geoms.index[
+            spatial_order(geoms.geometry.values, spatial_sort)].tolist()
     with fiona.open(inputname, layer=layer) as collection:
         percentage = PercentDisplay(collection, limit=limit)
         schema = remap_function(collection.schema.copy(), schema=True)
         schema = select_fields(schema.copy(), fields)
         kwargs = {
             'mode': 'a' if append else 'w',
-            'driver': 'ESRI Shapefile',
+            'driver': ogr_driver(outputname, driver, append=append),
             'schema': schema,
-            'crs': collection.crs}
-        with fiona.open(outputname, **kwargs) as output:
-            for item in collection:
+            'crs': to_crs(reproject).to_wkt() if reproject else collection.crs}
+        if spatial_index and kwargs['driver'] == 'ESRI Shapefile':
+            kwargs['SPATIAL_INDEX'] = 'YES'
+        source = (
+            collection if fids is None else
+            (collection[fid] for fid in fids))
+
+        def features():
+            for item in source:
                 try:
                     percentage.inc()
                 except StopIteration:
@@ -110,7 +239,24 @@ def copy_layer(
                     properties=fiona.Properties.from_dict(
                         item.get('properties')))
                 if filter_function(new_item, **filter_kwargs):
-                    output.write(new_item)
+                    yield new_item
+
+        def geometries(geoms):
+            if reproject:
+                geoms = transform_geometries(geoms, collection.crs, reproject)
+            if simplify_tolerance:
+                geoms = simplify(geoms, simplify_tolerance)
+            if precision is not None:
+                geoms = round_coordinates(geoms, precision)
+            return geoms
+
+        with fiona.open(outputname, **kwargs) as output:
+            items = features()
+            if reproject or simplify_tolerance or precision is not None:
+                items = map_geometries(
+                    items, geometries, chunk_size=chunk_size)
+            for item in items:
+                output.write(item)
         percentage.display()
     print(f'\n{outputname} generated\n')
 
@@ -118,168 +264,466 @@ def copy_layer(
 def copy_shp(
     inputname, outputname, append=False, remap=None, remap_function=None,
     filter_function=None, fields=None, sort=None,
-    reproject=None
+    reproject=None, driver=None, where=None, vectorized_remap=None,
+    sort_chunk_size=None, spatial_sort=None, spatial_index=False
 ):
     """
     Copy, remap, and filter a shapefile using GeoPandas
+
+    Args:
+        inputname(str): Input layer
+        outputname(str): Output layer
+        append(bool): Append to an existing output
+        remap(dict): Rename columns {old: new}
+        remap_function(Callable): Row-wise remap, slow fallback
+        filter_function(Callable): Row-wise filter, slow fallback
+        fields(list[str]): Output fields (after remap)
+        sort(list[str]): Sort by these fields (after remap)
+        reproject(int|str): Output CRS
+        driver(str): Output driver, derived from outputname otherwise
+        where(str): OGR SQL WHERE clause evaluated while reading
+        vectorized_remap(Callable): Function applied to the GeoDataFrame
+            after remap
+        sort_chunk_size(int): Sort out-of-core, processing the input in
+            chunks of this size and spilling sorted runs to disk
+        spatial_sort(str): Order features along a 'hilbert' or 'z' curve
+            through their centroids, instead of sort
+        spatial_index(bool): Create a spatial index (.qix for Shapefiles)
     """
+    if sort and spatial_sort:
+        raise ValueError('Use either sort or spatial_sort')
     fields = fields if fields else []
     sort = sort if sort else []
     fields = fields.copy()
     print(f'{inputname} => {outputname}')
-    df = geopandas.read_file(inputname)
+    columns = None
+    if fields and not (remap_function or filter_function or vectorized_remap):
+        # read only required columns, fields refer to names after remap
+        inverse = {value: key for key, value in (remap or {}).items()}
+        columns = [
+            inverse.get(item, item) for item in fields + sort
+            if item != 'geometry']
+    if fields and 'geometry' not in fields:
+        fields.append('geometry')
+
+    # row-wise stages, can run on chunks
+    def transform(df):
+        if remap:
+            df = df.rename(columns=remap)
+        if vectorized_remap:
+            df = vectorized_remap(df)
+        if remap_function:
+            # remap function might swallow crs
+            crs = df.crs
+            df = df.apply(remap_function, axis=1)
+            df.set_crs(crs)
+        if filter_function:
+            df = df[df.apply(filter_function, axis=1, result_type='reduce')]
+        if reproject:
+            df = df.set_geometry(
+                transform_geometries(df.geometry.values, df.crs, reproject),
+                crs=to_crs(reproject))
+        return df
+
+    def select(df):
+        return df[fields] if fields else df
+
+    if sort and sort_chunk_size:
+        frames = [iter_dataframes(
+            inputname, sort_chunk_size, columns=columns, where=where)]
+        if append and os.path.isfile(outputname):
+            frames.append(iter_dataframes(outputname, sort_chunk_size))
+        chunks = external_sort(
+            (transform(df) for df in chain(*frames)), sort,
+            chunk_size=sort_chunk_size)
+        count = write_chunks(
+            (select(df) for df in chunks), outputname, driver=driver,
+            spatial_index=spatial_index)
+        if not count and not os.path.exists(outputname):
+            print(f'\nNo features, {outputname} not generated\n')
+            return
+        print(f'\n{outputname} generated\n')
+        return
+    df = read_dataframe(inputname, columns=columns, where=where)
     if append and os.path.isfile(outputname):
-        edf = geopandas.read_file(outputname)
+        edf = read_dataframe(outputname)
         df = pd.concat([df, edf], ignore_index=True)
-    if remap:
-        df = df.rename(columns=remap)
-    if remap_function:
-        # remap function might swallow crs
-        crs = df.crs
-        df = df.apply(remap_function, axis=1)
-        df.set_crs(crs)
-    if filter_function:
-        df = df[df.apply(filter_function, axis=1, result_type='reduce')]
+    df = transform(df)
     if sort:
         df.sort_values(by=sort, inplace=True)
         df.reset_index(drop=True, inplace=True)
-    if fields:
-        if 'geometry' not in fields:
-            fields.append('geometry')
-        df = df[fields]
-    if isinstance(reproject, int):
-        reproject = f'epsg:{reproject}'
-    if reproject:
-        df = df.to_crs(reproject)
-    df.to_file(outputname, driver='ESRI Shapefile')
+    if spatial_sort:
+        df = df.iloc[spatial_order(df.geometry.values, spatial_sort)]
+        df = df.reset_index(drop=True)
+    write_dataframe(
+        select(df), outputname, driver=driver, spatial_index=spatial_index)
     print(f'\n{outputname} generated\n')
 
 
 @print_docstring
+@profile
 # This is too convoluted, TODO: slate for removal
 def create_variable(
     inputname, outputname, ref, variable='available', value=1, default=None,
-    index='comid'):
+    index='comid', driver=None):
     """
-    Add a new variable to the dataset by partitioning a lookup table
+    Add a new variable to the dataset from a lookup of ids
+
+    GeoParquet input is not supported.
     """
-    prt = 500
-    reference = [[] for i in range(0, prt)]
-    for item in ref:
-        batch = item % prt
-        reference[batch].append(item)
+    _check_fiona_input(inputname)
+    # ids are read without geometries and matched at once
+    ids = read_table(inputname, [index])[index].to_numpy()
+    matches = np.isin(ids, np.asarray(list(ref)))
     with fiona.open(inputname) as collection:
         percent = PercentDisplay(collection)
         schema = collection.schema.copy()
         schema['properties'][variable] = 'int:1'
-        args = 'w', 'ESRI Shapefile', schema
+        args = 'w', ogr_driver(outputname, driver), schema
         with fiona.open(outputname, *args, crs=collection.crs) as out:
-            for item in collection:
+            for item, match in zip(collection, matches):
                 percent.inc()
-                new_item = item.copy()
-                props = new_item['properties']
-                try:
-                    batch = props[index] % prt
-                    reference[batch].remove(props[index])
+                props = dict(item.properties)
+                if match:
                     props[variable] = value
-                except ValueError:
-                    if default is not None:
-                        props[variable] = default
-                out.write(new_item)
+                elif default is not None:
+                    props[variable] = default
+                out.write(fiona.Feature(
+                    geometry=item.geometry,
+                    properties=fiona.Properties.from_dict(props)))
 
 
 @print_docstring
-def merge_layers(input_layers, outputfile, remap=empty, debug=False):
+@profile
+def merge_layers(
+    input_layers, outputfile, remap=empty, driver=None, chunk_size=100000
+):
     """
     Merge layers into a single layer
+
+    The schemas of all inputs are read first and unified by type widening
+    (int < float < str), fields missing in an input are left empty and
+    inputs in another CRS are reprojected to the CRS of the first. The
+    data is then streamed in chunks with vectorized casts, incompatible
+    inputs fail before anything is written.
     """
-    for index, layer in enumerate(input_layers):
-        append = True if index else False
-        kwargs = {'append': append, 'remap_function': remap}
-        copy_layer(layer, outputfile, **kwargs, debug=debug)
+    schema, crs, plans = plan_layers(input_layers, remap)
+    dtypes = pandas_types(schema)
+
+    def chunks():
+        for layer, plan in zip(input_layers, plans):
+            print(layer)
+            for df in iter_dataframes(layer, chunk_size):
+                df = remap_frame(remap, df)
+                if plan['reproject']:
+                    df = df.set_geometry(
+                        transform_geometries(df.geometry.values, df.crs, crs),
+                        crs=to_crs(crs))
+                if 'Multi' in schema['geometry']:
+                    df = df.set_geometry(
+                        to_multi(df.geometry.values), crs=df.crs)
+                df = conform_frame(df, dtypes, plan['missing'])
+                yield df[list(dtypes) + [df.geometry.name]]
 
+    count = write_chunks(
+        chunks(), outputfile, driver=driver, geom_type=schema['geometry'])
+    print(f'\n{outputfile} generated, {count} features\n')
 
-def annotate(infile, annotation_files, outfile, index='comid', use=None):
+
+def annotate(
+    infile, annotation_files, outfile, index='comid', use=None, driver=None
+):
     """
     Annotate additional properties using GeoPandas
     """
-    df = geopandas.read_file(infile)
+    df = read_dataframe(infile)
     df.set_index(index)
     attributes = concat_dataframes(annotation_files)
     if use:
         attributes = attributes[use]
     ndf = df.merge(attributes, on=index, how='left')
-    ndf.to_file(outfile, driver='ESRI Shapefile')
+    write_dataframe(ndf, outfile, driver=driver)
+
+
+def spatial_join(df, tree, attributes, predicate='intersects',
+                 max_distance=None):
+    """
+    Join the attributes of the first matching tree geometry to each row
+
+    Args:
+        df(geopandas.GeoDataFrame): Target features
+        tree(shapely.STRtree): Tree over the annotation geometries
+        attributes(pandas.DataFrame): Annotation attributes in tree order
+        predicate(str): 'nearest' or a predicate of STRtree.query
+            evaluated as predicate(target, annotation)
+        max_distance(float): Search radius for nearest
+    Returns:
+        geopandas.GeoDataFrame
+    """
+    geoms = df.geometry.values
+    if predicate == 'nearest':
+        pairs = tree.query_nearest(geoms, max_distance=max_distance)
+    else:
+        pairs = tree.query(geoms, predicate=predicate)
+    # first match per feature, by lowest annotation position
+    order = np.lexsort((pairs[1], pairs[0]))
+    targets, first = np.unique(pairs[0][order], return_index=True)
+    matched = attributes.iloc[pairs[1][order][first]].set_axis(
+        df.index[targets])
+    return df.join(matched, rsuffix='_1')
+
+
+def _bounded_map(executor, function, items, size):
+    """
+    Ordered map with at most size pending items
+    """
+    pending = deque()
+    for item in items:
+        pending.append(executor.submit(function, item))
+        if len(pending) >= size:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+@print_docstring
+@profile
+def annotate_spatial(
+    infile, annotation_file, outfile, predicate='intersects', fields=None,
+    max_distance=None, chunk_size=100000, workers=None, driver=None
+):
+    """
+    Annotate properties by location
+
+    The annotation layer is loaded once into an STRtree, the input is
+    streamed in chunks queried in bulk on threads (shapely releases the
+    GIL). Features get the attributes of their first match, nearest
+    matches farther than max_distance are left empty.
+
+    Args:
+        infile(str): Input layer
+        annotation_file(str): Layer with the attributes, usually the
+            smaller one, e.g. HUCs or counties
+        outfile(str): Output layer
+        predicate(str): 'intersects', 'within', 'contains', ... or
+            'nearest'
+        fields(list[str]): Annotation fields, all if None
+        max_distance(float): Search radius for nearest, in CRS units of
+            the input
+        chunk_size(int): Features per chunk
+        workers(int): Threads, the number of CPUs if None
+        driver(str): Output driver, derived from outfile otherwise
+    Returns:
+        int: Number of features written
+    """
+    annotation = read_dataframe(annotation_file, columns=fields)
+    crs = pyogrio.read_info(infile)['crs']
+    if crs and annotation.crs and to_crs(crs) != annotation.crs:
+        annotation = annotation.to_crs(crs)
+    tree = shapely.STRtree(annotation.geometry.values)
+    attributes = pd.DataFrame(annotation.drop(columns=annotation.geometry.name))
+    # nullable types keep the column types of chunks with and without matches
+    for col in attributes.columns:
+        if pd.api.types.is_integer_dtype(attributes[col]):
+            attributes[col] = attributes[col].astype('Int64')
+        elif pd.api.types.is_bool_dtype(attributes[col]):
+            attributes[col] = attributes[col].astype('boolean')
+    workers = workers or os.cpu_count()
+
+    def join(df):
+        return spatial_join(
+            df, tree, attributes, predicate=predicate,
+            max_distance=max_distance)
+
+    with ThreadPoolExecutor(workers) as executor:
+        chunks = _bounded_map(
+            executor, join, iter_dataframes(infile, chunk_size), 2 * workers)
+        count = write_chunks(chunks, outfile, driver=driver)
+    print(f'\n{outfile} generated, {count} features\n')
+    return count
 
 
 @print_docstring
-def annotate_file(infiles, outfile, index='comid'):
+@profile
+def annotate_file(infiles, outfile, index='comid', driver=None):
     """
     Annotate attributes from one file by another using index
     """
     infile = infiles[0]
     annotationfile = infiles[1]
-    df = geopandas.read_file(infile)
+    df = read_dataframe(infile)
     df.set_index(index)
-    attributes = pd.read_csv(annotationfile, index_col=0)
+    if annotationfile.lower().endswith('.csv'):
+        attributes = pd.read_csv(annotationfile, index_col=0)
+    else:
+        attributes = read_table(annotationfile)
     ndf = df.merge(attributes, on=index, how='left')
-    ndf.to_file(outfile, driver='ESRI Shapefile')
+    write_dataframe(ndf, outfile, driver=driver)
+
+
+def shapefile_types(df):
+    """
+    Map column types Shapefiles cannot store, one vectorized conversion per
+    column: datetimes become text, int64 becomes int32 where the values
+    fit, long text is truncated to 254 characters, and binary columns are
+    dropped.
+    """
+    geometry = df.geometry.name if 'geometry' in df else None
+    for col in df.columns:
+        values = df[col]
+        if col == geometry:
+            continue
+        if pd.api.types.is_datetime64_any_dtype(values):
+            df[col] = values.dt.strftime('%Y-%m-%d %H:%M:%S')
+        elif pd.api.types.is_integer_dtype(values):
+            if values.min() >= -2 ** 31 and values.max() < 2 ** 31:
+                nullable = pd.api.types.is_extension_array_dtype(values)
+                df[col] = values.astype('Int32' if nullable else 'int32')
+        elif isinstance(next(iter(values.dropna()), None), bytes):
+            print('Dropping binary column {}'.format(col))
+            df = df.drop(columns=col)
+        elif pd.api.types.is_string_dtype(values):
+            df[col] = values.str.slice(0, 254)
+    return df
 
 
 @print_docstring
-def gdb_to_shp(source_path, dest_path, layer=None):
+@profile
+def gdb_to_shp(source_path, dest_path, layer=None, driver=None):
     """
     Extract Shapefile from GDB
     """
     if not layer:
-        return
+        return None
     ensure_directory(os.path.split(dest_path)[0])
-    with fiona.open(source_path, layer=layer) as collection:
-        meta = collection.meta
-        meta['driver'] = 'ESRI Shapefile'
-        print(meta['schema'])
-        # extract incompatible types from schema and convert to string
-        incompatible = []
-        fields = meta['schema']['properties']
-        for item in fields:
-            if fields[item] in ['datetime']:
-                fields[item] = 'str:255'
-                incompatible.append(item)
-        # print(incompatible)
-        with fiona.open(dest_path, 'w', **meta) as shp:
-            for item in collection:
-                for key in item:
-                    if key in incompatible:
-                        item[key] = str(item[key])
-                shp.write(item)
+    df = read_dataframe(source_path, layer=layer)
+    if get_driver(dest_path, driver) == 'ESRI Shapefile':
+        df = shapefile_types(df)
+    write_dataframe(df, dest_path, driver=driver)
+    return dest_path
+
+
+def list_layers(source_path):
+    """
+    List the layer names in a GDB or any other multi-layer source
+    """
+    return [item[0] for item in pyogrio.list_layers(source_path)]
+
+
+def extract_gdb(
+    source_path, dest_dir, layers=None, extension='.shp', driver=None,
+    processes=None
+):
+    """
+    Extract several or all layers from a GDB in parallel processes
+
+    Args:
+        source_path(str): The GDB
+        dest_dir(str): Output directory, outputs are named after the layers
+        layers(list[str]): Layers to extract, all layers if None
+        extension(str): Output file extension determining the format
+        driver(str): Explicit output driver
+        processes(int): Number of worker processes, defaults to CPU count
+    Returns:
+        list[str]: Output filenames
+    """
+    layers = layers or list_layers(source_path)
+    ensure_directory(dest_dir)
+    dest_paths = [
+        os.path.join(dest_dir, layer + extension) for layer in layers]
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        futures = [
+            executor.submit(
+                gdb_to_shp, source_path, dest_path, layer=layer,
+                driver=driver)
+            for layer, dest_path in zip(layers, dest_paths)]
+        return [future.result() for future in futures]
+
+
+def _value_type(values):
+    """
+    Fiona base type of the values of a CSV column, text holding ISO dates
+    (YYYY-MM-DD) are dates
+    """
+    if pd.api.types.is_bool_dtype(values):
+        return 'bool'
+    if pd.api.types.is_integer_dtype(values):
+        return 'int'
+    if pd.api.types.is_float_dtype(values):
+        return 'float'
+    if values.astype(str).str.match(r'^\d{4}-\d{2}-\d{2}$').all():
+        return 'date'
+    return 'str'
+
+
+def csv_types(source_path, chunksize=100000, dtype=None, skip=()):
+    """
+    Infer the column types of a CSV over all chunks, types found in
+    different chunks are widened (int < float < str, dates and text are
+    text), columns without values are text
+
+    Args:
+        source_path(str): CSV file
+        chunksize(int): Number of rows inferred at once
+        dtype(dict): Columns with a given type, not inferred
+        skip(list[str]): Columns not inferred
+    Returns:
+        dict: pandas dtypes by column
+    """
+    skip = set(skip) | set(dtype or {})
+    types = {}
+    for chunk in pd.read_csv(source_path, chunksize=chunksize, dtype=dtype):
+        for col in [item for item in chunk.columns if item not in skip]:
+            values = chunk[col].dropna()
+            if values.empty:
+                types.setdefault(col, None)
+                continue
+            typ = _value_type(values)
+            types[col] = widen_type(types[col], typ) if types.get(
+                col) else typ
+    return {col: PANDAS_TYPES[typ or 'str'] for col, typ in types.items()}
 
 
 def csv_to_shp(
-    source_path, dest_path, x_field='x', y_field='y', crs='epsg:4326'
+    source_path, dest_path, x_field='x', y_field='y', crs='epsg:4326',
+    driver=None, chunksize=100000, dtype=None, spatial_index=False
 ):
     """
     Convert a point csv with x and y coordinates into a shapefile
+
+    Args:
+        source_path(str): CSV file
+        dest_path(str): Output layer
+        x_field(str): Column with x coordinates
+        y_field(str): Column with y coordinates
+        crs(str): CRS of the coordinates
+        driver(str): Output driver, derived from dest_path otherwise
+        chunksize(int): Number of rows converted at once
+        dtype(dict): Override inferred column types, types are inferred
+            from all rows in a first pass otherwise, see csv_types
+        spatial_index(bool): Create a spatial index (.qix for Shapefiles)
     """
     print('Converting {} into a shapefile'.format(source_path))
-    with open(source_path) as src:
-        reader = DictReader(src)
-        property_names = reader.fieldnames.copy()
-        [property_names.remove(item) for item in [x_field, y_field]]
-        schema = {
-            'geometry': 'Point',
-            'properties': {item:'str' for item in property_names}}
-        meta = {'driver': 'ESRI Shapefile', 'crs': crs, 'schema': schema}
-        with fiona.open(dest_path, 'w', **meta) as shp:
-            for item in reader:
-                geometry = mapping(
-                    Point(float(item.pop(x_field)),
-                          float(item.pop(y_field))))
-                shp.write({
-                    'geometry': geometry,
-                    'properties': item})
+    types = csv_types(
+        source_path, chunksize, dtype, skip=(x_field, y_field))
+    types.update(dtype or {})
+
+    def chunks():
+        reader = pd.read_csv(source_path, chunksize=chunksize, dtype=types)
+        for chunk in reader:
+            geometry = shapely.points(
+                chunk.pop(x_field).to_numpy(dtype=float),
+                chunk.pop(y_field).to_numpy(dtype=float))
+            yield geopandas.GeoDataFrame(chunk, geometry=geometry, crs=crs)
+
+    with temporary_output(dest_path) as filename:
+        write_chunks(
+            chunks(), filename, driver=get_driver(dest_path, driver),
+            spatial_index=spatial_index, geom_type='Point')
 
 
 @print_docstring
+@profile
 def zip_shp(shp_name):
     """
     Zip shapefile including all components.
@@ -0,0 +1,103 @@
+# pylint:disable=E0401
+"""
+Out-of-core sorting of layers. Chunks are sorted in memory, spilled as
+GeoParquet runs, and merged with a heap.
+"""
+import heapq
+from itertools import count, groupby
+import os
+import tempfile
+from .formats import frame_from_arrow
+from .lazy import lazy_import
+
+pa = lazy_import('pyarrow')
+pq = lazy_import('pyarrow.parquet')
+
+
+def _key(values):
+    # sort missing values last and never compare None to a value
+    return tuple((val is None, val) for val in values)
+
+
+def spill_runs(frames, by, directory):
+    """
+    Sort chunks in memory and spill them as GeoParquet runs
+
+    Args:
+        frames(Iterable[geopandas.GeoDataFrame]): Chunks
+        by(list[str]): Sort keys
+        directory(str): Directory for the runs
+    Returns:
+        tuple(list[str], crs): Run filenames and the CRS of the chunks
+    """
+    runs = []
+    crs = None
+    for index, df in enumerate(frames):
+        if df.empty:
+            continue
+        crs = df.crs
+        df = df.sort_values(by=by, kind='stable', na_position='last')
+        filename = os.path.join(directory, 'run_{}.parquet'.format(index))
+        df.to_parquet(filename, index=False)
+        runs.append(filename)
+    return runs, crs
+
+
+def _run_rows(run_id, filename, by, batch_size):
+    seq = count()
+    for batch in pq.ParquetFile(filename).iter_batches(batch_size=batch_size):
+        keys = zip(*[batch.column(key).to_pylist() for key in by])
+        for row, key in enumerate(keys):
+            yield _key(key), run_id, next(seq), batch, row
+
+
+def _assemble(buffer, crs):
+    # take consecutive rows from the same batch at once
+    tables = []
+    for _, group in groupby(buffer, key=lambda item: id(item[0])):
+        group = list(group)
+        rows = pa.array([row for _, row in group])
+        tables.append(pa.Table.from_batches([group[0][0].take(rows)]))
+    table = pa.concat_tables(tables, promote_options='permissive')
+    return frame_from_arrow(table, crs=crs)
+
+
+def merge_runs(runs, by, crs=None, chunk_size=100000):
+    """
+    Merge sorted runs, reading each run in batches
+
+    Yields:
+        geopandas.GeoDataFrame: Sorted chunks of up to chunk_size rows
+    """
+    if not runs:
+        return
+    batch_size = max(1, chunk_size // len(runs))
+    streams = [
+        _run_rows(run_id, filename, by, batch_size)
+        for run_id, filename in enumerate(runs)]
+    buffer = []
+    for _, _, _, batch, row in heapq.merge(*streams):
+        buffer.append((batch, row))
+        if len(buffer) >= chunk_size:
+            yield _assemble(buffer, crs)
+            buffer = []
+    if buffer:
+        yield _assemble(buffer, crs)
+
+
+def external_sort(frames, by, chunk_size=100000, directory=None):
+    """
+    Sort a stream of GeoDataFrame chunks that does not fit in memory. Ties
+    keep the input order.
+
+    Args:
+        frames(Iterable[geopandas.GeoDataFrame]): Chunks
+        by(list[str]): Sort keys
+        chunk_size(int): Number of rows per output chunk
+        directory(str): Where to spill runs, system temp directory if None
+    Yields:
+        geopandas.GeoDataFrame
+    """
+    with tempfile.TemporaryDirectory(dir=directory) as tmp:
+        runs, crs = spill_runs(frames, by, tmp)
+        yield from merge_runs(runs, by, crs=crs, chunk_size=chunk_size)
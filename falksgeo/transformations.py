@@ -2,6 +2,10 @@
 Diverse mapping functions in support of tools
 """
 import re
+from .lazy import lazy_import
+
+np = lazy_import('numpy')
+pd = lazy_import('pandas')
 
 
 # see
@@ -28,8 +32,11 @@ def empty(item:dict, schema:bool=False) -> dict:
 
 def calculate_display_value(record):
     """
-    Logic for display values
+    Logic for display values, for a record or vectorized for a DataFrame
     """
+    if isinstance(record, pd.DataFrame):
+        flow = pd.to_numeric(record['ds_max_flo'], errors='coerce')
+        return np.select([flow > 300, flow > 100, flow > 10], [1, 2, 3], 4)
     if record['ds_max_flo'] and not record['ds_max_flo'] == 'None':
         if float(record['ds_max_flo']) > 300:
             return 1
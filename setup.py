@@ -45,12 +45,18 @@ setup(
         'numpy>=1.20',
         'pyproj>=3.0.1',
         'arcgis>=1.8',
-        'geopandas>=0.9',
+        'geopandas>=1.0',
+        'pyogrio>=0.7',
+        'pyarrow>=10',
         'earthengine-api>=0.1.256',
         'oauth2client>=4.1.3',
         'rasterio>=1.2',
         'requests>=2.25',
         'tqdm>=4.59',
         'nose'
-    ]
+    ],
+    extras_require={'yaml': ['pyyaml']},
+    entry_points={
+        'console_scripts': ['falksgeo=falksgeo.cli:main']
+    }
 )
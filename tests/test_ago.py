@@ -1,9 +1,19 @@
 # pylint:disable=C0114,C0115,C0116
 # standard library
+import ast
 import logging
+import os
+from types import SimpleNamespace
+from itertools import count
 from unittest import TestCase
+from unittest.mock import patch
+# third party
+import fiona
 # project
-# from falksgeo import arcgis
+from falksgeo import arcgis, display
+from falksgeo.shapefile import zip_shp
+from .base import DirectoryTestCase, TEST_RES_DIR
+from .test_display import isolate_profiles
 
 
 logging.basicConfig()
@@ -16,3 +26,394 @@ logging.getLogger().setLevel(logging.CRITICAL)
 #        'https://www.arcgis.com', 'arcgis_python', 'P@ssword123')
 #        self.assertEqual(
 #            str(gis), 'GIS @ https://geosaurus.maps.arcgis.com version:8.4')
+
+
+class FakeItem:
+    """
+    Stand-in for arcgis.gis.Item
+    """
+    ids = count()
+
+    def __init__(self, gis, title, typ, folder=None):
+        self.id = next(self.ids)
+        self.gis = gis
+        self.title = title
+        self.type = typ
+        self.folder = folder
+        self.shared = False
+
+    def publish(self):
+        self.gis.calls.append(('publish', self.title))
+        self.gis.fail('publish')
+        return self.gis.content.create(
+            self.title, 'Feature Service', self.folder)
+
+    def update(self, item_properties=None, data=None):
+        del item_properties
+        self.gis.calls.append(('update', data))
+        self.gis.fail('update')
+
+    def share(self, everyone=False):
+        self.gis.fail('share')
+        self.shared = everyone
+
+
+class FakeContent:
+
+    def __init__(self, gis):
+        self.gis = gis
+        self.items = []
+
+    def create(self, title, typ, folder=None):
+        item = FakeItem(self.gis, title, typ, folder)
+        self.items.append(item)
+        return item
+
+    def create_folder(self, folder):
+        self.gis.calls.append(('create_folder', folder))
+
+    def add(self, item_properties, data, folder=None):
+        self.gis.calls.append(('add', data))
+        return self.create(item_properties['title'], 'Shapefile', folder)
+
+    def search(self, query, item_type=None, max_items=10):
+        del item_type, max_items
+        self.gis.calls.append(('search', query))
+        return list(self.items)
+
+
+class FakeUser:
+
+    username = 'me'
+
+    def __init__(self, gis):
+        self.gis = gis
+
+    def items(self, folder=None, max_items=100):
+        self.gis.calls.append(('items', folder))
+        return [
+            item for item in self.gis.content.items
+            if item.folder == folder][0:max_items]
+
+
+class FakeUsers:
+
+    def __init__(self, gis):
+        self.me = FakeUser(gis)
+
+
+class FakeGIS:
+    """
+    Local stand-in for arcgis.gis.GIS recording all calls. Set failures
+    to {'step': count} to raise ConnectionError count times in a step.
+    """
+
+    def __init__(self, failures=None):
+        self.calls = []
+        self.failures = failures or {}
+        self.content = FakeContent(self)
+        self.users = FakeUsers(self)
+
+    def fail(self, step):
+        if self.failures.get(step):
+            self.failures[step] -= 1
+            raise ConnectionError(step)
+
+
+class TestPublishMany(TestCase):
+
+    def setUp(self):
+        self.gis = FakeGIS()
+        patcher = patch('arcgis.features.FeatureLayerCollection')
+        self.flc = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_create_and_update(self):
+        self.gis.content.create('existing', 'Shapefile', 'folder')
+        service = self.gis.content.create(
+            'existing', 'Feature Service', 'folder')
+        res = arcgis.publish_many(
+            ['/tmp/new.zip', '/tmp/existing.zip'], self.gis,
+            folder='folder', backoff=0)
+        self.assertEqual([item.action for item in res], ['created', 'updated'])
+        self.assertEqual([item.error for item in res], [None, None])
+        self.assertIs(res[1].service, service)
+        self.assertTrue(all(item.service.shared for item in res))
+        self.flc.fromitem.assert_called_once_with(service)
+        manager = self.flc.fromitem.return_value.manager
+        manager.overwrite.assert_called_once_with('/tmp/existing.zip')
+        # a single listing for all layers
+        self.assertEqual(
+            [call for call in self.gis.calls if call[0] in ['items', 'search']],
+            [('items', 'folder')])
+
+    def test_retry(self):
+        self.gis.failures = {'publish': 1, 'share': 1}
+        res = arcgis.publish_many(['/tmp/new.zip'], self.gis, backoff=0)
+        self.assertIsNone(res[0].error)
+        self.assertEqual(res[0].attempts, 3)
+        # the shapefile is only uploaded once
+        self.assertEqual(
+            len([call for call in self.gis.calls if call[0] == 'add']), 1)
+
+    def test_give_up(self):
+        self.gis.failures = {'publish': 5}
+        res = arcgis.publish_many(
+            ['/tmp/new.zip'], self.gis, retries=2, backoff=0)
+        self.assertIsInstance(res[0].error, ConnectionError)
+        self.assertEqual(res[0].attempts, 2)
+
+    def test_missing_file(self):
+        with patch.object(
+                self.gis.content, 'add', side_effect=FileNotFoundError):
+            res = arcgis.publish_many(['/tmp/missing.zip'], self.gis)
+        self.assertIsInstance(res[0].error, FileNotFoundError)
+        self.assertEqual(res[0].attempts, 1)
+
+    def test_stale_shapefile(self):
+        # uploaded by a run that failed before publishing
+        shapefile = self.gis.content.create('stale', 'Shapefile', 'folder')
+        self.gis.failures = {'update': 1}
+        res = arcgis.publish_many(
+            ['/tmp/stale.zip'], self.gis, folder='folder', backoff=0)
+        self.assertIsNone(res[0].error)
+        self.assertEqual(res[0].action, 'created')
+        self.assertEqual(
+            [call for call in self.gis.calls if call[0] in ['add', 'update']],
+            [('update', '/tmp/stale.zip'), ('update', '/tmp/stale.zip')])
+        self.assertIn(('publish', 'stale'), self.gis.calls)
+        self.assertEqual(
+            [item for item in self.gis.content.items
+             if item.title == 'stale'][0], shapefile)
+
+    def test_publish_stale_shapefile(self):
+        self.gis.content.create('stale', 'Shapefile')
+        arcgis.publish('/tmp/stale.zip', self.gis)
+        self.assertIn(('update', '/tmp/stale.zip'), self.gis.calls)
+        self.assertNotIn(('add', '/tmp/stale.zip'), self.gis.calls)
+        self.assertEqual(
+            [item.type for item in self.gis.content.items],
+            ['Shapefile', 'Feature Service'])
+
+    def test_shared_index(self):
+        index = arcgis.ItemIndex(self.gis)
+        arcgis.publish_many(
+            ['/tmp/new.zip'], self.gis, folder='folder', index=index)
+        self.assertIsNotNone(index.find('new', 'Feature Layer'))
+        arcgis.publish_many(
+            ['/tmp/new.zip'], self.gis, folder='folder', index=index)
+        self.assertEqual(
+            len([call for call in self.gis.calls if call[0] == 'add']), 1)
+        self.assertEqual(
+            len([call for call in self.gis.calls if call[0] == 'items']), 1)
+
+
+class TestItemIndex(TestCase):
+
+    def setUp(self):
+        self.gis = FakeGIS()
+        self.shapefile = self.gis.content.create('name', 'Shapefile')
+        self.service = self.gis.content.create('name', 'Feature Service')
+
+    def test_find(self):
+        index = arcgis.ItemIndex(self.gis)
+        self.assertIs(index.find('name', 'Feature Layer'), self.service)
+        self.assertIs(index.find('name', 'Feature '), self.service)
+        self.assertIs(index.find('name', 'Shapefile'), self.shapefile)
+        self.assertIsNone(index.find('other', 'Shapefile'))
+        self.assertIsNone(index.find('nam', 'Shapefile'))
+        self.assertEqual(self.gis.calls, [('search', 'owner:me')])
+
+    def test_add_and_invalidate(self):
+        index = arcgis.ItemIndex(self.gis)
+        index.load()
+        other = self.gis.content.create('other', 'Shapefile')
+        self.assertIsNone(index.find('other', 'Shapefile'))
+        index.add(other)
+        self.assertIs(index.find('other', 'Shapefile'), other)
+        self.gis.content.items.remove(self.service)
+        index.invalidate('name')
+        self.assertIsNone(index.find('name', 'Feature Layer'))
+        self.assertIs(index.find('name', 'Shapefile'), self.shapefile)
+        self.assertEqual(len(index.items['other']), 1)
+
+    def test_scopes(self):
+        index = arcgis.ItemIndex(self.gis)
+        nightly = self.gis.content.create('nightly', 'Shapefile', 'nightly')
+        self.assertIs(index.find('nightly', 'Shapefile', 'nightly'), nightly)
+        # a folder does not satisfy an owner lookup
+        self.assertIs(index.find('name', 'Shapefile'), self.shapefile)
+        self.assertEqual(
+            self.gis.calls, [('items', 'nightly'), ('search', 'owner:me')])
+        # the owner's items cover all folders
+        self.assertIsNone(index.find('other', 'Shapefile', 'archive'))
+        self.assertEqual(len(self.gis.calls), 2)
+
+    def test_publish_after_folder_load(self):
+        patcher = patch('arcgis.features.FeatureLayerCollection')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        arcgis.publish_many(
+            ['/tmp/new.zip'], self.gis, folder='nightly', backoff=0)
+        arcgis.publish('/tmp/name.zip', self.gis)
+        self.assertEqual(
+            [item.type for item in self.gis.content.items
+             if item.title == 'name'], ['Shapefile', 'Feature Service'])
+
+    def test_session_index(self):
+        self.assertIs(arcgis.item_index(self.gis), arcgis.item_index(self.gis))
+        self.assertIsNot(
+            arcgis.item_index(self.gis), arcgis.item_index(FakeGIS()))
+
+
+def write_layer(filename, rows, id_type='int'):
+    schema = {'geometry': 'Point', 'properties': {'comid': id_type, 'v': 'str'}}
+    args = filename, 'w', 'ESRI Shapefile', schema
+    with fiona.open(*args, crs='epsg:4326') as out:
+        for ind, (comid, value) in enumerate(rows):
+            out.write({
+                'geometry': {'type': 'Point', 'coordinates': (ind, 1)},
+                'properties': {'comid': comid, 'v': value}})
+    return zip_shp(filename)
+
+
+class FakeLayer:
+    """
+    Stand-in for a hosted feature layer with features {id: object id},
+    object ids start at comid + 100. Set fail_adds to fail the add
+    requests after that many.
+    """
+
+    def __init__(self, ids=(1, 2, 3)):
+        self.properties = SimpleNamespace(objectIdField='FID')
+        self.features = {comid: comid + 100 for comid in ids}
+        self.edits = []
+        self.queries = []
+        self.fail_adds = None
+
+    def query(self, where=None, out_fields=None, return_geometry=True):
+        del out_fields, return_geometry
+        self.queries.append(where)
+        ids = [
+            ast.literal_eval(item)
+            for item in where.split('(')[1].rstrip(')').split(', ')]
+        return SimpleNamespace(features=[
+            SimpleNamespace(attributes={
+                'comid': comid, 'FID': self.features[comid]})
+            for comid in ids if comid in self.features])
+
+    def edit_features(self, adds=None, updates=None, deletes=None):
+        if adds and self.fail_adds is not None:
+            if not self.fail_adds:
+                raise ConnectionError('adds')
+            self.fail_adds -= 1
+        self.edits.append((adds, updates, deletes))
+        for item in adds or []:
+            comid = item['attributes']['comid']
+            self.features[comid] = max(self.features.values()) + 1
+        return {
+            'addResults': [{'success': True} for _ in adds or []],
+            'updateResults': [{'success': True} for _ in updates or []]}
+
+
+class TestDeltaPublish(DirectoryTestCase):
+
+    def moreSetUp(self):
+        self.shp = os.path.join(TEST_RES_DIR, 'delta.shp')
+        self.zipfile = write_layer(self.shp, [(1, 'a'), (2, 'b'), (3, 'c')])
+        self.layer = FakeLayer()
+        patcher = patch('arcgis.features.FeatureLayerCollection')
+        self.flc = patcher.start()
+        self.flc.fromitem.return_value.layers = [self.layer]
+        self.addCleanup(patcher.stop)
+
+    def test_diff_snapshot(self):
+        res = arcgis.diff_snapshot(
+            {'1': 'a', '2': 'b', '3': 'c'}, {'1': 'a', '2': 'x', '4': 'd'})
+        self.assertEqual(res, ({'4'}, {'2'}, {'3'}))
+
+    def test_to_esri_geometry(self):
+        self.assertEqual(
+            arcgis.to_esri_geometry(
+                {'type': 'Point', 'coordinates': (1, 2)}, 4326),
+            {'x': 1, 'y': 2, 'spatialReference': {'wkid': 4326}})
+        res = arcgis.to_esri_geometry({
+            'type': 'Polygon',
+            'coordinates': [[(0, 0), (1, 0), (1, 1), (0, 0)]]})
+        # clockwise
+        self.assertEqual(res['rings'], [[[0, 0], [1, 1], [1, 0], [0, 0]]])
+
+    def test_first_update_overwrites(self):
+        arcgis.update_service('service', self.zipfile, delta_field='comid')
+        manager = self.flc.fromitem.return_value.manager
+        manager.overwrite.assert_called_once_with(self.zipfile)
+        self.assertEqual(
+            len(arcgis.read_snapshot(self.zipfile)), 3)
+
+    def test_profile_features(self):
+        isolate_profiles(self)
+        with patch.dict(os.environ, {display.PROFILE_ENV: 'publish'}):
+            arcgis.publish(self.zipfile, FakeGIS())
+        self.assertEqual(display.PROFILES[0].features, 3)
+
+    def test_delta(self):
+        arcgis.write_snapshot(
+            self.zipfile, arcgis.layer_snapshot(self.zipfile, 'comid'))
+        write_layer(self.shp, [(1, 'a'), (2, 'changed'), (4, 'd')])
+        res = arcgis.update_service(
+            'service', self.zipfile, delta_field='comid', batch_size=1)
+        self.assertEqual(res, {'adds': 1, 'updates': 1, 'deletes': 1})
+        manager = self.flc.fromitem.return_value.manager
+        manager.overwrite.assert_not_called()
+        adds, updates, deletes = zip(*self.layer.edits)
+        adds = [item for item in adds if item]
+        updates = [item for item in updates if item]
+        deletes = [item for item in deletes if item]
+        self.assertEqual(adds[0][0]['attributes'], {'comid': 4, 'v': 'd'})
+        self.assertEqual(
+            updates[0][0]['attributes'],
+            {'comid': 2, 'v': 'changed', 'FID': 102})
+        self.assertEqual(deletes, ['103'])
+        # nothing left to do
+        res = arcgis.update_service(
+            'service', self.zipfile, delta_field='comid')
+        self.assertEqual(res, {'adds': 0, 'updates': 0, 'deletes': 0})
+
+    def test_text_ids(self):
+        self.zipfile = write_layer(
+            self.shp, [('0101', 'a'), ('0102', 'b')], id_type='str')
+        self.layer.features = {'0101': 100, '0102': 101}
+        arcgis.write_snapshot(
+            self.zipfile, arcgis.layer_snapshot(self.zipfile, 'comid'))
+        write_layer(
+            self.shp, [('0101', 'a'), ('0102', 'changed')], id_type='str')
+        arcgis.update_service('service', self.zipfile, delta_field='comid')
+        self.assertEqual(self.layer.queries, ["comid IN ('0102')"])
+        self.assertEqual(
+            self.layer.edits, [(None, [{
+                'attributes': {'comid': '0102', 'v': 'changed', 'FID': 101},
+                'geometry': {
+                    'x': 1.0, 'y': 1.0, 'spatialReference': {'wkid': 4326}}
+            }], None)])
+
+    def test_interrupted_adds(self):
+        arcgis.write_snapshot(
+            self.zipfile, arcgis.layer_snapshot(self.zipfile, 'comid'))
+        write_layer(
+            self.shp, [(1, 'a'), (2, 'b'), (3, 'c'), (4, 'd'), (5, 'e')])
+        self.layer.fail_adds = 1
+        with self.assertRaises(ConnectionError):
+            arcgis.update_service(
+                'service', self.zipfile, delta_field='comid', batch_size=1)
+        self.layer.fail_adds = None
+        self.layer.edits = []
+        res = arcgis.update_service(
+            'service', self.zipfile, delta_field='comid', batch_size=1)
+        self.assertEqual(res['adds'], 2)
+        adds, updates, _ = zip(*self.layer.edits)
+        # the feature added before the failure is updated, not added again
+        self.assertEqual(
+            [item[0]['attributes']['comid'] for item in adds if item], [5])
+        self.assertEqual(
+            [item[0]['attributes']['comid'] for item in updates if item], [4])
+        self.assertEqual(len(self.layer.features), 5)
@@ -0,0 +1,29 @@
+# pylint:disable=C0114,C0115,C0116,E0401
+# standard library
+import os
+from unittest import TestCase
+# project
+from benchmarks import run
+from .base import DirectoryTestCase, TEST_RES_DIR
+
+
+class TestCompare(TestCase):
+
+    def test_regression(self):
+        old = {'results': {
+            'a': {'seconds': 1.0}, 'b': {'seconds': 1.0}, 'c': {'error': 'x'}}}
+        new = {'results': {
+            'a': {'seconds': 1.05}, 'b': {'seconds': 2.0}, 'c': {'seconds': 1}}}
+        self.assertEqual(run.compare(old, new, threshold=0.1), ['b'])
+
+
+class TestRunSingle(DirectoryTestCase):
+
+    def test_hash_file(self):
+        res = run.run_single('hash_file', 'tiny', 'narrow', 2, TEST_RES_DIR)
+        self.assertEqual(res['count'], 1000000)
+        self.assertEqual(res['unit'], 'bytes')
+        self.assertGreater(res['throughput'], 0)
+        self.assertGreater(res['peak_rss_mb'], 0)
+        self.assertTrue(os.path.isfile(
+            os.path.join(TEST_RES_DIR, 'tiny-narrow', 'polygons.shp')))
@@ -0,0 +1,94 @@
+# pylint:disable=C0114,C0115,C0116,E0401
+# standard library
+import os
+# third party
+import fiona
+import numpy as np
+# project
+from falksgeo import dbf, filters, shapefile
+from .base import DirectoryTestCase, TEST_RES_DIR
+
+
+def create_table(name, rows=5):
+    schema = {'geometry': 'Point', 'properties': {
+        'comid': 'int', 'name': 'str:20', 'value': 'float', 'day': 'date'}}
+    args = name, 'w', 'ESRI Shapefile', schema
+    with fiona.open(*args, crs='epsg:4326', encoding='utf-8') as out:
+        for ind in range(rows):
+            out.write({
+                'geometry': {'type': 'Point', 'coordinates': (ind, ind)},
+                'properties': {
+                    'comid': ind * 10, 'name': 'fluß {}'.format(ind),
+                    'value': ind / 4 if ind != 3 else None,
+                    'day': '2021-02-{:02d}'.format(ind + 1) if ind else None
+                }})
+
+
+class TestReadDBF(DirectoryTestCase):
+
+    def moreSetUp(self):
+        self.shapefile = os.path.join(TEST_RES_DIR, 'table.shp')
+        create_table(self.shapefile)
+
+    def test_read(self):
+        res = dbf.read_dbf(self.shapefile)
+        self.assertEqual(list(res), ['comid', 'name', 'value', 'day'])
+        self.assertEqual(res['comid'].tolist(), [0, 10, 20, 30, 40])
+        self.assertEqual(res['name'][1], 'fluß 1')
+        self.assertTrue(np.isnan(res['value'][3]))
+        self.assertEqual(res['value'][2], 0.5)
+        self.assertTrue(np.isnat(res['day'][0]))
+        self.assertEqual(str(res['day'][1]), '2021-02-02')
+
+    def test_projection(self):
+        res = dbf.read_dbf(self.shapefile.replace('.shp', '.dbf'), ['name'])
+        self.assertEqual(list(res), ['name'])
+        with self.assertRaises(KeyError):
+            dbf.read_dbf(self.shapefile, ['missing'])
+
+    def test_deleted_records(self):
+        table = dbf.DBF(self.shapefile)
+        with open(table.filename, 'r+b') as handle:
+            handle.seek(table.header_length + table.record_length)
+            handle.write(b'*')
+        res = dbf.read_dbf(self.shapefile, ['comid'])
+        self.assertEqual(res['comid'].tolist(), [0, 20, 30, 40])
+
+    def test_code_pages(self):
+        cpg = self.shapefile.replace('.shp', '.cpg')
+        raw = 'fluß 1'.encode('utf-8')
+        for code_page, encoding in [
+                ('ANSI 1252', 'cp1252'), ('65001', 'utf-8'),
+                ('LDID/87', 'latin-1')]:
+            with open(cpg, 'w') as handle:
+                handle.write(code_page)
+            self.assertEqual(
+                dbf.read_dbf(self.shapefile)['name'][1],
+                raw.decode(encoding, 'replace'))
+        self.assertEqual(dbf.normalize_encoding('1252'), 'cp1252')
+        self.assertEqual(dbf.normalize_encoding('8859-1'), 'iso8859-1')
+
+    def test_null_text(self):
+        blank = os.path.join(TEST_RES_DIR, 'blank.shp')
+        schema = {'geometry': 'Point', 'properties': {'name': 'str:5'}}
+        args = blank, 'w', 'ESRI Shapefile', schema
+        with fiona.open(*args, crs='epsg:4326') as out:
+            for name in ['a', None, '']:
+                out.write({
+                    'geometry': {'type': 'Point', 'coordinates': (0, 0)},
+                    'properties': {'name': name}})
+        self.assertEqual(
+            dbf.read_dbf(blank)['name'].tolist(), ['a', None, None])
+
+    def test_filterset(self):
+        self.assertEqual(
+            filters.layer_filterset(self.shapefile), {0, 10, 20, 30, 40})
+
+    def test_create_variable(self):
+        outfile = os.path.join(TEST_RES_DIR, 'out.shp')
+        shapefile.create_variable(
+            self.shapefile, outfile, {10, 40}, default=0)
+        with fiona.open(outfile) as collection:
+            self.assertEqual(
+                [item['properties']['available'] for item in collection],
+                [0, 1, 0, 0, 1])
@@ -0,0 +1,116 @@
+# pylint:disable=C0114,C0115,C0116,E0401
+# standard library
+import os
+from contextlib import redirect_stdout
+from io import StringIO
+from unittest import TestCase
+from unittest.mock import patch
+# third party
+import numpy as np
+# project
+from falksgeo import display, shapefile
+from .base import DirectoryTestCase, TEST_RES_DIR
+from .test_shapefile import create_shapefile
+
+
+def count(items):
+    percent = display.PercentDisplay(items)
+    for _ in items:
+        percent.inc()
+    return [0] * 100000
+
+
+class TestPrintDocstring(TestCase):
+
+    def test_first_paragraph(self):
+        def documented():
+            """
+            Status line
+            continued
+
+            Args:
+                none
+            """
+        output = StringIO()
+        with redirect_stdout(output):
+            display.print_docstring(documented)()
+        self.assertEqual(output.getvalue(), '\nStatus line\ncontinued\n\n')
+
+
+def isolate_profiles(test):
+    # keep records out of the report printed at exit
+    display.PROFILES.clear()
+    test.addCleanup(display.PROFILES.clear)
+    report = patch.object(display, '_REPORT', [None])
+    report.start()
+    test.addCleanup(report.stop)
+
+
+class TestProfile(TestCase):
+
+    def setUp(self):
+        isolate_profiles(self)
+
+    def test_disabled(self):
+        with patch.dict(os.environ, {display.PROFILE_ENV: ''}):
+            display.profile(count)([1, 2])
+        self.assertEqual(display.PROFILES, [])
+
+    def test_enabled(self):
+        display.profile(count, enabled=True)([1, 2, 3])
+        record = display.PROFILES[0]
+        self.assertEqual(record.name, 'count')
+        self.assertEqual(record.features, 3)
+        self.assertGreater(record.wall, 0)
+        self.assertGreater(record.peak_memory, 100000)
+
+    def test_returned(self):
+        display.profile(np.zeros, enabled=True)(7)
+        self.assertEqual(display.PROFILES[0].features, 7)
+
+    def test_environment(self):
+        outer = display.profile(lambda: profiled([1]))
+        profiled = display.profile(count)
+        with patch.dict(os.environ, {display.PROFILE_ENV: 'count'}):
+            outer()
+        self.assertEqual([item.name for item in display.PROFILES], ['count'])
+        with patch.dict(os.environ, {display.PROFILE_ENV: 'all'}):
+            outer()
+        self.assertEqual(
+            [item.name for item in display.PROFILES],
+            ['count', 'count', '<lambda>'])
+        # nested calls are part of the outer record
+        self.assertEqual(display.PROFILES[-1].features, 1)
+        self.assertEqual(display.profile_report()['count']['calls'], 2)
+
+
+class TestProfileOutput(DirectoryTestCase):
+
+    def setUp(self):
+        super().setUp()
+        isolate_profiles(self)
+
+    def test_copy_layer(self):
+        infile = os.path.join(TEST_RES_DIR, 'test.shp')
+        create_shapefile(infile)
+        outdir = os.path.join(TEST_RES_DIR, 'profiles')
+        env = {display.PROFILE_ENV: 'copy_layer',
+               display.PROFILE_DIR_ENV: outdir}
+        with patch.dict(os.environ, env):
+            shapefile.copy_layer(
+                infile, os.path.join(TEST_RES_DIR, 'out.shp'))
+            display.print_profiles()
+        record = display.PROFILES[0]
+        self.assertTrue(record.features > 0)
+        self.assertTrue(os.path.isfile(record.output))
+        self.assertTrue(os.path.isfile(os.path.join(outdir, 'summary.json')))
+
+    def test_merge_layers(self):
+        infiles = [
+            os.path.join(TEST_RES_DIR, name) for name in ['a.shp', 'b.shp']]
+        for item in infiles:
+            create_shapefile(item)
+        with patch.dict(os.environ, {display.PROFILE_ENV: 'merge_layers'}):
+            shapefile.merge_layers(
+                infiles, os.path.join(TEST_RES_DIR, 'merged.shp'))
+        self.assertEqual(display.PROFILES[0].features, 10)
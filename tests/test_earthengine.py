@@ -1,9 +1,15 @@
 # pylint:disable=C0114,C0115,C0116,E0401
 import os
+import threading
+from unittest import TestCase
+from unittest.mock import MagicMock, patch
 from zipfile import ZipFile
 from affine import Affine
 import fiona
+from google.auth.exceptions import RefreshError
+import numpy as np
 import rasterio
+from rasterio.io import MemoryFile
 from falksgeo import earthengine
 from .base import DirectoryTestCase, TEST_RES_DIR, TEST_DATA_DIR
 
@@ -132,6 +138,112 @@ class TestDownloadParts(DirectoryTestCase):
             self.assertTrue(os.path.isfile(item))
 
 
+def compute_pixels(request):
+    grid = request['grid']
+    transform = grid['affineTransform']
+    profile = {
+        'driver': 'GTiff', 'count': 1, 'dtype': 'int16',
+        'width': grid['dimensions']['width'],
+        'height': grid['dimensions']['height'], 'crs': grid['crsCode'],
+        'transform': Affine(
+            transform['scaleX'], transform['shearX'], transform['translateX'],
+            transform['shearY'], transform['scaleY'], transform['translateY'])}
+    with MemoryFile() as memfile:
+        with memfile.open(**profile) as dst:
+            dst.write(np.ones(
+                (1, profile['height'], profile['width']), dtype='int16'))
+        return memfile.read()
+
+
+class TestComputePixels(DirectoryTestCase):
+
+    def moreSetUp(self):
+        self.shp = os.path.join(TEST_RES_DIR, 'test.shp')
+        generate_shp_file(self.shp)
+
+    def test_chunk_grid(self):
+        chunk = [[-122, 38], [-121.9, 38], [-121.9, 38.1], [-122, 38.1]]
+        grid = earthengine.chunk_grid(chunk, {'scale': 30, 'crs': 'EPSG:4326'})
+        self.assertEqual(grid['dimensions'], {'width': 371, 'height': 371})
+        self.assertEqual(grid['affineTransform']['translateX'], -122)
+        self.assertEqual(grid['affineTransform']['translateY'], 38.1)
+        self.assertAlmostEqual(
+            grid['affineTransform']['scaleX'],
+            30 / earthengine.METERS_PER_DEGREE)
+        grid = earthengine.chunk_grid(chunk, {'scale': 30, 'crs': 'EPSG:3310'})
+        self.assertEqual(grid['crsCode'], 'EPSG:3310')
+        self.assertEqual(grid['affineTransform']['scaleY'], -30)
+        self.assertGreater(grid['dimensions']['height'], 350)
+
+    def test_download_parts(self):
+        ee = MagicMock()
+        ee.data.computePixels.side_effect = compute_pixels
+        options = {'scale': 30, 'crs': 'EPSG:4326', 'bands': ['B1']}
+        session = earthengine.Session()
+        with patch.object(earthengine, 'ee', ee), \
+                patch.object(earthengine, 'SESSION', session):
+            res = earthengine.download_parts(
+                self.shp, options, dest=TEST_RES_DIR, step=0.006,
+                image='image', backend='pixels')
+        self.assertEqual(len(res), 3)
+        self.assertEqual(ee.data.computePixels.call_count, 3)
+        ee.Initialize.assert_called_once_with(project=None)
+        request = ee.data.computePixels.call_args[0][0]
+        self.assertEqual(request['expression'], 'image')
+        self.assertEqual(request['bandIds'], ['B1'])
+        self.assertFalse(os.path.isfile(TEST_TMP_FILE))
+        for item in res:
+            with rasterio.open(item) as raster:
+                self.assertEqual(raster.width, 22)
+                self.assertEqual(raster.read(1).min(), 1)
+
+    def test_unknown_backend(self):
+        with self.assertRaises(ValueError):
+            earthengine.download_parts(
+                self.shp, {}, dest=TEST_RES_DIR, image='image',
+                backend='ftp')
+
+
+class TestSession(TestCase):
+
+    def setUp(self):
+        self.ee = MagicMock()
+        patcher = patch.object(earthengine, 'ee', self.ee)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.session = earthengine.Session()
+
+    def test_initialize_once(self):
+        threads = [
+            threading.Thread(target=self.session.initialize)
+            for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.session.initialize()
+        self.assertEqual(self.ee.Initialize.call_count, 1)
+        self.session.initialize('other')
+        self.ee.Initialize.assert_called_with(project='other')
+        self.session.initialize()
+        self.assertEqual(self.ee.Initialize.call_count, 2)
+
+    def test_default_image(self):
+        with patch.object(
+                earthengine, 'get_normalized_image',
+                side_effect=lambda: object()) as build:
+            first = self.session.image()
+            self.assertIs(self.session.image(), first)
+            self.assertEqual(self.session.image('image'), 'image')
+        self.assertEqual(build.call_count, 1)
+
+    def test_refresh(self):
+        function = MagicMock(side_effect=[RefreshError('expired'), 'result'])
+        self.assertEqual(self.session.call(function, 1), 'result')
+        self.assertEqual(self.ee.Initialize.call_count, 2)
+        function.assert_called_with(1)
+
+
 class TestMerge(DirectoryTestCase):
 
     def test_merge(self):
@@ -143,6 +255,26 @@ class TestMerge(DirectoryTestCase):
         with rasterio.open(dest) as raster:
             self.assertEqual(raster.profile['height'], 46)
             self.assertEqual(raster.profile['width'], 46)
+            self.assertEqual(raster.overviews(1), [])
+
+    def test_merge_overviews(self):
+        files_to_merge=[
+            os.path.join(TEST_DATA_DIR, f'raster{ind}.tif')
+            for ind in range(1, 4)]
+        dest = os.path.join(TEST_RES_DIR, 'raster.tif')
+        earthengine.merge(
+            files_to_merge, dest, overviews=[2, 4], resampling='nearest')
+        with rasterio.open(dest) as raster:
+            self.assertEqual(raster.overviews(1), [2, 4])
+            self.assertEqual(
+                raster.tags(ns='rio_overview')['resampling'], 'nearest')
+            self.assertEqual(raster.block_shapes[0], (256, 256))
+
+    def test_overview_factors(self):
+        self.assertEqual(earthengine.overview_factors(46, 46), [])
+        self.assertEqual(earthengine.overview_factors(1000, 300), [2, 4])
+        self.assertEqual(
+            earthengine.overview_factors(2048, 100, 256), [2, 4, 8])
 
 
 class TestDownloadImage(DirectoryTestCase):
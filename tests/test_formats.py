@@ -0,0 +1,57 @@
+# pylint:disable=C0114,C0115,C0116,E0401
+# standard library
+import os
+# third party
+import fiona
+# project
+from falksgeo import formats, shapefile
+from .base import DirectoryTestCase, TEST_RES_DIR
+from .test_shapefile import create_shapefile
+
+
+class TestDrivers(DirectoryTestCase):
+
+    def test_get_driver(self):
+        self.assertEqual(formats.get_driver('a/b.shp'), 'ESRI Shapefile')
+        self.assertEqual(formats.get_driver('a/b.FGB'), 'FlatGeobuf')
+        self.assertEqual(formats.get_driver('b.parquet'), 'Parquet')
+        self.assertEqual(formats.get_driver('b'), 'ESRI Shapefile')
+        self.assertEqual(formats.get_driver('b.shp', 'GPKG'), 'GPKG')
+
+    def test_ogr_driver(self):
+        self.assertEqual(formats.ogr_driver('b.fgb'), 'FlatGeobuf')
+        with self.assertRaises(ValueError):
+            formats.ogr_driver('b.shp', driver='Nonsense')
+
+
+class TestIntermediateFormats(DirectoryTestCase):
+
+    def moreSetUp(self):
+        self.shp = os.path.join(TEST_RES_DIR, 'test.shp')
+        create_shapefile(name=self.shp)
+
+    def test_copy_layer_flatgeobuf(self):
+        fgb = os.path.join(TEST_RES_DIR, 'test.fgb')
+        shapefile.copy_layer(self.shp, fgb)
+        with fiona.open(fgb) as collection:
+            self.assertEqual(collection.driver, 'FlatGeobuf')
+            self.assertEqual(len(collection), 5)
+        out = os.path.join(TEST_RES_DIR, 'out.shp')
+        shapefile.copy_layer(fgb, out)
+        with fiona.open(out) as collection:
+            self.assertEqual(collection.driver, 'ESRI Shapefile')
+            self.assertEqual(len(collection), 5)
+
+    def test_copy_shp_parquet(self):
+        parquet = os.path.join(TEST_RES_DIR, 'test.parquet')
+        shapefile.copy_shp(self.shp, parquet)
+        shapefile.copy_shp(self.shp, parquet, append=True)
+        df = formats.read_dataframe(parquet, columns=['one'])
+        self.assertEqual(list(df), ['one', 'geometry'])
+        self.assertEqual(len(df), 10)
+        self.assertEqual(df.crs.to_epsg(), 3310)
+        out = os.path.join(TEST_RES_DIR, 'out.shp')
+        shapefile.copy_shp(parquet, out, fields=['one'])
+        with fiona.open(out) as collection:
+            self.assertEqual(len(collection), 10)
+            self.assertEqual(list(collection.schema['properties']), ['one'])
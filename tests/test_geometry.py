@@ -0,0 +1,146 @@
+# pylint:disable=C0114,C0115,C0116,E0401
+# standard library
+import os
+from unittest import TestCase
+# third party
+import fiona
+import shapely
+# project
+from falksgeo import geometry, shapefile
+from .base import DirectoryTestCase, TEST_RES_DIR
+
+
+def create_lines(name, rows=3):
+    schema = {'geometry': 'LineString', 'properties': {'id': 'int'}}
+    args = name, 'w', 'ESRI Shapefile', schema
+    with fiona.open(*args, crs='epsg:3310') as out:
+        for ind in range(0, rows):
+            out.write({
+                'geometry': {
+                    'type': 'LineString',
+                    'coordinates': [
+                        (ind + x / 100, (x % 2) / 1000 + 0.123456)
+                        for x in range(0, 101)]},
+                'properties': {'id': ind}})
+
+
+class TestVectorized(TestCase):
+
+    def test_round_coordinates(self):
+        res = geometry.round_coordinates(
+            shapely.points([1.23456, 2.5], [1.0, 9.87654]), 2)
+        self.assertEqual(shapely.get_coordinates(res).tolist(),
+                         [[1.23, 1.0], [2.5, 9.88]])
+
+    def test_simplify(self):
+        line = shapely.linestrings([(0, 0), (1, 0.001), (2, 0)])
+        res = geometry.simplify([line], 0.01)
+        self.assertEqual(shapely.get_num_points(res).tolist(), [2])
+
+
+class TestCopyLayerGeometryStages(DirectoryTestCase):
+
+    def moreSetUp(self):
+        self.shapefile = os.path.join(TEST_RES_DIR, 'lines.shp')
+        self.outfile = os.path.join(TEST_RES_DIR, 'out.shp')
+        create_lines(self.shapefile)
+
+    def test_simplify_and_round(self):
+        shapefile.copy_layer(
+            self.shapefile, self.outfile, simplify_tolerance=0.01,
+            precision=2, chunk_size=2)
+        with fiona.open(self.outfile) as collection:
+            self.assertEqual(len(collection), 3)
+            for ind, item in enumerate(collection):
+                self.assertEqual(item['properties']['id'], ind)
+                self.assertEqual(
+                    item['geometry']['coordinates'],
+                    [(ind, 0.12), (ind + 1, 0.12)])
+
+    def test_reproject_then_simplify(self):
+        shapefile.copy_layer(
+            self.shapefile, self.outfile, reproject=4326,
+            simplify_tolerance=0.0001)
+        with fiona.open(self.outfile) as collection:
+            self.assertEqual(collection.crs.to_epsg(), 4326)
+            self.assertEqual(len(collection[0]['geometry']['coordinates']), 2)
+
+
+def create_points(name):
+    """
+    4x4 grid of points written row by row
+    """
+    schema = {'geometry': 'Point', 'properties': {'id': 'int'}}
+    args = name, 'w', 'ESRI Shapefile', schema
+    with fiona.open(*args, crs='epsg:3310') as out:
+        for ind in range(0, 16):
+            out.write({
+                'geometry': {
+                    'type': 'Point', 'coordinates': (ind % 4, ind // 4)},
+                'properties': {'id': ind}})
+
+
+# ids of the grid points along the curves
+HILBERT = [0, 1, 5, 4, 8, 12, 13, 9, 10, 14, 15, 11, 7, 6, 2, 3]
+ZORDER = [0, 1, 4, 5, 2, 3, 6, 7, 8, 9, 12, 13, 10, 11, 14, 15]
+
+
+class TestCurves(TestCase):
+
+    def setUp(self):
+        self.points = shapely.points(
+            [ind % 4 for ind in range(16)], [ind // 4 for ind in range(16)])
+
+    def test_hilbert(self):
+        self.assertEqual(
+            geometry.spatial_order(self.points, bits=2).tolist(), HILBERT)
+
+    def test_z_order(self):
+        self.assertEqual(
+            geometry.spatial_order(self.points, 'z', bits=2).tolist(), ZORDER)
+
+    def test_unknown_curve(self):
+        with self.assertRaises(ValueError):
+            geometry.spatial_order(self.points, 'peano')
+
+
+class TestSpatialSort(DirectoryTestCase):
+
+    def moreSetUp(self):
+        self.shapefile = os.path.join(TEST_RES_DIR, 'points.shp')
+        self.outfile = os.path.join(TEST_RES_DIR, 'out.shp')
+        create_points(self.shapefile)
+
+    def ids(self):
+        with fiona.open(self.outfile) as collection:
+            return [item['properties']['id'] for item in collection]
+
+    def test_copy_layer(self):
+        shapefile.copy_layer(
+            self.shapefile, self.outfile, spatial_sort='hilbert',
+            spatial_index=True)
+        self.assertEqual(self.ids(), HILBERT)
+        self.assertTrue(os.path.isfile(self.outfile.replace('.shp', '.qix')))
+
+    def test_copy_shp(self):
+        shapefile.copy_shp(
+            self.shapefile, self.outfile, spatial_sort='z',
+            spatial_index=True)
+        self.assertEqual(self.ids(), ZORDER)
+        self.assertTrue(os.path.isfile(self.outfile.replace('.shp', '.qix')))
+
+    def test_sort_and_spatial_sort(self):
+        with self.assertRaises(ValueError):
+            shapefile.copy_shp(
+                self.shapefile, self.outfile, sort=['id'],
+                spatial_sort='z')
+
+
+class TestToMulti(TestCase):
+
+    def test_to_multi(self):
+        res = geometry.to_multi([
+            shapely.Point(0, 0), shapely.MultiPoint([(1, 1)]), None,
+            shapely.box(0, 0, 1, 1)])
+        self.assertEqual(
+            shapely.get_type_id(res).tolist(), [4, 4, -1, 6])
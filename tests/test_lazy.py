@@ -0,0 +1,45 @@
+# pylint:disable=C0114,C0115,C0116,E0401
+# standard library
+import subprocess
+import sys
+from unittest import TestCase
+from unittest.mock import patch
+# project
+import falksgeo
+from falksgeo.lazy import lazy_import, LazyModule
+
+HEAVY = [
+    'arcgis', 'ee', 'fiona', 'geopandas', 'numpy', 'pandas', 'pyarrow',
+    'pyogrio', 'pyproj', 'rasterio', 'requests', 'shapely', 'tqdm']
+
+
+def loaded_modules(statement):
+    code = '{}; import sys; print(" ".join(sys.modules))'.format(statement)
+    res = subprocess.run(
+        [sys.executable, '-c', code], capture_output=True, text=True,
+        check=True)
+    return set(res.stdout.split())
+
+
+class TestLazyImport(TestCase):
+
+    def test_lazy_module(self):
+        with patch.dict(sys.modules):
+            sys.modules.pop('colorsys', None)
+            module = lazy_import('colorsys')
+            self.assertIsInstance(module, LazyModule)
+            self.assertNotIn('colorsys', sys.modules)
+            self.assertEqual(module.rgb_to_hsv(0, 0, 0), (0, 0, 0))
+
+    def test_loaded_module(self):
+        self.assertIs(lazy_import('sys'), sys)
+
+    def test_submodules(self):
+        self.assertIs(falksgeo.files, sys.modules['falksgeo.files'])
+        with self.assertRaises(AttributeError):
+            falksgeo.missing  # pylint:disable=W0104
+
+    def test_no_heavy_imports(self):
+        for name in ['shapefile', 'earthengine', 'arcgis', 'bootstrap']:
+            loaded = loaded_modules('import falksgeo.{}'.format(name))
+            self.assertEqual(loaded & set(HEAVY), set(), name)
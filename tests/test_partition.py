@@ -0,0 +1,105 @@
+# pylint:disable=C0114,C0115,C0116,E0401
+# standard library
+import os
+from concurrent.futures import ThreadPoolExecutor
+from unittest import TestCase
+# third party
+import geopandas
+import numpy as np
+import shapely
+# project
+from falksgeo import partition, pipeline
+from falksgeo.formats import read_dataframe
+from .base import DirectoryTestCase, TEST_RES_DIR
+
+
+def create_polygons(filename, count=200, seed=0):
+    # boxes of up to 20 units over 100 x 100, many straddle cells
+    rng = np.random.default_rng(seed)
+    xs, ys = rng.uniform(0, 100, count), rng.uniform(0, 100, count)
+    sizes = rng.uniform(1, 20, count)
+    df = geopandas.GeoDataFrame(
+        {'comid': np.arange(count), 'number': np.arange(count) % 4},
+        geometry=shapely.box(xs, ys, xs + sizes, ys + sizes), crs='epsg:3310')
+    df.to_file(filename)
+    return df
+
+
+class TestPartitions(TestCase):
+
+    def test_grid(self):
+        cells = partition.grid_partitions((0, 0, 10, 20), (2, 5))
+        self.assertEqual(len(cells), 10)
+        self.assertEqual(cells[0].bounds, (0, 0, 2, 10))
+        self.assertEqual(cells[-1].bounds, (8, 10, 10, 20))
+        self.assertEqual(len(partition.grid_partitions((0, 0, 1, 1), 7)), 9)
+
+    def test_owned_once(self):
+        cells = partition.grid_partitions((0, 0, 4, 4), (2, 2))
+        geoms = np.array([
+            shapely.box(1, 1, 3, 3), shapely.Point(2, 2), shapely.Point(3, 1),
+            shapely.LineString([(0, 3), (4, 3)])])
+        tree = shapely.STRtree(cells)
+        masks = [
+            partition.owned(geoms, cell, [
+                cells[other] for other in tree.query(cell) if other < ind])
+            for ind, cell in enumerate(cells)]
+        np.testing.assert_array_equal(np.sum(masks, axis=0), [1, 1, 1, 1])
+        # the point on the shared corner goes to the first cell
+        self.assertTrue(masks[0][1])
+
+
+class TestRunPartitioned(DirectoryTestCase):
+
+    def moreSetUp(self):
+        self.input = os.path.join(TEST_RES_DIR, 'polygons.shp')
+        self.df = create_polygons(self.input)
+
+    def test_grid(self):
+        output = os.path.join(TEST_RES_DIR, 'out.shp')
+        count = partition.run_partitioned(
+            self.input, output, partitions=[3, 3], workers=2,
+            stages=[{'filter': 'number < 2'}])
+        df = read_dataframe(output)
+        expected = self.df[self.df['number'] < 2]
+        self.assertEqual(count, len(expected))
+        self.assertEqual(sorted(df['comid']), sorted(expected['comid']))
+        self.assertFalse([
+            item for item in os.listdir(TEST_RES_DIR)
+            if item.startswith('partitions_')])
+
+    def test_where_outside_columns(self):
+        output = os.path.join(TEST_RES_DIR, 'out.shp')
+        count = partition.run_partitioned(
+            self.input, output, partitions=4, workers=2, columns=['comid'],
+            where='number < 2')
+        df = read_dataframe(output)
+        expected = self.df[self.df['number'] < 2]
+        self.assertEqual(count, len(expected))
+        self.assertEqual(list(df.columns), ['comid', 'geometry'])
+        self.assertEqual(sorted(df['comid']), sorted(expected['comid']))
+
+    def test_layer_partitions(self):
+        halves = os.path.join(TEST_RES_DIR, 'halves.shp')
+        geopandas.GeoDataFrame(
+            geometry=[shapely.box(-10, -10, 50, 130),
+                      shapely.box(50, -10, 130, 130)],
+            crs='epsg:3310').to_crs('epsg:4326').to_file(halves)
+        output = os.path.join(TEST_RES_DIR, 'out.gpkg')
+        with ThreadPoolExecutor(2) as executor:
+            count = partition.run_partitioned(
+                [self.input], output, partitions=halves, executor=executor)
+        df = read_dataframe(output)
+        self.assertEqual(count, len(self.df))
+        self.assertEqual(sorted(df['comid']), list(self.df['comid']))
+
+    def test_pipeline(self):
+        spec = {
+            'input': self.input,
+            'output': os.path.join(TEST_RES_DIR, 'out', 'parts.shp'),
+            'partitions': 4, 'workers': 2,
+            'stages': [{'remap': {'fields': ['comid']}}]}
+        res = pipeline.run_pipeline(spec)
+        df = read_dataframe(res[0])
+        self.assertEqual(list(df.columns), ['comid', 'geometry'])
+        self.assertEqual(sorted(df['comid']), list(self.df['comid']))
@@ -0,0 +1,81 @@
+# pylint:disable=C0114,C0115,C0116,E0401
+# standard library
+import json
+import os
+# third party
+import fiona
+# project
+from falksgeo import cli, pipeline
+from falksgeo.formats import read_dataframe
+from .base import DirectoryTestCase, TEST_RES_DIR
+from .test_shapefile import create_shapefile
+
+
+class TestPipeline(DirectoryTestCase):
+
+    def moreSetUp(self):
+        self.inputs = [
+            os.path.join(TEST_RES_DIR, name) for name in ['a.shp', 'b.shp']]
+        for item in self.inputs:
+            create_shapefile(item, rows=8)
+        self.spec = {
+            'input': os.path.join(TEST_RES_DIR, '?.shp'),
+            'output': os.path.join(TEST_RES_DIR, 'out', 'merged.shp'),
+            'where': 'number > 0',
+            'chunk_size': 3,
+            'stages': [
+                {'filter': 'number < 3'},
+                {'remap': {'rename': {'number': 'num'},
+                           'fields': ['num', 'name']}},
+                {'reproject': 4326}]}
+
+    def test_single_output(self):
+        res = pipeline.run_pipeline(self.spec)
+        self.assertEqual(res, [self.spec['output']])
+        with fiona.open(res[0]) as collection:
+            self.assertEqual(collection.crs.to_epsg(), 4326)
+            self.assertEqual(
+                list(collection.schema['properties']), ['num', 'name'])
+            self.assertEqual(
+                sorted(item['properties']['num'] for item in collection),
+                [1, 1, 1, 1, 2, 2, 2, 2])
+
+    def test_output_per_input(self):
+        self.spec['output'] = os.path.join(TEST_RES_DIR, 'out', '{stem}.shp')
+        self.spec['zip'] = True
+        res = pipeline.run_pipeline(self.spec, parallel=2)
+        self.assertEqual(
+            [os.path.basename(item) for item in res], ['a.shp', 'b.shp'])
+        for item in res:
+            self.assertTrue(os.path.isfile(item.replace('.shp', '.zip')))
+            with fiona.open(item) as collection:
+                self.assertEqual(len(collection), 4)
+
+    def test_where_outside_columns(self):
+        self.spec.update({'columns': ['name'], 'where': 'number > 2'})
+        del self.spec['stages']
+        res = pipeline.run_pipeline(self.spec)
+        df = read_dataframe(res[0])
+        expected = sum(
+            (read_dataframe(item)['number'] > 2).sum()
+            for item in self.inputs)
+        self.assertEqual(list(df.columns), ['name', 'geometry'])
+        self.assertEqual(len(df), expected)
+
+    def test_no_features(self):
+        self.spec.update({'where': 'number > 100', 'zip': True})
+        res = pipeline.run_pipeline(self.spec)
+        self.assertFalse(os.path.exists(res[0]))
+        self.assertFalse(os.path.exists(res[0].replace('.shp', '.zip')))
+
+    def test_unknown_stage(self):
+        self.spec['stages'] = [{'buffer': 10}]
+        with self.assertRaises(ValueError):
+            pipeline.run_pipeline(self.spec)
+
+    def test_cli(self):
+        spec_file = os.path.join(TEST_RES_DIR, 'spec.json')
+        with open(spec_file, 'w') as handle:
+            json.dump([self.spec], handle)
+        self.assertEqual(cli.main([spec_file]), 0)
+        self.assertTrue(os.path.isfile(self.spec['output']))
@@ -0,0 +1,209 @@
+# pylint:disable=C0114,C0115,C0116,E0401
+# standard library
+import os
+# third party
+import geopandas
+import numpy as np
+import rasterio
+import shapely
+from rasterio.features import geometry_mask
+from rasterio.transform import from_origin
+# project
+from falksgeo import earthengine, raster
+from falksgeo.formats import read_dataframe
+from .base import DirectoryTestCase, TEST_RES_DIR
+
+
+def create_raster(filename, data, nodata=None, blocksize=16):
+    profile = {
+        'driver': 'GTiff', 'width': data.shape[1], 'height': data.shape[0],
+        'count': 1, 'dtype': data.dtype, 'crs': 'epsg:3310',
+        'transform': from_origin(0, data.shape[0], 1, 1), 'nodata': nodata,
+        'tiled': True, 'blockxsize': blocksize, 'blockysize': blocksize}
+    with rasterio.open(filename, 'w', **profile) as dst:
+        dst.write(data, 1)
+
+
+def create_zones(filename, boxes, crs='epsg:3310'):
+    df = geopandas.GeoDataFrame(
+        {'zone': np.arange(len(boxes)) + 10},
+        geometry=[shapely.box(*item) for item in boxes], crs=crs)
+    df.to_file(filename)
+
+
+class TestBlockStats(DirectoryTestCase):
+
+    def test_block_stats(self):
+        labels = np.array([0, 1, 1, 0, 2])
+        values = np.array([1., 2., 4., 3., 10.])
+        stats = raster.block_stats(labels, values, 4, bins=[0, 5, 10])
+        np.testing.assert_array_equal(stats['count'], [2, 2, 1, 0])
+        np.testing.assert_array_equal(stats['sum'], [4, 6, 10, 0])
+        np.testing.assert_array_equal(stats['min'], [1, 2, 10, np.inf])
+        np.testing.assert_array_equal(stats['max'], [3, 4, 10, -np.inf])
+        np.testing.assert_array_equal(
+            stats['histogram'], [[2, 0], [2, 0], [0, 1], [0, 0]])
+
+    def test_block_windows(self):
+        filename = os.path.join(TEST_RES_DIR, 'blocks.tif')
+        create_raster(filename, np.zeros((40, 70), dtype='uint8'))
+        with rasterio.open(filename) as src:
+            windows = raster.block_windows(src, size=32)
+        self.assertEqual(len(windows), 6)
+        self.assertEqual(
+            (windows[-1].col_off, windows[-1].row_off,
+             windows[-1].width, windows[-1].height), (64, 32, 6, 8))
+
+
+class TestZonalStats(DirectoryTestCase):
+
+    def moreSetUp(self):
+        self.raster = os.path.join(TEST_RES_DIR, 'values.tif')
+        self.data = np.arange(64 * 48, dtype='int16').reshape(48, 64)
+        self.data[0, 0] = -1
+        create_raster(self.raster, self.data, nodata=-1)
+        self.zones = os.path.join(TEST_RES_DIR, 'zones.shp')
+        # spans blocks, single block, nodata corner, outside the raster
+        create_zones(self.zones, [
+            (10, 10, 40, 30), (2, 2, 6, 6), (0, 44, 3, 48),
+            (100, 100, 110, 110)])
+
+    def expected(self, col0, row0, col1, row1):
+        # box coordinates to array rows, the origin is at the top
+        height = self.data.shape[0]
+        values = self.data[height - row1:height - row0, col0:col1]
+        return values[values != -1]
+
+    def test_zonal_stats(self):
+        result = raster.zonal_stats(
+            self.raster, self.zones, id_field='zone', bins=[0, 1000, 4000],
+            window_size=16, workers=3)
+        self.assertEqual(list(result['zone']), [10, 11, 12, 13])
+        for ind, box in enumerate([(10, 10, 40, 30), (2, 2, 6, 6),
+                                   (0, 44, 3, 48)]):
+            values = self.expected(*box)
+            row = result.iloc[ind]
+            self.assertEqual(row['count'], len(values))
+            self.assertEqual(row['sum'], values.sum())
+            self.assertAlmostEqual(row['mean'], values.mean())
+            self.assertEqual(row['min'], values.min())
+            self.assertEqual(row['max'], values.max())
+            self.assertEqual(
+                [row['hist_0'], row['hist_1']],
+                list(np.histogram(values, [0, 1000, 4000])[0]))
+        self.assertEqual(result['count'].iloc[3], 0)
+        self.assertTrue(np.isnan(result['mean'].iloc[3]))
+
+    def test_overlapping_zones(self):
+        rng = np.random.default_rng(1)
+        corners = rng.uniform(0, 50, (30, 2))
+        sizes = rng.uniform(2, 25, (30, 1))
+        boxes = np.hstack([corners, corners + sizes])
+        zones = os.path.join(TEST_RES_DIR, 'overlapping.shp')
+        create_zones(zones, boxes)
+        result = raster.zonal_stats(self.raster, zones, window_size=16)
+        with rasterio.open(self.raster) as src:
+            data = src.read(1, masked=True)
+            for ind, box in enumerate(boxes):
+                inside = geometry_mask(
+                    [shapely.box(*box)], data.shape, src.transform,
+                    invert=True) & ~data.mask
+                self.assertEqual(result['count'].iloc[ind], inside.sum())
+                self.assertEqual(
+                    result['sum'].iloc[ind], data.data[inside].sum())
+
+    def test_overlap_layers(self):
+        geoms = np.array([
+            shapely.box(0, 0, 2, 2), shapely.box(1, 1, 3, 3),
+            shapely.box(2, 0, 4, 1), shapely.box(0, 0, 3, 3)])
+        np.testing.assert_array_equal(
+            raster.overlap_layers(geoms), [0, 1, 0, 2])
+        np.testing.assert_array_equal(
+            raster.overlap_layers(geoms, all_touched=True), [0, 1, 2, 3])
+        grid = np.array([shapely.box(x, y, x + 1, y + 1)
+                         for x in range(3) for y in range(3)])
+        self.assertFalse(raster.overlap_layers(grid).any())
+
+    def test_reprojected_zones(self):
+        zones = os.path.join(TEST_RES_DIR, 'zones_4326.shp')
+        df = read_dataframe(self.zones)
+        df.to_crs('epsg:4326').to_file(zones)
+        expected = raster.zonal_stats(self.raster, self.zones)
+        result = raster.zonal_stats(self.raster, zones)
+        self.assertEqual(list(result['count']), list(expected['count']))
+
+    def test_outfile(self):
+        outfile = os.path.join(TEST_RES_DIR, 'stats.shp')
+        raster.zonal_stats(self.raster, self.zones, outfile=outfile)
+        df = read_dataframe(outfile)
+        self.assertEqual(len(df), 4)
+        self.assertIn('mean', df.columns)
+        self.assertIn('zone', df.columns)
+
+
+def create_points(filename, xs, ys, crs='epsg:3310'):
+    df = geopandas.GeoDataFrame(
+        {'site': np.arange(len(xs))}, geometry=shapely.points(xs, ys),
+        crs=crs)
+    df.to_file(filename)
+
+
+class TestSamplePoints(DirectoryTestCase):
+
+    def moreSetUp(self):
+        self.raster = os.path.join(TEST_RES_DIR, 'values.tif')
+        self.data = np.arange(64 * 48, dtype='int16').reshape(48, 64)
+        self.data[47, 0] = -1
+        create_raster(self.raster, self.data, nodata=-1)
+
+    def test_sample_raster(self):
+        rng = np.random.default_rng(0)
+        xs, ys = rng.uniform(0, 64, 500), rng.uniform(0, 48, 500)
+        values = raster.sample_raster(self.raster, xs, ys, workers=2)
+        rows, cols = (47 - np.floor(ys)).astype(int), np.floor(xs).astype(int)
+        expected = self.data[rows, cols].astype(float)
+        expected[expected == -1] = np.nan
+        np.testing.assert_array_equal(values, expected)
+
+    def test_outside_and_nodata(self):
+        values = raster.sample_raster(
+            self.raster, [-1, 0.5, 70, 1.5], [1, 0.5, 1, 47.5])
+        np.testing.assert_array_equal(values, [np.nan, np.nan, np.nan, 1])
+
+    def test_sample_points(self):
+        points = os.path.join(TEST_RES_DIR, 'points.shp')
+        create_points(points, [0.5, 10.5, 63.5], [47.5, 20.5, 0.5])
+        outfile = os.path.join(TEST_RES_DIR, 'sampled.shp')
+        values = raster.sample_points(
+            points, self.raster, outfile=outfile, field='elev')
+        expected = [self.data[0, 0], self.data[27, 10], self.data[47, 63]]
+        np.testing.assert_array_equal(values, expected)
+        df = read_dataframe(outfile)
+        self.assertEqual(list(df['elev']), expected)
+        self.assertEqual(list(df['site']), [0, 1, 2])
+
+    def test_tile_map(self):
+        chunks = earthengine.chunks_from_region(
+            [[0, 0], [0, 2], [2, 2], [2, 0]], step=1)
+        directory = os.path.join(TEST_RES_DIR, 'tiles')
+        tile_map = os.path.join(directory, 'downloaded_tiles_1.shp')
+        os.makedirs(directory)
+        earthengine.chunks_to_shapefile(chunks, tile_map)
+        for ind, chunk in enumerate(chunks):
+            filename = earthengine.generate_path(directory, chunk, 1)
+            profile = {
+                'driver': 'GTiff', 'width': 4, 'height': 4, 'count': 1,
+                'dtype': 'float32', 'crs': 'epsg:4326',
+                'transform': from_origin(chunk[0][0], chunk[2][1], .25, .25)}
+            with rasterio.open(filename, 'w', **profile) as dst:
+                dst.write(np.full((1, 4, 4), ind, dtype='float32'))
+        points = os.path.join(TEST_RES_DIR, 'points.shp')
+        xs, ys = [0.5, 1.5, 0.5, 1.5, 5], [0.5, 0.5, 1.5, 1.5, 5]
+        create_points(points, xs, ys, crs='epsg:4326')
+        values = raster.sample_points(points, tile_map)
+        expected = [
+            next(ind for ind, chunk in enumerate(chunks)
+                 if chunk[0][0] < x < chunk[2][0]
+                 and chunk[0][1] < y < chunk[2][1])
+            for x, y in zip(xs[:4], ys[:4])] + [np.nan]
+        np.testing.assert_array_equal(values, expected)
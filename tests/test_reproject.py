@@ -0,0 +1,60 @@
+# pylint:disable=C0114,C0115,C0116,E0401
+# standard library
+import os
+from unittest import TestCase
+# third party
+import fiona
+from pyproj import CRS
+import shapely
+# project
+from falksgeo import reproject, shapefile
+from .base import DirectoryTestCase, TEST_RES_DIR
+from .test_shapefile import create_shapefile
+
+
+class TestTransformer(TestCase):
+
+    def test_to_crs(self):
+        for crs in [
+            3310, 'epsg:3310', 'EPSG:3310', {'init': 'epsg:3310'},
+            CRS.from_epsg(3310), fiona.crs.CRS.from_epsg(3310)
+        ]:
+            self.assertEqual(reproject.to_crs(crs).to_epsg(), 3310)
+
+    def test_cache(self):
+        self.assertIs(
+            reproject.get_transformer(3310, 'epsg:4326'),
+            reproject.get_transformer({'init': 'epsg:3310'}, 4326))
+
+    def test_transform_geometries(self):
+        geoms = shapely.points([0, 1], [0, 1])
+        res = reproject.transform_geometries(
+            list(geoms) + [None], 3310, 4326)
+        self.assertAlmostEqual(res[0].x, -120, 4)
+        self.assertAlmostEqual(res[0].y, 38.01636, 4)
+        self.assertIsNone(res[2])
+
+    def test_transform_geom(self):
+        res = reproject.transform_geom(
+            {'type': 'LineString', 'coordinates': [(0, 0), (1, 1)]},
+            'epsg:3310', 'epsg:4326')
+        self.assertEqual(res['type'], 'LineString')
+        self.assertAlmostEqual(res['coordinates'][0][0], -120, 4)
+
+
+class TestCopyLayerReproject(DirectoryTestCase):
+
+    def moreSetUp(self):
+        self.shapefile = os.path.join(TEST_RES_DIR, 'test.shp')
+        self.outfile = os.path.join(TEST_RES_DIR, 'out.shp')
+        create_shapefile(name=self.shapefile)
+
+    def test_reproject(self):
+        shapefile.copy_layer(self.shapefile, self.outfile, reproject=4326)
+        with fiona.open(self.outfile) as collection:
+            self.assertEqual(collection.crs.to_epsg(), 4326)
+            self.assertEqual(len(collection), 5)
+            self.assertAlmostEqual(
+                collection[0]['geometry']['coordinates'][0], -119.99999, 4)
+            self.assertAlmostEqual(
+                collection[0]['geometry']['coordinates'][1], 38.01636, 4)
@@ -0,0 +1,105 @@
+# pylint:disable=C0114,C0115,C0116,E0401
+# standard library
+import os
+from unittest import TestCase
+# third party
+import fiona
+# project
+from falksgeo import schema, shapefile
+from .base import DirectoryTestCase, TEST_RES_DIR
+
+
+def create_layer(name, properties, rows, crs='epsg:4326', geometry='Point'):
+    args = name, 'w', 'ESRI Shapefile'
+    kwargs = {'crs': crs, 'schema': {
+        'geometry': geometry, 'properties': properties}}
+    with fiona.open(*args, **kwargs) as out:
+        for ind, row in enumerate(rows):
+            coords = (ind, ind) if geometry == 'Point' else [(ind, ind)]
+            out.write({
+                'geometry': {'type': geometry, 'coordinates': coords},
+                'properties': row})
+
+
+class TestWidening(TestCase):
+
+    def test_types(self):
+        self.assertEqual(schema.widen_type('int:9', 'int:18'), 'int:18')
+        self.assertEqual(schema.widen_type('int32', 'float:24.15'), 'float:24.15')
+        self.assertEqual(schema.widen_type('str:20', 'str:80'), 'str:80')
+        self.assertEqual(schema.widen_type('float', 'str:20'), 'str:20')
+        self.assertEqual(schema.widen_type('date', 'datetime'), 'datetime')
+        self.assertEqual(schema.widen_type('date', 'int'), 'str')
+
+    def test_geometry(self):
+        self.assertEqual(
+            schema.widen_geometry('Polygon', 'MultiPolygon'), 'MultiPolygon')
+        with self.assertRaises(ValueError):
+            schema.widen_geometry('Point', 'LineString')
+
+    def test_unify(self):
+        res = schema.unify_schemas([
+            {'geometry': 'Point', 'properties': {'a': 'int', 'b': 'str:5'}},
+            {'geometry': 'Point', 'properties': {'c': 'float', 'a': 'float'}}
+        ])
+        self.assertEqual(
+            res['properties'], {'a': 'float', 'b': 'str:5', 'c': 'float'})
+
+
+class TestMergeLayers(DirectoryTestCase):
+
+    def moreSetUp(self):
+        self.first = os.path.join(TEST_RES_DIR, 'first.shp')
+        self.second = os.path.join(TEST_RES_DIR, 'second.shp')
+        self.outfile = os.path.join(TEST_RES_DIR, 'merged.shp')
+        create_layer(
+            self.first, {'comid': 'int', 'flow': 'int', 'name': 'str:5'},
+            [{'comid': 1, 'flow': 2, 'name': 'a'}])
+        create_layer(
+            self.second, {'comid': 'int', 'flow': 'float', 'note': 'str'},
+            [{'comid': 2, 'flow': 2.5, 'note': 'x' * 30}], crs='epsg:3310',
+            geometry='MultiPoint')
+
+    def test_merge(self):
+        shapefile.merge_layers([self.first, self.second], self.outfile)
+        with fiona.open(self.outfile) as collection:
+            self.assertEqual(collection.crs.to_epsg(), 4326)
+            self.assertEqual(
+                list(collection.schema['properties']),
+                ['comid', 'flow', 'name', 'note'])
+            self.assertTrue(
+                collection.schema['properties']['flow'].startswith('float'))
+            rows = [dict(item['properties']) for item in collection]
+        self.assertEqual(rows, [
+            {'comid': 1, 'flow': 2.0, 'name': 'a', 'note': None},
+            {'comid': 2, 'flow': 2.5, 'name': None, 'note': 'x' * 30}])
+
+    def test_remap(self):
+        remap = shapefile.create_remap(['comid', 'flow'])
+        shapefile.merge_layers(
+            [self.first, self.second], self.outfile, remap=remap)
+        with fiona.open(self.outfile) as collection:
+            self.assertEqual(
+                list(collection.schema['properties']), ['comid', 'flow'])
+            self.assertEqual(len(collection), 2)
+
+    def test_dates(self):
+        days = os.path.join(TEST_RES_DIR, 'days.shp')
+        other = os.path.join(TEST_RES_DIR, 'other.shp')
+        properties = {'comid': 'int', 'd': 'date'}
+        create_layer(days, properties, [{'comid': 1, 'd': '2020-01-05'}])
+        create_layer(other, properties, [{'comid': 2, 'd': None}])
+        shapefile.merge_layers([days, other], self.outfile)
+        with fiona.open(self.outfile) as collection:
+            self.assertEqual(collection.schema['properties']['d'], 'date')
+            self.assertEqual(
+                [item['properties']['d'] for item in collection],
+                ['2020-01-05', None])
+
+    def test_incompatible(self):
+        lines = os.path.join(TEST_RES_DIR, 'lines.shp')
+        create_layer(lines, {'comid': 'int'}, [{'comid': 3}],
+                     geometry='LineString')
+        with self.assertRaises(ValueError):
+            shapefile.merge_layers([self.first, lines], self.outfile)
+        self.assertFalse(os.path.exists(self.outfile))
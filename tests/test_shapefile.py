@@ -6,9 +6,16 @@ import string
 from zipfile import ZipFile
 # third party
 import fiona
+import geopandas
+import numpy as np
+import pandas as pd
+import pyogrio
 from pyproj import CRS
+import shapely
 # project
 from falksgeo import shapefile
+from falksgeo.formats import read_dataframe
+from falksgeo.transformations import calculate_display_value
 from .base import DirectoryTestCase, TEST_RES_DIR
 
 
@@ -109,6 +116,15 @@ class TestCopyLayer(DirectoryTestCase):
         with fiona.open(self.outfile) as res:
             self.assertEqual(len(res), 2)
 
+    def test_parquet_input(self):
+        parquet = os.path.join(TEST_RES_DIR, 'test.parquet')
+        read_dataframe(self.shapefile).to_parquet(parquet)
+        with self.assertRaisesRegex(ValueError, 'GeoParquet'):
+            shapefile.copy_layer(parquet, self.outfile)
+        with self.assertRaisesRegex(ValueError, 'GeoParquet'):
+            shapefile.create_variable(parquet, self.outfile, [1])
+        self.assertFalse(os.path.exists(self.outfile))
+
 
 class TestCopyShp(DirectoryTestCase):
 
@@ -179,6 +195,57 @@ class TestCopyShp(DirectoryTestCase):
             for item in collection:
                 self.assertIn(item['properties']['number'], [1, 3])
 
+    def test_where(self):
+        shapefile.copy_shp(
+            self.shapefile, self.outfile, where='number = 1 OR number = 3')
+        with fiona.open(self.outfile) as collection:
+            self.assertEqual(len(collection), 2)
+            for item in collection:
+                self.assertIn(item['properties']['number'], [1, 3])
+
+    def test_where_with_fields(self):
+        shapefile.copy_shp(
+            self.shapefile, self.outfile, fields=['name'],
+            where='number = 1 OR number = 3')
+        with fiona.open(self.outfile) as collection:
+            self.assertEqual(list(collection.schema['properties']), ['name'])
+            self.assertEqual(
+                sorted(item['properties']['name'] for item in collection),
+                ['one', 'three'])
+
+    def test_where_with_fields_sorted(self):
+        shapefile.copy_shp(
+            self.shapefile, self.outfile, fields=['name'], sort=['name'],
+            where='number < 2', sort_chunk_size=2)
+        with fiona.open(self.outfile) as collection:
+            self.assertEqual(
+                [item['properties']['name'] for item in collection],
+                ['one', 'zero', 'zero'])
+
+    def test_vectorized_remap(self):
+        def remap(df):
+            df['double'] = df['number'] * 2
+            return df
+        shapefile.copy_shp(
+            self.shapefile, self.outfile, remap={'two': 'zwei'},
+            vectorized_remap=remap, fields=['zwei', 'double'])
+        with fiona.open(self.outfile) as collection:
+            self.assertEqual(
+                list(collection.schema['properties']), ['zwei', 'double'])
+            for item in collection:
+                self.assertEqual(item['properties']['double'] % 2, 0)
+
+    def test_projection_with_remap(self):
+        shapefile.copy_shp(
+            self.shapefile, self.outfile, remap={'two': 'zwei'},
+            fields=['zwei', 'name'], sort=['number'])
+        with fiona.open(self.outfile) as collection:
+            self.assertEqual(
+                list(collection.schema['properties']), ['zwei', 'name'])
+            self.assertEqual(
+                [item['properties']['name'] for item in collection],
+                ['zero', 'zero', 'one', 'two', 'three'])
+
     def test_crs(self):
         shapefile.copy_shp(self.shapefile, self.outfile)
         with fiona.open(self.outfile) as collection:
@@ -247,6 +314,68 @@ class TestAnnotateFile(DirectoryTestCase):
                 self.assertEqual(assertions[props['number']], props['value'])
 
 
+def create_frame():
+    """
+    Create a GeoDataFrame with types Shapefiles do not support
+    """
+    return geopandas.GeoDataFrame({
+        'when': pd.to_datetime(['2020-01-01 10:00', None]),
+        'big': np.array([1, 2 ** 40], dtype='int64'),
+        'small': np.array([1, 2], dtype='int64'),
+        'text': ['x' * 300, None],
+        'blob': [b'bytes', None]
+    }, geometry=shapely.points([0, 1], [0, 1]), crs=4326)
+
+
+def create_gdb(name, layers):
+    df = create_frame().drop(columns=['big', 'small', 'blob'])
+    for index, layer in enumerate(layers):
+        pyogrio.write_dataframe(
+            df, name, layer=layer, driver='OpenFileGDB', append=bool(index))
+
+
+class TestGDB(DirectoryTestCase):
+
+    def moreSetUp(self):
+        self.gdb = os.path.join(TEST_RES_DIR, 'test.gdb')
+        create_gdb(self.gdb, ['one', 'two', 'three'])
+
+    def test_list_layers(self):
+        self.assertEqual(
+            shapefile.list_layers(self.gdb), ['one', 'two', 'three'])
+
+    def test_shapefile_types(self):
+        df = shapefile.shapefile_types(create_frame())
+        self.assertEqual(str(df['small'].dtype), 'int32')
+        self.assertEqual(str(df['big'].dtype), 'int64')
+        self.assertEqual(df['when'].tolist()[0], '2020-01-01 10:00:00')
+        self.assertTrue(pd.isna(df['when'].tolist()[1]))
+        self.assertEqual(len(df['text'][0]), 254)
+        self.assertNotIn('blob', df)
+
+    def test_gdb_to_shp(self):
+        out = os.path.join(TEST_RES_DIR, 'out', 'one.shp')
+        shapefile.gdb_to_shp(self.gdb, out, layer='one')
+        with fiona.open(out) as collection:
+            props = collection.schema['properties']
+            self.assertTrue(props['when'].startswith('str'))
+            self.assertEqual(
+                collection[0]['properties']['when'], '2020-01-01 10:00:00')
+            self.assertEqual(len(collection[0]['properties']['text']), 254)
+
+    def test_extract_gdb(self):
+        out = os.path.join(TEST_RES_DIR, 'out')
+        res = shapefile.extract_gdb(self.gdb, out, processes=2)
+        self.assertEqual(
+            res, [os.path.join(out, item + '.shp')
+                  for item in ['one', 'two', 'three']])
+        res = shapefile.extract_gdb(
+            self.gdb, out, layers=['two'], extension='.fgb')
+        with fiona.open(res[0]) as collection:
+            self.assertEqual(collection.driver, 'FlatGeobuf')
+            self.assertEqual(len(collection), 2)
+
+
 class TestCSVToShapefile(DirectoryTestCase):
 
     def moreSetUp(self):
@@ -266,6 +395,68 @@ class TestCSVToShapefile(DirectoryTestCase):
             self.assertEqual(collection.driver, 'ESRI Shapefile')
             self.assertEqual(collection.crs, {'init': 'epsg:4326'})
 
+    def test_typed_chunks(self):
+        with open(self.csv_fn, 'w', encoding='utf-8') as csv:
+            csv.write('name,x,y,count,flow,day\n')
+            for ind in range(0, 25):
+                csv.write(
+                    f'site {ind},-120.{ind},38,{ind},{ind / 2},'
+                    f'2020-01-{ind + 1:02}\n')
+        shapefile.csv_to_shp(
+            self.csv_fn, self.shp_fn, chunksize=10, spatial_index=True)
+        self.assertTrue(os.path.isfile(self.shp_fn.replace('.shp', '.qix')))
+        with fiona.open(self.shp_fn) as collection:
+            self.assertEqual(len(collection), 25)
+            props = collection.schema['properties']
+            self.assertEqual(props['name'], 'str:80')
+            self.assertTrue(props['count'].startswith('int'))
+            self.assertTrue(props['flow'].startswith('float'))
+            self.assertEqual(props['day'], 'date')
+            item = collection[24]
+            self.assertEqual(item['properties']['count'], 24)
+            self.assertEqual(item['properties']['day'], '2020-01-25')
+            self.assertEqual(
+                tuple(item['geometry']['coordinates']), (-120.24, 38))
+
+    def test_widened_chunks(self):
+        with open(self.csv_fn, 'w', encoding='utf-8') as csv:
+            csv.write('x,y,count,val,day\n-125,25,1,5,2020-01-05\n')
+            csv.write('-125,25,a,2.5,closed\n-125,25,,,\n')
+        shapefile.csv_to_shp(self.csv_fn, self.shp_fn, chunksize=1)
+        with fiona.open(self.shp_fn) as collection:
+            types = {
+                key: value.split(':')[0] for key, value in
+                collection.schema['properties'].items()}
+            self.assertEqual(
+                types, {'count': 'str', 'val': 'float', 'day': 'str'})
+            self.assertEqual(
+                [dict(item['properties']) for item in collection], [
+                    {'count': '1', 'val': 5.0, 'day': '2020-01-05'},
+                    {'count': 'a', 'val': 2.5, 'day': 'closed'},
+                    {'count': None, 'val': None, 'day': None}])
+
+    def test_failure(self):
+        with open(self.csv_fn, 'w', encoding='utf-8') as csv:
+            csv.write('x,y,count\n-125,25,1\nwest,25,2')
+        with self.assertRaises(ValueError):
+            shapefile.csv_to_shp(self.csv_fn, self.shp_fn, chunksize=1)
+        # no partial output
+        self.assertEqual(os.listdir(TEST_RES_DIR), ['test.csv'])
+
+    def test_blank_first_chunk(self):
+        with open(self.csv_fn, 'w', encoding='utf-8') as csv:
+            csv.write('x,y,note\n')
+            for _ in range(0, 5):
+                csv.write('-125,25,\n')
+            csv.write('-125,25,broken weir\n')
+        shapefile.csv_to_shp(self.csv_fn, self.shp_fn, chunksize=2)
+        with fiona.open(self.shp_fn) as collection:
+            self.assertTrue(
+                collection.schema['properties']['note'].startswith('str'))
+            self.assertEqual(
+                [item['properties']['note'] for item in collection],
+                [None] * 5 + ['broken weir'])
+
 
 class TestZipShapefile(DirectoryTestCase):
 
@@ -281,3 +472,84 @@ class TestZipShapefile(DirectoryTestCase):
             for item in ['dbf', 'shp', 'prj', 'shx']:
                 name = '.'.join([os.path.basename(self.shp)[:-4], item])
                 self.assertIn(name, zipf.namelist())
+
+
+class TestRemap(DirectoryTestCase):
+
+    def moreSetUp(self):
+        self.shapefile = os.path.join(TEST_RES_DIR, 'flow.shp')
+        schema = {'geometry': 'Point', 'properties': {
+            'ComID': 'int', 'DS_MAX_FLO': 'str', 'Other': 'str'}}
+        args = self.shapefile, 'w', 'ESRI Shapefile', schema
+        with fiona.open(*args, crs='epsg:4326') as out:
+            for ind, flow in enumerate(['500', '150', '20', 'None', '1']):
+                out.write({
+                    'geometry': {'type': 'Point', 'coordinates': (ind, ind)},
+                    'properties': {
+                        'ComID': ind, 'DS_MAX_FLO': flow, 'Other': 'x'}})
+        self.remap = shapefile.create_remap(
+            ['comid', 'ds_max_flo'], rename={'ds_max_flo': 'flow'},
+            casts={'comid': 'str'},
+            computed={'display': (
+                lambda props: calculate_display_value(
+                    {'ds_max_flo': props['flow']}), 'int')})
+
+    def test_records(self):
+        outfile = os.path.join(TEST_RES_DIR, 'out.shp')
+        shapefile.copy_layer(
+            self.shapefile, outfile, remap_function=self.remap)
+        with fiona.open(outfile) as collection:
+            self.assertEqual(
+                dict(collection.schema['properties']),
+                {'comid': 'str:80', 'flow': 'str:80', 'display': 'int:18'})
+            self.assertEqual(
+                [item['properties']['display'] for item in collection],
+                [1, 2, 3, 4, 4])
+            self.assertEqual(collection[0]['properties']['comid'], '0')
+
+    def test_frame(self):
+        remap = shapefile.create_remap(
+            ['comid', 'ds_max_flo'], casts={'comid': 'float'},
+            computed={'display': (calculate_display_value, 'int')})
+        df = remap.frame(read_dataframe(self.shapefile))
+        self.assertEqual(
+            list(df.columns), ['comid', 'ds_max_flo', 'geometry', 'display'])
+        self.assertEqual(df['display'].tolist(), [1, 2, 3, 4, 4])
+        self.assertEqual(df['comid'].dtype, 'float64')
+
+
+class TestAnnotateSpatial(DirectoryTestCase):
+
+    def moreSetUp(self):
+        self.points = os.path.join(TEST_RES_DIR, 'points.shp')
+        self.hucs = os.path.join(TEST_RES_DIR, 'hucs.shp')
+        self.outfile = os.path.join(TEST_RES_DIR, 'out.shp')
+        pyogrio.write_dataframe(geopandas.GeoDataFrame(
+            {'id': range(6)},
+            geometry=shapely.points([0.5, 1.5, 2.5, 3.5, 4.5, 9], [0.5] * 6),
+            crs='epsg:3310'), self.points)
+        pyogrio.write_dataframe(geopandas.GeoDataFrame(
+            {'huc': [10, 20], 'name': ['a', 'b']},
+            geometry=[shapely.box(0, 0, 2, 1), shapely.box(2, 0, 4, 1)],
+            crs='epsg:3310'), self.hucs)
+
+    def read(self):
+        with fiona.open(self.outfile) as collection:
+            return [
+                (item['properties']['id'], item['properties']['huc'])
+                for item in collection]
+
+    def test_within(self):
+        count = shapefile.annotate_spatial(
+            self.points, self.hucs, self.outfile, predicate='within',
+            fields=['huc'], chunk_size=2, workers=2)
+        self.assertEqual(count, 6)
+        self.assertEqual(self.read(), [
+            (0, 10), (1, 10), (2, 20), (3, 20), (4, None), (5, None)])
+
+    def test_nearest(self):
+        shapefile.annotate_spatial(
+            self.points, self.hucs, self.outfile, predicate='nearest',
+            max_distance=1, chunk_size=4)
+        self.assertEqual(self.read(), [
+            (0, 10), (1, 10), (2, 20), (3, 20), (4, 20), (5, None)])
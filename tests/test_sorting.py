@@ -0,0 +1,72 @@
+# pylint:disable=C0114,C0115,C0116,E0401
+# standard library
+import os
+from unittest import TestCase
+# third party
+import fiona
+import geopandas
+import shapely
+# project
+from falksgeo import shapefile, sorting
+from .base import DirectoryTestCase, TEST_RES_DIR
+from .test_shapefile import create_shapefile
+
+
+class TestExternalSort(TestCase):
+
+    def test_external_sort(self):
+        values = [5, None, 3, 1, 3, 9, None, 0, 7, 3]
+        frames = [
+            geopandas.GeoDataFrame(
+                {'key': values[ind:ind + 3], 'pos': range(ind, ind + 3)},
+                geometry=shapely.points(range(0, 3), range(0, 3)),
+                crs=3310)
+            for ind in range(0, 9, 3)]
+        res = list(sorting.external_sort(frames, ['key'], chunk_size=4))
+        self.assertEqual([len(df) for df in res], [4, 4, 1])
+        self.assertEqual(res[0].crs.to_epsg(), 3310)
+        keys = [
+            None if val != val else val
+            for df in res for val in df['key'].tolist()]
+        self.assertEqual(keys, [0, 1, 3, 3, 5, 7, 9, None, None])
+        # ties keep the input order
+        pos = [val for df in res for val in df['pos'].tolist()]
+        self.assertEqual(pos[2:4], [2, 4])
+
+
+class TestCopyShpExternalSort(DirectoryTestCase):
+
+    def moreSetUp(self):
+        self.shapefile = os.path.join(TEST_RES_DIR, 'test.shp')
+        self.outfile = os.path.join(TEST_RES_DIR, 'out.shp')
+        self.reference = os.path.join(TEST_RES_DIR, 'reference.shp')
+        create_shapefile(name=self.shapefile, rows=50)
+
+    def read(self, filename):
+        with fiona.open(filename) as collection:
+            return [
+                (item['properties']['number'], item['properties']['one'],
+                 tuple(item['geometry']['coordinates']))
+                for item in collection]
+
+    def test_same_as_in_memory(self):
+        kwargs = {
+            'sort': ['number', 'one'], 'fields': ['number', 'one'],
+            'remap': {'two': 'zwei'}}
+        shapefile.copy_shp(self.shapefile, self.reference, **kwargs)
+        shapefile.copy_shp(
+            self.shapefile, self.outfile, sort_chunk_size=7, **kwargs)
+        self.assertEqual(self.read(self.outfile), self.read(self.reference))
+        with fiona.open(self.outfile) as collection:
+            self.assertEqual(
+                list(collection.schema['properties']), ['number', 'one'])
+
+    def test_append(self):
+        shapefile.copy_shp(self.shapefile, self.outfile)
+        shapefile.copy_shp(
+            self.shapefile, self.outfile, append=True, sort=['one'],
+            sort_chunk_size=9)
+        res = self.read(self.outfile)
+        self.assertEqual(len(res), 100)
+        self.assertEqual([item[1] for item in res],
+                         sorted(item[1] for item in res))